@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""serial vs parallel decoding of binary plists, used to pick
+`gplist.parallel.PARALLEL_MIN_SIZE`
+
+    python benchmarks/bench_parallel.py [workers]
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from gplist.parallel import from_file_parallel  # noqa
+from gplist.plist import PlistInfo  # noqa
+
+
+def generate(plist_file, count):
+    data = {}
+    for i in range(count):
+        data["key-%d" % i] = {
+            "id": i,
+            "name": "item-%d" % i,
+            "tags": ["tag-%d" % (i % 7), "extra-%d" % i],
+            "score": i * 0.5,
+        }
+    PlistInfo(data).to_binary_file(plist_file)
+
+
+def timeit(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        cost = time.time() - start
+        if best is None or cost < best:
+            best = cost
+    return best
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count()
+    plist_file = os.path.join(tempfile.mkdtemp(prefix="gplist_"), "bench.plist")
+    print("%10s %12s %10s %10s %8s" % ("entries", "size", "serial", "parallel", "speedup"))
+    try:
+        for count in [1000, 5000, 20000, 50000, 100000, 200000, 500000]:
+            generate(plist_file, count)
+            size = os.path.getsize(plist_file)
+            serial = timeit(lambda: PlistInfo.from_file(plist_file))
+            parallel = timeit(lambda: from_file_parallel(plist_file, workers=workers, min_size=0))
+            print("%10d %12d %10.3f %10.3f %8.2f" % (count, size, serial, parallel, serial / parallel))
+    finally:
+        os.remove(plist_file)
+        os.rmdir(os.path.dirname(plist_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,93 @@
 # -*- coding: utf-8 -*-
 """command line tools
+
+    python -m gplist [--socket PATH] file [options]
+    python -m gplist serve --socket PATH [--cache-size N]
+    python -m gplist extract-data file --out DIR [--path KEY_PATH]
+
+with `--socket`, or the GPLIST_SOCKET environment variable, commands are run
+by the daemon serving that socket, and in process when none accepts the
+connection. Only the standard library is imported before that check
 """
 
-from gplist.mobileprovision import MobileProvision
-import argparse
-import json
 import os
 import sys
 
-from gplist.plist import PlistInfo, PlistEncoder
 
+def pop_socket(argv):
+    """return (socket path, argv without --socket)
+    """
+    socket_path = os.environ.get("GPLIST_SOCKET")
+    rest = []
+    args = iter(argv)
+    for arg in args:
+        if arg == "--socket":
+            socket_path = next(args, None)
+        elif arg.startswith("--socket="):
+            socket_path = arg[len("--socket="):]
+        else:
+            rest.append(arg)
+    return socket_path, rest
 
-def main():
-    parser = argparse.ArgumentParser()
+
+def serve_main(argv):
+    import argparse
+    from gplist.daemon import CACHE_SIZE, serve
+    parser = argparse.ArgumentParser(prog="gplist serve")
+    parser.add_argument("--socket", required=True,
+                        help="unix socket path to listen on")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE,
+                        help="parsed files kept in memory")
+    args = parser.parse_args(argv)
+    serve(args.socket, args.cache_size)
+
+
+def extract_main(argv):
+    import argparse
+    import json
+    from gplist.extract import extract_data
+    parser = argparse.ArgumentParser(prog="gplist extract-data")
     parser.add_argument("file", help="plist or mobile provision file path")
-    parser.add_argument("--cert",
-                        action="store_true",
-                        help="output certificate information of mobile provision file")
-    parser.add_argument("--has-udid",
-                        dest="udid",
-                        help="check whether provision contains the target udid")
-    args = parser.parse_args(sys.argv[1:])
-    file_path = os.path.abspath(args.file)
-    if not os.path.isfile(file_path):
-        print("file=%s is not a valid file" % file_path)
-        sys.exit(1)
+    parser.add_argument("--out", required=True,
+                        help="directory the blobs are written to, one file per blob")
+    parser.add_argument("--path", action="append",
+                        help="slash separated key path of the blobs to write, `*` "
+                             "matches any key or index, can be repeated, defaults "
+                             "to every blob")
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.file):
+        sys.stdout.write("file=%s is not a valid file\n" % args.file)
+        return 1
     try:
-        p = PlistInfo.from_file(file_path)
-    except ValueError:
-        m = MobileProvision.from_file(file_path)
-        if args.cert:
-            cert_info = []
-            for cert in m.certs:
-                cert_info.append({
-                    "serial": cert.serial,
-                    "name": cert.common_name,
-                    "sha1": cert.sha1})
-            json.dump(cert_info, sys.stdout, indent=2, cls=PlistEncoder)
-        elif args.udid:
-            if m.has_udid(args.udid):
-                print("yes")
-            else:
-                print("no")
-                sys.exit(1)
+        results = extract_data(args.file, args.out, args.path)
+    except ValueError as e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+    for path, file_path, size in results:
+        sys.stdout.write(json.dumps({"path": list(path), "file": file_path, "size": size}) + "\n")
+    return 0
+
+
+def main():
+    argv = sys.argv[1:]
+    if argv[:1] == ["serve"]:
+        serve_main(argv[1:])
+        return
+    if argv[:1] == ["extract-data"]:
+        sys.exit(extract_main(argv[1:]))
+    socket_path, argv = pop_socket(argv)
+    if socket_path:
+        from gplist.daemon import DaemonUnavailable, request
+        try:
+            code, stdout, stderr = request(socket_path, argv)
+        except DaemonUnavailable:
+            pass
         else:
-            json.dump(m, sys.stdout, indent=2, cls=PlistEncoder)
-    else:
-        if any([args.cert, args.udid]):
-            print("file=%s is not recognized as mobile provision file" % file_path)
-            sys.exit(1)
-        json.dump(p, sys.stdout, indent=2, cls=PlistEncoder)
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            sys.exit(code)
+    from gplist.cli import run
+    sys.exit(run(argv))
 
 
 if __name__ == "__main__":
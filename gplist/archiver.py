@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""NSKeyedArchiver plist serializing
+"""
+
+from collections import OrderedDict
+import datetime
+
+from gplist.plist import PlistInfo, Data, UID, bytes_type, string_type
+
+
+ARCHIVER_NAME = "NSKeyedArchiver"
+ARCHIVER_VERSION = 100000
+NULL_OBJECT = "$null"
+APPLE_EPOCH = datetime.datetime(2001, 1, 1)
+
+_decoders = {}
+
+
+class ArchivedObject(OrderedDict):
+    """an archived object whose class has no registered decoder, holds its
+    resolved fields
+    """
+
+    def __init__(self, classname, fields=(), classes=None):
+        super(ArchivedObject, self).__init__(fields)
+        self.classname = classname
+        self.classes = classes or [classname, "NSObject"]
+
+    def __repr__(self):
+        return "<ArchivedObject %s %s>" % (self.classname, dict(self))
+
+
+def register_class(classname, decoder):
+    """register a decoder for archived objects of `classname`
+
+    the decoder is called as `decoder(unarchiver, archived)` where `archived`
+    is the raw `$objects` entry, use `unarchiver.decode(uid)` to resolve its
+    fields. Decoders of container classes may instead be generators that yield
+    the empty container first, then fill it, so that cyclic references to it
+    resolve to the same object
+    """
+    _decoders[classname] = decoder
+
+
+def _decode_dict(unarchiver, archived):
+    result = {}
+    yield result
+    keys = archived.get("NS.keys", [])
+    values = archived.get("NS.objects", [])
+    for key, value in zip(keys, values):
+        result[unarchiver.decode(key)] = unarchiver.decode(value)
+
+
+def _decode_array(unarchiver, archived):
+    result = []
+    yield result
+    for value in archived.get("NS.objects", []):
+        result.append(unarchiver.decode(value))
+
+
+def _decode_set(unarchiver, archived):
+    values = [unarchiver.decode(value) for value in archived.get("NS.objects", [])]
+    try:
+        return set(values)
+    except TypeError:
+        return values
+
+
+def _decode_string(unarchiver, archived):
+    return unarchiver.decode(archived["NS.string"])
+
+
+def _decode_data(unarchiver, archived):
+    return unarchiver.decode(archived["NS.data"])
+
+
+def _decode_date(unarchiver, archived):
+    return APPLE_EPOCH + datetime.timedelta(seconds=archived["NS.time"])
+
+
+def _decode_null(unarchiver, archived):
+    return None
+
+
+def _decode_url(unarchiver, archived):
+    relative = unarchiver.decode(archived["NS.relative"])
+    base = unarchiver.decode(archived.get("NS.base", UID(0)))
+    if base:
+        return base.rstrip("/") + "/" + relative.lstrip("/")
+    return relative
+
+
+def _decode_uuid(unarchiver, archived):
+    raw = bytearray(unarchiver.decode(archived["NS.uuidbytes"]).raw)
+    text = "".join(["%02X" % b for b in raw])
+    return "-".join([text[:8], text[8:12], text[12:16], text[16:20], text[20:]])
+
+
+for _classname, _decoder in [
+        ("NSDictionary", _decode_dict), ("NSMutableDictionary", _decode_dict),
+        ("NSArray", _decode_array), ("NSMutableArray", _decode_array),
+        ("NSSet", _decode_set), ("NSMutableSet", _decode_set),
+        ("NSString", _decode_string), ("NSMutableString", _decode_string),
+        ("NSData", _decode_data), ("NSMutableData", _decode_data),
+        ("NSDate", _decode_date), ("NSNull", _decode_null),
+        ("NSURL", _decode_url), ("NSUUID", _decode_uuid)]:
+    register_class(_classname, _decoder)
+
+
+def _as_uid(value):
+    if isinstance(value, UID):
+        return value
+    elif isinstance(value, dict) and len(value) == 1 and "CF$UID" in value:
+        return UID(value["CF$UID"])
+    return None
+
+
+class KeyedUnarchiver(object):
+    """resolve an NSKeyedArchiver plist into native objects
+
+    every `$objects` entry is decoded at most once, so shared and cyclic
+    references resolve to the same python object
+    """
+
+    def __init__(self, plist, decoders=None):
+        if plist.get("$archiver") != ARCHIVER_NAME:
+            raise ValueError("$archiver=%s is not %s" % (plist.get("$archiver"), ARCHIVER_NAME))
+        self._plist = plist
+        self._objects = plist["$objects"]
+        self._top = plist["$top"]
+        self._decoders = dict(_decoders)
+        if decoders:
+            self._decoders.update(decoders)
+        self._decoded = {}
+        self._decoding = set()
+
+    @classmethod
+    def from_binary(cls, data, lazy=True, decoders=None, limits=None):
+        """
+        :param data: binary or xml keyed archive
+        :type  data: bytes
+        :param lazy: decode `$objects` entries from the binary object table only
+            when they are referenced instead of parsing the whole plist first
+        :type  lazy: bool
+        """
+        if not lazy or not data.startswith(b"bplist00"):
+            return cls(PlistInfo(data, limits=limits), decoders=decoders)
+        reader = PlistInfo({}, limits=limits)
+        reader._binary_data = data
+        top_refs = reader._read_container_refs(reader._read_trailer())
+        if top_refs is None or top_refs[0] is None:
+            raise ValueError("top object is not a dict")
+        plist = {}
+        objects = None
+        for key_ref, value_ref in zip(*top_refs):
+            key = reader._read_object(key_ref, 1)
+            if key == "$objects":
+                objects = reader._read_container_refs(value_ref)
+            else:
+                plist[key] = reader._read_object(value_ref, 1)
+        if objects is None or objects[0] is not None:
+            raise ValueError("$objects is not an array")
+        plist["$objects"] = _LazyObjects(reader, objects[1])
+        return cls(plist, decoders=decoders)
+
+    @classmethod
+    def from_file(cls, archive_file, lazy=True, decoders=None, limits=None):
+        with open(archive_file, "rb") as fd:
+            return cls.from_binary(fd.read(), lazy=lazy, decoders=decoders, limits=limits)
+
+    @property
+    def top(self):
+        """the `$top` dict with every value resolved
+        """
+        result = OrderedDict()
+        for key, value in self._top.items():
+            result[key] = self.decode(value)
+        return result
+
+    @property
+    def root(self):
+        return self.decode(self._top["root"])
+
+    def decode(self, value):
+        """resolve a UID reference, other values are returned as they are
+        """
+        uid = _as_uid(value)
+        if uid is None:
+            return value
+        index = int(uid)
+        if index in self._decoded:
+            return self._decoded[index]
+        if index in self._decoding:
+            raise ValueError("cyclic reference to object=%s not supported by its decoder" % index)
+        self._decoding.add(index)
+        try:
+            result = self._decode_object(index, self._objects[index])
+        finally:
+            self._decoding.discard(index)
+        self._decoded[index] = result
+        return result
+
+    def _decode_object(self, index, archived):
+        if archived == NULL_OBJECT:
+            return None
+        elif not isinstance(archived, dict) or "$class" not in archived:
+            return archived
+        class_info = self._objects[int(_as_uid(archived["$class"]))]
+        classname = class_info["$classname"]
+        decoder = self._decoders.get(classname)
+        if decoder is None:
+            result = ArchivedObject(classname, classes=list(class_info.get("$classes", [])))
+            self._decoded[index] = result
+            for key, value in archived.items():
+                if key != "$class":
+                    result[key] = self.decode(value)
+            return result
+        result = decoder(self, archived)
+        if hasattr(result, "send"):
+            steps = result
+            result = next(steps)
+            self._decoded[index] = result
+            for _ in steps:
+                pass
+        return result
+
+
+class _LazyObjects(object):
+    """`$objects` array decoded entry by entry from the binary object table
+    """
+
+    def __init__(self, reader, refs):
+        self._reader = reader
+        self._refs = refs
+
+    def __len__(self):
+        return len(self._refs)
+
+    def __getitem__(self, index):
+        return self._reader._read_object(self._refs[index], 2)
+
+
+class KeyedArchiver(object):
+    """build an NSKeyedArchiver plist from native objects
+
+    equal scalars and class descriptions are archived once, containers are
+    archived once per identity so shared and cyclic references are kept
+    """
+
+    def __init__(self):
+        self._objects = [NULL_OBJECT]
+        self._scalars = {}
+        self._containers = {}
+        self._classes = {}
+
+    def _add(self, archived):
+        self._objects.append(archived)
+        return UID(len(self._objects) - 1)
+
+    def _class_uid(self, classname, classes=None):
+        if classname not in self._classes:
+            self._classes[classname] = self._add({
+                "$classname": classname,
+                "$classes": classes or [classname, "NSObject"]})
+        return self._classes[classname]
+
+    def encode(self, value):
+        """archive `value` and return its UID reference
+        """
+        if value is None:
+            return UID(0)
+        if isinstance(value, (dict, list, set, frozenset)):
+            if id(value) in self._containers:
+                return self._containers[id(value)][0]
+            uid = self._add(None)
+            # keep value alive so its id is not reused while archiving
+            self._containers[id(value)] = (uid, value)
+            self._objects[uid] = self._encode_container(value)
+            return uid
+
+        if isinstance(value, bytes_type) and not isinstance(value, string_type):
+            value = Data.from_raw(value)
+        key = (type(value), value)
+        if key in self._scalars:
+            return self._scalars[key]
+        if isinstance(value, datetime.datetime):
+            delta = value - APPLE_EPOCH
+            archived = {"NS.time": delta.days * 86400.0 + delta.seconds + delta.microseconds / 1e6,
+                        "$class": self._class_uid("NSDate")}
+        elif isinstance(value, (string_type, Data, bool, int, float)):
+            archived = value
+        else:
+            raise ValueError("value=%s is unsupported" % value)
+        uid = self._add(archived)
+        self._scalars[key] = uid
+        return uid
+
+    def _encode_container(self, value):
+        if isinstance(value, ArchivedObject):
+            archived = OrderedDict()
+            for k, v in value.items():
+                archived[k] = self.encode(v)
+            archived["$class"] = self._class_uid(value.classname, value.classes)
+        elif isinstance(value, dict):
+            archived = {"NS.keys": [self.encode(k) for k in value.keys()],
+                        "NS.objects": [self.encode(v) for v in value.values()],
+                        "$class": self._class_uid("NSDictionary")}
+        elif isinstance(value, list):
+            archived = {"NS.objects": [self.encode(v) for v in value],
+                        "$class": self._class_uid("NSArray")}
+        else:
+            archived = {"NS.objects": [self.encode(v) for v in value],
+                        "$class": self._class_uid("NSSet")}
+        return archived
+
+    def archive(self, root):
+        """
+        :rtype: PlistInfo
+        """
+        top = OrderedDict([("root", self.encode(root))])
+        return PlistInfo(OrderedDict([
+            ("$version", ARCHIVER_VERSION),
+            ("$archiver", ARCHIVER_NAME),
+            ("$top", top),
+            ("$objects", self._objects)]))
+
+
+def unarchive(data, lazy=True, decoders=None):
+    """decode the root object of a keyed archive
+
+    :param data: archive content or an already parsed plist
+    :type  data: bytes or dict
+    """
+    if isinstance(data, dict):
+        return KeyedUnarchiver(data, decoders=decoders).root
+    return KeyedUnarchiver.from_binary(data, lazy=lazy, decoders=decoders).root
+
+
+def archive(root):
+    """
+    :rtype: PlistInfo
+    """
+    return KeyedArchiver().archive(root)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""command line tools, run in process or by the `gplist.daemon` server
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from gplist.mobileprovision import MobileProvision, ProvisionIndex, find_provisions
+from gplist.plist import PlistInfo, PlistEncoder
+
+
+class CommandExit(Exception):
+
+    def __init__(self, code):
+        super(CommandExit, self).__init__(code)
+        self.code = code
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    """argument parser writing to the given streams instead of exiting the
+    process, so that the daemon can run commands
+    """
+
+    def __init__(self, stdout, stderr, **kwargs):
+        super(ArgumentParser, self).__init__(**kwargs)
+        self._stdout = stdout
+        self._stderr = stderr
+
+    def print_help(self, file=None):
+        super(ArgumentParser, self).print_help(self._stdout)
+
+    def exit(self, status=0, message=None):
+        if message:
+            self._stderr.write(message)
+        raise CommandExit(status)
+
+    def error(self, message):
+        self.print_usage(self._stderr)
+        self.exit(2, "%s: error: %s\n" % (self.prog, message))
+
+
+def build_parser(stdout, stderr):
+    parser = ArgumentParser(stdout, stderr, prog="gplist")
+    parser.add_argument("file", nargs="+",
+                        help="plist or mobile provision file path, directories of "
+                             "mobile provision files are accepted when checking udids")
+    parser.add_argument("--cert",
+                        action="store_true",
+                        help="output certificate information of mobile provision file")
+    parser.add_argument("--has-udid",
+                        dest="udid",
+                        action="append",
+                        help="check whether provision contains the target udid, "
+                             "can be repeated")
+    parser.add_argument("--udid-file",
+                        help="check udids listed in this file, one per line")
+    parser.add_argument("--index",
+                        help="persisted udid index file, updated with changed provisions")
+    parser.add_argument("--query",
+                        help="output only the value at this slash separated key path, "
+                             "e.g. CFBundleURLTypes/0/CFBundleURLSchemes")
+    parser.add_argument("--convert",
+                        choices=["xml", "binary"],
+                        help="write the plist in this format to --output")
+    parser.add_argument("--output",
+                        help="output file path of --convert")
+    parser.add_argument("--socket",
+                        help="forward the command to the daemon listening on this "
+                             "socket, runs in process when no daemon is running")
+    return parser
+
+
+def load_file(file_path):
+    """parse a plist or mobile provision file
+    """
+    try:
+        return PlistInfo.from_file(file_path)
+    except ValueError:
+        return MobileProvision.from_file(file_path)
+
+
+def read_udids(args):
+    udids = list(args.udid or [])
+    if args.udid_file:
+        with open(args.udid_file) as fd:
+            for line in fd:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    udids.append(line)
+    return udids
+
+
+def check_udids(args, udids, stdout, stderr, index=None):
+    """check many udids against many provision files, one json line per udid
+    """
+    if index is None:
+        index = ProvisionIndex.load(args.index) if args.index else ProvisionIndex()
+    failed = index.update(args.file, prune=False)
+    for path in failed:
+        stderr.write("file=%s is not recognized as mobile provision file\n" % path)
+    if args.index:
+        index.save(args.index)
+    wanted = set([os.path.abspath(path) for path in find_provisions(args.file)])
+    found = False
+    for udid in udids:
+        profiles = [path for path in index.lookup(udid) if path in wanted]
+        found = found or bool(profiles)
+        stdout.write(json.dumps({"udid": udid, "profiles": profiles}) + "\n")
+    return 0 if found else 1
+
+
+def query(p, key_path):
+    value = p
+    for field in key_path.strip("/").split("/"):
+        if isinstance(value, list):
+            try:
+                field = int(field)
+            except ValueError:
+                raise ValueError("key_path=%s: `%s` is not an array index" % (key_path, field))
+        try:
+            value = value[field]
+        except (IndexError, KeyError, TypeError):
+            raise ValueError("key_path=%s not found" % key_path)
+    return value
+
+
+def run(argv, stdout=None, stderr=None, cwd=None, loader=load_file, index=None):
+    """run a command line, returns the exit code
+
+    :param cwd: directory relative paths are resolved against, defaults to the
+        current directory
+    :param loader: called with a file path to parse it, the daemon passes its
+        cache here
+    :param index: in memory `ProvisionIndex` used when no `--index` is given
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    try:
+        return _run(argv, stdout, stderr, cwd, loader, index)
+    except CommandExit as e:
+        return e.code
+
+
+def _run(argv, stdout, stderr, cwd, loader, index):
+    args = build_parser(stdout, stderr).parse_args(argv)
+    if cwd:
+        args.file = [os.path.join(cwd, path) for path in args.file]
+        for name in ("udid_file", "index", "output"):
+            if getattr(args, name):
+                setattr(args, name, os.path.join(cwd, getattr(args, name)))
+    udids = read_udids(args)
+    if len(udids) > 1 or args.udid_file or len(args.file) > 1 or \
+            (udids and os.path.isdir(args.file[0])):
+        if not udids:
+            stdout.write("multiple files are only supported with --has-udid or --udid-file\n")
+            return 1
+        return check_udids(args, udids, stdout, stderr,
+                           index=None if args.index else index)
+
+    file_path = os.path.abspath(args.file[0])
+    if not os.path.isfile(file_path):
+        stdout.write("file=%s is not a valid file\n" % file_path)
+        return 1
+    if args.convert and not args.output:
+        stdout.write("--convert needs --output\n")
+        return 1
+    p = loader(file_path)
+    if isinstance(p, MobileProvision):
+        if args.cert:
+            cert_info = []
+            for cert in p.certs:
+                cert_info.append({
+                    "serial": cert.serial,
+                    "name": cert.common_name,
+                    "sha1": cert.sha1})
+            json.dump(cert_info, stdout, indent=2, cls=PlistEncoder)
+            return 0
+        elif udids:
+            if p.has_udid(udids[0]):
+                stdout.write("yes\n")
+                return 0
+            stdout.write("no\n")
+            return 1
+    elif any([args.cert, udids]):
+        stdout.write("file=%s is not recognized as mobile provision file\n" % file_path)
+        return 1
+
+    if args.convert == "xml":
+        p.to_xml_file(args.output)
+    elif args.convert == "binary":
+        p.to_binary_file(args.output)
+    elif args.query:
+        try:
+            value = query(p, args.query)
+        except ValueError as e:
+            stderr.write("%s\n" % e)
+            return 1
+        json.dump(value, stdout, indent=2, cls=PlistEncoder)
+    else:
+        json.dump(p, stdout, indent=2, cls=PlistEncoder)
+    return 0
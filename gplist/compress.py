@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""transparent gzip, bz2 and xz file handling
+"""
+
+import bz2
+import gzip
+import os
+import zlib
+
+
+# name: (magic, extensions)
+COMPRESSIONS = {
+    "gzip": (b"\x1f\x8b", (".gz", ".gzip")),
+    "bz2": (b"BZh", (".bz2",)),
+    "xz": (b"\xfd7zXZ\x00", (".xz", ".lzma")),
+}
+MAGIC_SIZE = 6
+CHUNK_SIZE = 64 << 10
+# raised while reading a missing, truncated or corrupt compressed file
+READ_ERRORS = (IOError, OSError, EOFError, zlib.error)
+try:
+    import lzma
+    READ_ERRORS += (lzma.LZMAError,)
+except ImportError:
+    pass
+
+
+def get_lzma():
+    try:
+        import lzma
+    except ImportError:
+        raise ValueError("xz compression requires the lzma module")
+    return lzma
+
+
+def compression_from_name(file_path):
+    """compression named by the extension of `file_path`, None when plain
+    """
+    name = file_path.lower()
+    for compression, (_, extensions) in COMPRESSIONS.items():
+        if name.endswith(extensions):
+            return compression
+    return None
+
+
+def compression_from_magic(head):
+    """compression detected from the leading bytes of a file, None when plain
+    """
+    for compression, (magic, _) in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def strip_extension(file_path):
+    """`file_path` without its compression extension
+    """
+    compression = compression_from_name(file_path)
+    if compression is None:
+        return file_path
+    return os.path.splitext(file_path)[0]
+
+
+def detect_compression(file_path):
+    """compression of an existing file by its magic bytes, falling back to
+    its extension
+    """
+    with open(file_path, "rb") as fd:
+        head = fd.read(MAGIC_SIZE)
+    return compression_from_magic(head) or compression_from_name(file_path)
+
+
+def open_file(file_path, mode="rb", compression="auto", level=None):
+    """open `file_path` for binary reading or writing, (de)compressing on the fly
+
+    :param mode: "rb" or "wb"
+    :type  mode: str
+    :param compression: "gzip", "bz2", "xz", None for a plain file, or "auto"
+        to detect it from magic bytes when reading and from the extension when
+        writing
+    :type  compression: str
+    :param level: compression level, 1 is fastest and 9 is smallest, defaults to
+        each format's own default
+    :type  level: int
+    """
+    if mode not in ("rb", "wb"):
+        raise ValueError("mode=%s should be rb or wb" % mode)
+    if compression == "auto":
+        if mode == "rb":
+            compression = detect_compression(file_path)
+        else:
+            compression = compression_from_name(file_path)
+    if compression is None:
+        return open(file_path, mode)
+    elif compression == "gzip":
+        return gzip.GzipFile(file_path, mode, compresslevel=9 if level is None else level)
+    elif compression == "bz2":
+        return bz2.BZ2File(file_path, mode, compresslevel=9 if level is None else level)
+    elif compression == "xz":
+        lzma = get_lzma()
+        if mode == "rb":
+            return lzma.LZMAFile(file_path, mode)
+        return lzma.LZMAFile(file_path, mode, preset=level)
+    raise ValueError("compression=%s should be one of %s" % (
+        compression, ", ".join(sorted(COMPRESSIONS))))
+
+
+def read_bounded(fd, limits=None, size=0):
+    """read `fd` to the end in chunks, checking `max_bytes` of `limits` as
+    the content grows so that a small compressed file can't expand unbounded
+
+    :param size: bytes already read before `fd`, counted against `max_bytes`
+    :type  size: int
+    """
+    chunks = []
+    while True:
+        chunk = fd.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if limits is not None:
+            limits.check("max_bytes", size)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def read_file(file_path, limits=None, compression="auto"):
+    """decompressed content of `file_path`
+    """
+    with open_file(file_path, "rb", compression) as fd:
+        return read_bounded(fd, limits)
+
+
+class LimitedReader(object):
+    """file object replaying `head` then reading the rest of `fd`, checking
+    `max_bytes` of `limits` as content is read
+    """
+
+    def __init__(self, head, fd, limits=None):
+        self._head = head
+        self._fd = fd
+        self._limits = limits
+        self._size = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            buf = self._head + read_bounded(self._fd, self._limits, self._size + len(self._head))
+            self._head = b""
+        elif self._head:
+            buf = self._head[:size]
+            self._head = self._head[size:]
+        else:
+            max_bytes = self._limits.max_bytes if self._limits is not None else None
+            if max_bytes is not None:
+                # one byte over the budget is enough to fail the check below
+                size = min(size, max(max_bytes - self._size, 0) + 1)
+            buf = self._fd.read(size)
+        self._size += len(buf)
+        if self._limits is not None:
+            self._limits.check("max_bytes", self._size)
+        return buf
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""local daemon running command lines for clients over a unix socket
+
+every frame is a 4 bytes big-endian length followed by utf-8 json, a request
+is `{"argv": [...], "cwd": "..."}` and its response is
+`{"code": 0, "stdout": "...", "stderr": "..."}`. This module only imports the
+standard library at the top, so that clients start fast
+"""
+
+from collections import OrderedDict
+import errno
+import io
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+
+if sys.version_info[0] == 2:
+    PY2 = True
+    import SocketServer as socketserver
+else:
+    PY2 = False
+    import socketserver
+
+
+LENGTH_FORMAT = ">I"
+MAX_FRAME_SIZE = 64 << 20
+CACHE_SIZE = 256
+# seconds a client waits on each socket operation
+REQUEST_TIMEOUT = 300
+
+
+class DaemonError(Exception):
+    """raised when the daemon can't be reached or answers malformed frames
+    """
+
+
+class DaemonUnavailable(DaemonError):
+    """raised when no daemon accepts the connection, nothing was sent so the
+    command can safely run in process instead
+    """
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise DaemonError("connection closed with %s bytes missing" % size)
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_frame(sock, message):
+    buf = json.dumps(message).encode("utf-8")
+    sock.sendall(struct.pack(LENGTH_FORMAT, len(buf)) + buf)
+
+
+def recv_frame(sock):
+    size = struct.unpack(LENGTH_FORMAT, _recv_exact(sock, struct.calcsize(LENGTH_FORMAT)))[0]
+    if size > MAX_FRAME_SIZE:
+        raise DaemonError("frame size=%s exceeds limit %s" % (size, MAX_FRAME_SIZE))
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+def _connect(sock, socket_path, timeout):
+    """connect `sock`, retrying while the listen queue of the daemon is full,
+    which a unix socket with a timeout reports as EAGAIN instead of waiting
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        try:
+            sock.connect(socket_path)
+            return
+        except socket.error as e:
+            if e.errno != errno.EAGAIN or (deadline is not None and time.time() > deadline):
+                raise DaemonUnavailable("socket=%s is not served: %s" % (socket_path, e))
+        time.sleep(0.01)
+
+
+def request(socket_path, argv, cwd=None, timeout=REQUEST_TIMEOUT):
+    """run `argv` on the daemon, returns (code, stdout, stderr)
+
+    raises `DaemonUnavailable` when no daemon listens on `socket_path`, callers
+    fall back to running the command in process. Failures once the request is
+    sent raise `DaemonError`, the command may have run already
+
+    :param timeout: seconds to wait on each socket operation, None to wait forever
+    :type  timeout: float
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        _connect(sock, socket_path, timeout)
+        try:
+            send_frame(sock, {"argv": list(argv), "cwd": cwd or os.getcwd()})
+            response = recv_frame(sock)
+        except socket.timeout:
+            raise DaemonError("socket=%s didn't answer within %ss" % (socket_path, timeout))
+        except socket.error as e:
+            raise DaemonError("socket=%s request failed: %s" % (socket_path, e))
+    finally:
+        sock.close()
+    return response["code"], response["stdout"], response["stderr"]
+
+
+class FileCache(object):
+    """parsed files kept by path, an entry is reused while the mtime and size
+    of its file are unchanged
+    """
+
+    def __init__(self, loader, size=CACHE_SIZE):
+        self._loader = loader
+        self._size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, file_path):
+        stat = os.stat(file_path)
+        key = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            entry = self._entries.pop(file_path, None)
+            if entry is not None and entry[0] == key:
+                self._entries[file_path] = entry
+                return entry[1]
+        value = self._loader(file_path)
+        with self._lock:
+            self._entries[file_path] = (key, value)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+        return value
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        try:
+            message = recv_frame(self.request)
+        except (DaemonError, ValueError) as e:
+            sys.stderr.write("malformed request: %s\n" % e)
+            return
+        send_frame(self.request, self.server.run(message.get("argv", []), message.get("cwd")))
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """unix socket server running every request in its own thread against
+    warm caches: parsed files, their certificates and an in memory udid index
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, socket_path, cache_size=CACHE_SIZE):
+        from gplist.cli import load_file
+        from gplist.mobileprovision import ProvisionIndex
+        self.socket_path = socket_path
+        self.cache = FileCache(load_file, cache_size)
+        self._index = _LockedIndex(ProvisionIndex())
+        _remove_stale_socket(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, _Handler)
+
+    def run(self, argv, cwd):
+        from gplist.cli import run
+        if PY2:
+            stdout, stderr = io.BytesIO(), io.BytesIO()
+        else:
+            stdout, stderr = io.StringIO(), io.StringIO()
+        try:
+            code = run(argv, stdout, stderr, cwd=cwd, loader=self.cache.load,
+                       index=self._index)
+        except Exception as e:
+            stderr.write("%s: %s\n" % (type(e).__name__, e))
+            code = 1
+        return {"code": code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+
+class _LockedIndex(object):
+    """serialize concurrent udid checks on the shared index
+    """
+
+    def __init__(self, index):
+        self._index = index
+        self._lock = threading.Lock()
+
+    def update(self, paths, prune=True):
+        with self._lock:
+            return self._index.update(paths, prune=prune)
+
+    def lookup(self, udid):
+        with self._lock:
+            return self._index.lookup(udid)
+
+
+def _remove_stale_socket(socket_path):
+    if not os.path.exists(socket_path):
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error as e:
+        if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+            os.remove(socket_path)
+            return
+        raise
+    finally:
+        sock.close()
+    raise DaemonError("socket=%s is already served" % socket_path)
+
+
+def serve(socket_path, cache_size=CACHE_SIZE):
+    """serve requests on `socket_path` until SIGTERM or SIGINT
+    """
+    server = DaemonServer(socket_path, cache_size)
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""export of data blobs to files without holding them in memory
+
+xml base64 text is decoded chunk by chunk as it is parsed, blobs of binary
+plists are copied from the file with `os.sendfile` or from mapped slices, so
+memory stays at one chunk whatever the blob sizes
+"""
+
+import binascii
+import mmap
+import os
+import re
+
+from gplist.compress import CHUNK_SIZE, read_file, strip_extension
+from gplist.iterparse import ANY, _iter_binary, _iter_xml, _open_source
+from gplist.mobileprovision import PROVISION_EXTENSIONS
+from gplist.plist import InvalidPlistError, DEFAULT_LIMITS
+
+_UNSAFE_RE = re.compile(r"[^\w.-]+")
+
+
+def parse_pattern(pattern):
+    """`"DeveloperCertificates/*"` to `("DeveloperCertificates", ANY)`, tuples
+    are returned as is
+    """
+    if isinstance(pattern, tuple):
+        return pattern
+    return tuple(pattern.strip("/").split("/"))
+
+
+def _matches(path, patterns):
+    for pattern in patterns:
+        if len(pattern) == len(path) and all(
+                [expected == ANY or str(expected) == str(field)
+                 for field, expected in zip(path, pattern)]):
+            return True
+    return False
+
+
+def blob_name(path):
+    """file name of the blob at `path`, e.g. "DeveloperCertificates.0"
+    """
+    name = _UNSAFE_RE.sub("_", ".".join([str(field) for field in path])).lstrip(".")
+    return name or "data"
+
+
+class _Sink(object):
+    """writes one blob to `file_path`, `close()` records it in `results` and
+    `abort()` removes the partial file
+    """
+
+    def __init__(self, path, file_path, results, limits):
+        self.path = path
+        self.file_path = file_path
+        self.size = 0
+        self._results = results
+        self._limits = limits
+        self._fd = open(file_path, "wb")
+
+    def _write(self, buf):
+        self.size += len(buf)
+        self._limits.check("max_data_size", self.size)
+        self._fd.write(buf)
+
+    def close(self):
+        self._fd.close()
+        self._results.append((self.path, self.file_path, self.size))
+
+    def abort(self):
+        if self._fd.closed:
+            return
+        self._fd.close()
+        os.remove(self.file_path)
+
+
+class _Base64Sink(_Sink):
+    """decodes base64 text given in arbitrary pieces
+    """
+
+    def __init__(self, *args):
+        super(_Base64Sink, self).__init__(*args)
+        self._pending = b""
+
+    def write(self, text):
+        buf = self._pending + "".join(text.split()).encode("ascii", "ignore")
+        end = len(buf) - len(buf) % 4
+        self._pending = buf[end:]
+        if end:
+            self._write(binascii.a2b_base64(buf[:end]))
+
+    def close(self):
+        if self._pending:
+            self.abort()
+            raise InvalidPlistError("data at path=%s is truncated base64" % (self.path,))
+        super(_Base64Sink, self).close()
+
+
+class _RangeSink(_Sink):
+    """copies a byte range of the source content, with `os.sendfile` when
+    the source is a mapped file
+    """
+
+    def __init__(self, path, file_path, results, limits, content, fileno):
+        super(_RangeSink, self).__init__(path, file_path, results, limits)
+        self._content = content
+        self._fileno = fileno
+
+    def write_range(self, offset, size):
+        self._limits.check("max_data_size", size)
+        if self._fileno is not None and hasattr(os, "sendfile"):
+            self._fd.flush()
+            while size:
+                sent = os.sendfile(self._fd.fileno(), self._fileno, offset, size)
+                if not sent:
+                    raise InvalidPlistError("data at path=%s is truncated" % (self.path,))
+                offset += sent
+                size -= sent
+                self.size += sent
+            return
+        for start in range(offset, offset + size, CHUNK_SIZE):
+            self._write(self._content[start:min(start + CHUNK_SIZE, offset + size)])
+
+
+class _SkipSink(object):
+    """drops blobs which are not exported, so that they aren't decoded
+    """
+
+    def write(self, text):
+        pass
+
+    def write_range(self, offset, size):
+        pass
+
+    def close(self):
+        return None
+
+
+def _provision_source(file_path, limits):
+    content = read_file(file_path, limits=limits)
+    start = content.find(b"<?xml")
+    end = content.find(b"</plist>")
+    if start < 0 or end < 0:
+        raise ValueError("file=%s is not recognized as mobile provision file" % file_path)
+    return content[start:end + len(b"</plist>")]
+
+
+def extract_data(source, out_dir, patterns=None, limits=None):
+    """write data blobs of a plist to files of `out_dir`, one file per blob
+    named by its path
+
+        extract_data("embedded.mobileprovision", "certs", ["DeveloperCertificates/*"])
+
+    :param source: plist or mobile provision path, plist content, or a binary
+        file object
+    :param patterns: key paths of the blobs to export, as tuples or slash
+        separated strings where "*" matches any key or index, defaults to every
+        blob
+    :type  patterns: list
+    :param limits: limits for untrusted input, `max_data_size` applies per blob
+    :type  limits: PlistLimits
+    :return: [(path, file path, size)] in document order
+    :rtype: list
+    """
+    limits = limits or DEFAULT_LIMITS
+    if patterns is not None:
+        patterns = [parse_pattern(pattern) for pattern in patterns]
+    if not hasattr(source, "read") and not isinstance(source, bytes) and \
+            strip_extension(source).endswith(PROVISION_EXTENSIONS):
+        source = _provision_source(source, limits)
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    results = []
+    names = set()
+    sinks = []
+    fmt, content, closers = _open_source(source, limits)
+    fileno = closers[0].fileno() if isinstance(content, mmap.mmap) else None
+
+    def on_data(path):
+        if patterns is not None and not _matches(path, patterns):
+            return _SkipSink()
+        name = base = blob_name(path)
+        index = 1
+        while name in names:
+            name = "%s-%s" % (base, index)
+            index += 1
+        names.add(name)
+        file_path = os.path.join(out_dir, name)
+        if fmt == "binary":
+            sink = _RangeSink(path, file_path, results, limits, content, fileno)
+        else:
+            sink = _Base64Sink(path, file_path, results, limits)
+        # only the last one can be open, the others are finished
+        del sinks[:]
+        sinks.append(sink)
+        return sink
+
+    try:
+        if fmt == "binary":
+            events = _iter_binary(content, limits, on_data)
+        else:
+            events = _iter_xml(content, limits, on_data)
+        for _ in events:
+            pass
+    except BaseException:
+        # don't leave a truncated file behind a failed parse
+        for sink in sinks:
+            sink.abort()
+        raise
+    finally:
+        for closer in reversed(closers):
+            closer.close()
+    return results
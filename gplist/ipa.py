@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""in place patching of ipa members
+
+only the replaced members and the central directory are written: a new member
+overwrites its old local entry when it fits, and is appended after the old end
+record otherwise, followed by the new central directory. The old directory is
+left as unused space, which later patches may reuse for the entry before it.
+The other members are neither read nor recompressed, and their central
+directory records are kept byte for byte
+"""
+
+import os
+import shutil
+import struct
+import time
+import zipfile
+import zlib
+
+from gplist.plist import PlistInfo, _find_ipa_app
+
+
+CENTRAL_DIR_FORMAT = zipfile.structCentralDir
+CENTRAL_DIR_SIZE = struct.calcsize(CENTRAL_DIR_FORMAT)
+CENTRAL_DIR_MAGIC = zipfile.stringCentralDir
+LOCAL_HEADER_FORMAT = zipfile.structFileHeader
+LOCAL_HEADER_MAGIC = zipfile.stringFileHeader
+END_FORMAT = zipfile.structEndArchive
+END_SIZE = struct.calcsize(END_FORMAT)
+END_MAGIC = zipfile.stringEndArchive
+ZIP64_LIMIT = 0xffffffff
+# the archive comment is at most 64KB
+MAX_END_SEARCH = END_SIZE + 0xffff
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+# indexes of central directory record fields
+_CD_FLAGS, _CD_METHOD, _CD_TIME, _CD_DATE, _CD_CRC = 5, 6, 7, 8, 9
+_CD_COMPRESSED_SIZE, _CD_SIZE, _CD_EXTRA_LENGTH, _CD_OFFSET = 10, 11, 13, 18
+
+
+class IPAPatchError(ValueError):
+    """raised for archives which can't be patched in place, e.g. zip64 ones
+    """
+
+
+class _Record(object):
+    """one central directory record, written back as read until it is changed
+    """
+
+    def __init__(self, raw, name, fields, extra, comment):
+        self.raw = raw
+        self.name = name
+        self.fields = fields
+        self.extra = extra
+        self.comment = comment
+
+    def update(self, changes):
+        """
+        :param changes: field index to value
+        :type  changes: dict
+        """
+        fields = list(self.fields)
+        for index, value in changes.items():
+            fields[index] = value
+        self.fields = tuple(fields)
+        self.raw = struct.pack(CENTRAL_DIR_FORMAT, *self.fields) + self.name + self.extra + \
+            self.comment
+
+    @property
+    def filename(self):
+        """name decoded like `zipfile` does, cp437 unless the utf-8 flag is set
+        """
+        if self.fields[_CD_FLAGS] & FLAG_UTF8:
+            return self.name.decode("utf-8")
+        return self.name.decode("cp437")
+
+
+def _read_central_directory(fd):
+    """returns (records, central directory offset, archive comment)
+    """
+    fd.seek(0, os.SEEK_END)
+    file_size = fd.tell()
+    tail_size = min(file_size, MAX_END_SEARCH)
+    fd.seek(file_size - tail_size)
+    tail = fd.read(tail_size)
+    position = tail.rfind(END_MAGIC)
+    if position < 0 or position + END_SIZE > len(tail):
+        raise IPAPatchError("end of central directory not found")
+    end = struct.unpack(END_FORMAT, tail[position:position + END_SIZE])
+    count, dir_size, dir_offset, comment_size = end[4], end[5], end[6], end[7]
+    if count == 0xffff or dir_offset == ZIP64_LIMIT or dir_size == ZIP64_LIMIT:
+        raise IPAPatchError("zip64 archives are not supported")
+    if dir_offset + dir_size != file_size - tail_size + position:
+        raise IPAPatchError("central directory offset=%s size=%s is inconsistent" %
+                            (dir_offset, dir_size))
+    comment = tail[position + END_SIZE:position + END_SIZE + comment_size]
+    fd.seek(dir_offset)
+    buf = fd.read(dir_size)
+    records = []
+    offset = 0
+    for _ in range(count):
+        fields = struct.unpack(CENTRAL_DIR_FORMAT, buf[offset:offset + CENTRAL_DIR_SIZE])
+        if fields[0] != CENTRAL_DIR_MAGIC:
+            raise IPAPatchError("central directory record at offset=%s is invalid" % offset)
+        name_end = offset + CENTRAL_DIR_SIZE + fields[12]
+        extra_end = name_end + fields[13]
+        record_end = extra_end + fields[14]
+        if ZIP64_LIMIT in fields[_CD_COMPRESSED_SIZE:_CD_SIZE + 1] or fields[_CD_OFFSET] == ZIP64_LIMIT:
+            raise IPAPatchError("zip64 archives are not supported")
+        records.append(_Record(buf[offset:record_end], buf[offset + CENTRAL_DIR_SIZE:name_end],
+                               fields, buf[name_end:extra_end], buf[extra_end:record_end]))
+        offset = record_end
+    return records, dir_offset, comment
+
+
+def _plist_format(p):
+    """format `p` was parsed from, binary for plists built from a dict
+    """
+    try:
+        return p.format
+    except (AttributeError, TypeError):
+        return "binary"
+
+
+def _encode_member(name, value, level):
+    """returns (content, compress type, compressed content, crc)
+    """
+    if isinstance(value, PlistInfo):
+        if name.endswith(".mobileprovision"):
+            raise ValueError("name=%s must be given as signed bytes" % name)
+        value = value.to_xml() if _plist_format(value) == "xml" else value.to_binary()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = compressor.compress(value) + compressor.flush()
+    if len(compressed) >= len(value):
+        return value, zipfile.ZIP_STORED, value, zlib.crc32(value) & 0xffffffff
+    return value, zipfile.ZIP_DEFLATED, compressed, zlib.crc32(value) & 0xffffffff
+
+
+def _dos_time(timestamp):
+    date_time = time.localtime(timestamp)
+    return (date_time[3] << 11 | date_time[4] << 5 | date_time[5] // 2,
+            (date_time[0] - 1980) << 9 | date_time[1] << 5 | date_time[2])
+
+
+def _new_record(name):
+    encoded = name.encode("utf-8")
+    flags = 0 if len(encoded) == len(name) else FLAG_UTF8
+    dos_time, dos_date = _dos_time(time.time())
+    fields = (CENTRAL_DIR_MAGIC, 20, 3, 20, 0, flags, 0, dos_time, dos_date, 0, 0, 0,
+              len(encoded), 0, 0, 0, 0, (0o100644 << 16), 0)
+    return _Record(None, encoded, fields, b"", b"")
+
+
+def patch_ipa(ipa_path, members, output=None, level=6):
+    """replace or add members of an ipa without recompressing the others
+
+        patch_ipa("FooApp.ipa", {
+            "Info.plist": info,  # PlistInfo, written in its own format
+            "PlugIns/Foo.appex/Info.plist": extension_info,
+            "embedded.mobileprovision": signed_provision_bytes,
+        })
+
+    :param members: member name to `PlistInfo` or bytes, names are relative to
+        the .app directory unless they are archive member names
+    :type  members: dict
+    :param output: patched archive path, the ipa is patched in place when None
+    :param level: deflate level of the new members
+    :type  level: int
+    :return: [(member name, True when written over its old entry)]
+    :rtype: list
+    """
+    if not os.path.isfile(ipa_path):
+        raise ValueError("ipa_path=%s not found" % ipa_path)
+    if output is not None:
+        shutil.copyfile(ipa_path, output)
+        ipa_path = output
+    with open(ipa_path, "r+b") as fd:
+        records, dir_offset, comment = _read_central_directory(fd)
+        fd.seek(0, os.SEEK_END)
+        file_size = fd.tell()
+        by_name = dict([(record.filename, record) for record in records])
+        app_item = None
+        # a local entry may grow up to the next entry
+        offsets = sorted([record.fields[_CD_OFFSET] for record in records] + [dir_offset])
+        slots = dict([(offsets[i], offsets[i + 1] - offsets[i]) for i in range(len(offsets) - 1)])
+        # everything is encoded and placed before the archive is touched
+        plan = []
+        append_offset = file_size
+        for name in sorted(members):
+            full_name = name
+            if name not in by_name:
+                if app_item is None:
+                    with zipfile.ZipFile(fd) as zip_file:
+                        app_item = _find_ipa_app(zip_file, ipa_path)
+                full_name = app_item + name
+            content, method, compressed, crc = _encode_member(name, members[name], level)
+            record = by_name.get(full_name)
+            if record is None:
+                record = by_name[full_name] = _new_record(full_name)
+                records.append(record)
+            # sizes are known, so no data descriptor follows the new entry
+            flags = record.fields[_CD_FLAGS] & ~FLAG_DATA_DESCRIPTOR
+            header = struct.pack(LOCAL_HEADER_FORMAT, LOCAL_HEADER_MAGIC, 20, 0, flags, method,
+                                 record.fields[_CD_TIME], record.fields[_CD_DATE], crc,
+                                 len(compressed), len(content), len(record.name), 0)
+            entry = header + record.name + compressed
+            offset = record.fields[_CD_OFFSET]
+            in_place = record.raw is not None and len(entry) <= slots.get(offset, 0)
+            if not in_place:
+                offset = append_offset
+                append_offset += len(entry)
+            if append_offset >= ZIP64_LIMIT or len(content) >= ZIP64_LIMIT:
+                raise IPAPatchError("member=%s at offset=%s needs zip64" % (full_name, offset))
+            plan.append((full_name, record, entry, offset, in_place, {
+                _CD_FLAGS: flags, _CD_METHOD: method, _CD_CRC: crc,
+                _CD_COMPRESSED_SIZE: len(compressed), _CD_SIZE: len(content),
+                _CD_EXTRA_LENGTH: len(record.extra), _CD_OFFSET: offset}))
+        for _, record, _, _, _, changes in plan:
+            record.update(changes)
+        central_directory = b"".join([record.raw for record in records])
+        if len(records) >= 0xffff or append_offset + len(central_directory) >= ZIP64_LIMIT:
+            raise IPAPatchError("central directory at offset=%s needs zip64" % append_offset)
+        # appended entries and the new directory follow the old end record, so
+        # the old directory stays valid until the new one is complete
+        for _, _, entry, offset, in_place, _ in plan:
+            if not in_place:
+                fd.seek(offset)
+                fd.write(entry)
+        fd.seek(append_offset)
+        fd.write(central_directory)
+        fd.write(struct.pack(END_FORMAT, END_MAGIC, 0, 0, len(records), len(records),
+                             len(central_directory), append_offset, len(comment)) + comment)
+        fd.truncate()
+        fd.flush()
+        for _, _, entry, offset, in_place, _ in plan:
+            if in_place:
+                fd.seek(offset)
+                fd.write(entry)
+    return [(full_name, in_place) for full_name, _, _, _, in_place, _ in plan]
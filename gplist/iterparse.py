@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""event streaming over binary and xml plists without building the tree
+
+    for path, event, value in iterparse("huge.plist"):
+        ...
+
+events come in document order:
+
+    start_dict / end_dict     value is None
+    start_array / end_array   value is None
+    key                       value is the dict key
+    value                     value is a scalar
+
+`path` is the tuple of dict keys and array indices leading to the item the
+event is about, a `key` event has the path of its dict. Only the containers
+being walked are kept, so memory is bounded by the nesting depth
+"""
+
+from collections import OrderedDict
+import datetime
+import mmap
+import os
+from xml.parsers import expat
+
+from gplist.compress import LimitedReader, detect_compression, open_file
+from gplist.plist import PlistInfo, Data, InvalidPlistError, DEFAULT_LIMITS
+
+
+FORMATS = ("binary", "xml")
+# refs read at once from a container, and xml bytes fed to expat at once
+REFS_CHUNK_SIZE = 1024
+XML_CHUNK_SIZE = 64 << 10
+ANY = "*"
+
+_SCALAR_TAGS = ("string", "integer", "real", "true", "false", "date", "data")
+
+
+def _open_source(source, limits):
+    """returns (format, binary content or xml stream, closers)
+    """
+    closers = []
+    if isinstance(source, bytes) and (source.startswith(b"bplist00") or
+                                      source.lstrip().startswith(b"<")):
+        if source.startswith(b"bplist00"):
+            return "binary", source, closers
+        return "xml", _BytesStream(source), closers
+    if hasattr(source, "read"):
+        fd = source
+    elif not os.path.isfile(source):
+        raise ValueError("plist_file=%s is not valid" % source)
+    elif detect_compression(source) is None:
+        fd = open(source, "rb")
+        closers.append(fd)
+        if fd.read(8) == b"bplist00":
+            mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            closers.append(mapped)
+            return "binary", mapped, closers
+        fd.seek(0)
+    else:
+        fd = open_file(source, "rb")
+        closers.append(fd)
+    head = fd.read(32)
+    if head.startswith(b"bplist00"):
+        return "binary", LimitedReader(head, fd, limits).read(), closers
+    return "xml", LimitedReader(head, fd, limits), closers
+
+
+class _BytesStream(object):
+
+    def __init__(self, data):
+        self._data = data
+        self._position = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._data) - self._position
+        buf = self._data[self._position:self._position + size]
+        self._position += len(buf)
+        return buf
+
+
+def iterparse(source, formats=FORMATS, limits=None):
+    """yield (path, event, value) for a binary or xml plist
+
+    :param source: plist content, a file path, or a binary file object.
+        Binary files are memory mapped, xml is parsed as it is read, compressed
+        files are supported
+    :param formats: accepted formats
+    :type  formats: tuple
+    :param limits: limits for untrusted input
+    :type  limits: PlistLimits
+    """
+    limits = limits or DEFAULT_LIMITS
+    fmt, content, closers = _open_source(source, limits)
+    try:
+        if fmt not in formats:
+            raise ValueError("format=%s not in formats=%s" % (fmt, ", ".join(formats)))
+        if fmt == "binary":
+            events = _iter_binary(content, limits)
+        else:
+            events = _iter_xml(content, limits)
+        for event in events:
+            yield event
+    finally:
+        for closer in reversed(closers):
+            closer.close()
+
+
+def _read_scalar(reader, obj_index):
+    value = reader._read_object(obj_index, 1)
+    # the reader caches decoded objects, the walk must not keep them
+    reader._objs.pop(obj_index, None)
+    return value
+
+
+def _data_range(reader, obj_index):
+    """returns (offset, size) of a data object, None for other objects
+    """
+    offset = reader.obj_offsets[obj_index]
+    reader._check_range(offset, offset + 1)
+    token = ord(reader._binary_data[offset:offset + 1])
+    if token & 0xf0 != 0x40:
+        return None
+    size, length_size = reader._get_size(token & 0x0f, offset + 1)
+    reader._limits.check("max_data_size", size)
+    start = offset + 1 + length_size
+    reader._check_range(start, start + size)
+    return start, size
+
+
+def _container_header(reader, obj_index):
+    """returns (token, item count, refs offset) of a container, None for
+    scalars
+    """
+    offset = reader.obj_offsets[obj_index]
+    reader._check_range(offset, offset + 1)
+    token = ord(reader._binary_data[offset:offset + 1])
+    if token & 0xf0 not in (0xa0, 0xd0):
+        return None
+    count, length_size = reader._get_size(token & 0x0f, offset + 1)
+    reader._limits.check("max_container_length", count)
+    return token & 0xf0, count, offset + 1 + length_size
+
+
+class _Container(object):
+    """a binary container being walked, its refs are read chunk by chunk
+    """
+
+    def __init__(self, reader, obj_index, path, token, count, refs_offset):
+        self.reader = reader
+        self.obj_index = obj_index
+        self.path = path
+        self.is_dict = token == 0xd0
+        self.count = count
+        self.refs_offset = refs_offset
+        self.position = 0
+        self._chunk_start = 0
+        self._keys = []
+        self._values = []
+
+    def next_refs(self):
+        """returns (key ref or None, value ref) of the next item
+        """
+        index = self.position - self._chunk_start
+        if index >= len(self._values):
+            self._chunk_start = self.position
+            index = 0
+            size = min(REFS_CHUNK_SIZE, self.count - self.position)
+            ref_size = self.reader.ref_size
+            self._values = self.reader._read_refs(
+                size, self.refs_offset + (self.count * self.is_dict + self.position) * ref_size)
+            if self.is_dict:
+                self._keys = self.reader._read_refs(size, self.refs_offset + self.position * ref_size)
+        self.position += 1
+        if self.is_dict:
+            return self._keys[index], self._values[index]
+        return None, self._values[index]
+
+
+def _iter_binary(data, limits, on_data=None):
+    """
+    :param on_data: called with the path of every data object, returns None
+        to decode it as usual, or a sink whose `write_range(offset, size)` is
+        given its location and whose `close()` result is the event value
+    """
+    reader = PlistInfo({}, limits=limits)
+    reader._binary_data = data
+    top = reader._read_trailer()
+    stack = []
+    walking = set()
+    pending = [((), top)]
+    while pending or stack:
+        if pending:
+            path, obj_index = pending.pop()
+            header = _container_header(reader, obj_index)
+            if header is None:
+                blob = on_data is not None and _data_range(reader, obj_index)
+                sink = on_data(path) if blob else None
+                if sink is not None:
+                    sink.write_range(*blob)
+                    yield path, "value", sink.close()
+                else:
+                    yield path, "value", _read_scalar(reader, obj_index)
+                continue
+            if obj_index in walking:
+                raise InvalidPlistError("cyclic reference to object=%s" % obj_index)
+            limits.check("max_depth", len(stack))
+            container = _Container(reader, obj_index, path, *header)
+            walking.add(obj_index)
+            stack.append(container)
+            yield path, "start_dict" if container.is_dict else "start_array", None
+        container = stack[-1]
+        if container.position >= container.count:
+            stack.pop()
+            walking.discard(container.obj_index)
+            yield container.path, "end_dict" if container.is_dict else "end_array", None
+            continue
+        key_ref, value_ref = container.next_refs()
+        if container.is_dict:
+            key = _read_scalar(reader, key_ref)
+            yield container.path, "key", key
+            pending.append((container.path + (key,), value_ref))
+        else:
+            pending.append((container.path + (container.position - 1,), value_ref))
+
+
+def _xml_value(tag, text, limits):
+    if tag == "string":
+        limits.check("max_string_size", len(text))
+        return text
+    elif tag == "integer":
+        return int(text.strip())
+    elif tag == "real":
+        return float(text.strip())
+    elif tag == "true":
+        return True
+    elif tag == "false":
+        return False
+    elif tag == "date":
+        return datetime.datetime.strptime(text.strip(), "%Y-%m-%dT%H:%M:%SZ")
+    content = "".join(text.split())
+    limits.check("max_data_size", len(content) * 3 // 4)
+    return Data(content)
+
+
+def _iter_xml(stream, limits, on_data=None):
+    """
+    :param on_data: called with the path of every `<data>`, returns None to
+        decode it as usual, or a sink whose `write(text)` is given the base64
+        text as it is parsed and whose `close()` result is the event value
+    """
+    parser = expat.ParserCreate()
+    events = []
+    # [path, is_dict, next index or last key]
+    stack = []
+    text = []
+    state = {"tag": None, "sink": None}
+
+    def item_path():
+        if not stack:
+            return ()
+        frame = stack[-1]
+        if frame[1]:
+            return frame[0] + (frame[2],)
+        frame[2] += 1
+        return frame[0] + (frame[2] - 1,)
+
+    def start(tag, attrs):
+        if tag in ("dict", "array"):
+            path = item_path()
+            limits.check("max_depth", len(stack))
+            stack.append([path, tag == "dict", None if tag == "dict" else 0])
+            events.append((path, "start_" + tag, None))
+        elif tag == "key":
+            state["tag"] = tag
+            del text[:]
+        elif tag in _SCALAR_TAGS:
+            state["path"] = item_path()
+            if tag == "data" and on_data is not None:
+                state["sink"] = on_data(state["path"])
+            state["tag"] = tag
+            del text[:]
+        elif tag != "plist":
+            raise InvalidPlistError("unexpected tag=%s" % tag)
+
+    def end(tag):
+        if tag in ("dict", "array"):
+            path = stack.pop()[0]
+            events.append((path, "end_" + tag, None))
+        elif tag == "key":
+            key = "".join(text)
+            stack[-1][2] = key
+            events.append((stack[-1][0], "key", key))
+            state["tag"] = None
+        elif tag in _SCALAR_TAGS:
+            if state["sink"] is not None:
+                value = state["sink"].close()
+                state["sink"] = None
+            else:
+                value = _xml_value(tag, "".join(text), limits)
+            events.append((state["path"], "value", value))
+            state["tag"] = None
+
+    def characters(data):
+        if state["sink"] is not None:
+            state["sink"].write(data)
+        elif state["tag"] is not None:
+            text.append(data)
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = characters
+    parser.buffer_text = True
+    try:
+        while True:
+            buf = stream.read(XML_CHUNK_SIZE)
+            parser.Parse(buf, not buf)
+            for event in events:
+                yield event
+            del events[:]
+            if not buf:
+                break
+    except expat.ExpatError as e:
+        raise InvalidPlistError("xml error: %s" % e)
+
+
+def _match(path, pattern):
+    if len(path) != len(pattern):
+        return False
+    for field, expected in zip(path, pattern):
+        if expected != ANY and expected != field:
+            return False
+    return True
+
+
+def build(events, first):
+    """materialize the value `first`, a start or value event taken from
+    `events`, consuming the rest of its events
+    """
+    path, event, value = first
+    if event == "value":
+        return value
+    stack = [OrderedDict() if event == "start_dict" else []]
+    key = None
+    for _, event, value in events:
+        if event == "key":
+            key = value
+            continue
+        if event in ("end_dict", "end_array"):
+            value = stack.pop()
+            if not stack:
+                return value
+            continue
+        elif event == "start_dict":
+            value = OrderedDict()
+        elif event == "start_array":
+            value = []
+        parent = stack[-1]
+        if isinstance(parent, list):
+            parent.append(value)
+        else:
+            parent[key] = value
+        if event in ("start_dict", "start_array"):
+            stack.append(value)
+    raise InvalidPlistError("events of path=%s end early" % (path,))
+
+
+def items(source, pattern, formats=FORMATS, limits=None):
+    """yield (path, value) for every item whose path matches `pattern`, only
+    these subtrees are materialized
+
+        # every dict in the top level "objects" array with type "X"
+        matches = [value for _, value in items("huge.plist", ("objects", ANY))
+                   if value.get("type") == "X"]
+
+    :param pattern: tuple of keys, indices or `ANY`
+    :type  pattern: tuple
+    """
+    pattern = tuple(pattern)
+    events = iterparse(source, formats=formats, limits=limits)
+    for event in events:
+        if event[1] not in ("key", "end_dict", "end_array") and _match(event[0], pattern):
+            yield event[0], build(events, event)
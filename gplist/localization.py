@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""bulk loading of *.lproj/*.strings and *.stringsdict files of app bundles
+"""
+
+import os
+import re
+import sys
+import zipfile
+
+from gplist.plist import PlistInfo, _find_ipa_app
+
+
+LPROJ_EXTENSION = ".lproj"
+TABLE_EXTENSIONS = (".strings", ".stringsdict")
+# bundles nested in an app keep their own localizations
+NESTED_BUNDLES = (".app", ".appex", ".bundle", ".framework", ".xpc")
+# files per worker task, and the file count below which decoding is serial
+BATCH_SIZE = 32
+PARALLEL_MIN_FILES = 64
+
+intern = sys.intern if sys.version_info[0] > 2 else intern  # noqa
+
+_TOKEN_RE = re.compile(r'''
+    \s+ | /\*.*?\*/ | //[^\n]* |
+    (?P<quoted>"(?:[^"\\]|\\.)*") |
+    (?P<bare>[\w.$:/-]+) |
+    (?P<punct>[=;])
+''', re.S | re.X)
+_ESCAPE_RE = re.compile(r'\\(U[0-9a-fA-F]{4}|u[0-9a-fA-F]{4}|[0-7]{1,3}|.)', re.S)
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "a": "\a", "b": "\b", "f": "\f", "v": "\v"}
+
+
+def _unescape(match):
+    text = match.group(1)
+    if text[0] in "Uu" and len(text) == 5:
+        return (unichr if sys.version_info[0] == 2 else chr)(int(text[1:], 16))  # noqa
+    elif text[0] in "01234567":
+        return chr(int(text, 8))
+    return _ESCAPES.get(text, text)
+
+
+def parse_strings_text(data):
+    """parse the `"key" = "value";` text format of .strings files
+
+    :param data: utf-8 or utf-16 content with a BOM
+    :type  data: bytes
+    :rtype: dict
+    """
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        text = data.decode("utf-16")
+    else:
+        text = data.decode("utf-8-sig")
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN_RE.match(text, position)
+        if match is None:
+            raise ValueError("unexpected `%s` at offset=%s" % (text[position:position + 16], position))
+        position = match.end()
+        if match.group("quoted") is not None:
+            tokens.append(("s", _ESCAPE_RE.sub(_unescape, match.group("quoted")[1:-1])))
+        elif match.group("bare") is not None:
+            tokens.append(("s", match.group("bare")))
+        elif match.group("punct") is not None:
+            tokens.append((match.group("punct"), None))
+    kinds = "".join([kind for kind, _ in tokens])
+    result = {}
+    i = 0
+    while i < len(tokens):
+        if kinds.startswith("s=s;", i):
+            result[tokens[i][1]] = tokens[i + 2][1]
+            i += 4
+        elif kinds.startswith("s;", i):
+            # `"key";` is short for `"key" = "key";`
+            result[tokens[i][1]] = tokens[i][1]
+            i += 2
+        else:
+            raise ValueError("`key = value;` expected at token=%s" % i)
+    return result
+
+
+def decode_table(data):
+    """decode a binary plist, xml plist or text .strings file
+
+    :rtype: dict
+    """
+    head = data[:8].lstrip(b"\xef\xbb\xbf \t\r\n")
+    if head.startswith(b"bplist00") or head.startswith(b"<?xml") or head.startswith(b"<plist"):
+        return dict(PlistInfo(data))
+    return parse_strings_text(data)
+
+
+def _find_tables(names, sep="/"):
+    """yield (locale, table, name) for every table file among `names`,
+    relative to the bundle root
+    """
+    for name in names:
+        parts = name.split(sep)
+        if len(parts) < 2 or not parts[-2].endswith(LPROJ_EXTENSION):
+            continue
+        base, extension = os.path.splitext(parts[-1])
+        if extension not in TABLE_EXTENSIONS:
+            continue
+        if any(part.endswith(NESTED_BUNDLES) for part in parts[:-2]):
+            continue
+        locale = parts[-2][:-len(LPROJ_EXTENSION)]
+        yield locale, base if extension == ".strings" else base + extension, name
+
+
+def _decode_batch(items):
+    """decode (locale, table, path, content) items, files are read when
+    content is None, returns (strings, error) pairs
+    """
+    results = []
+    for _, _, path, data in items:
+        try:
+            if data is None:
+                with open(path, "rb") as fd:
+                    data = fd.read()
+            results.append((decode_table(data), None))
+        except Exception as e:
+            results.append((None, "%s: %s" % (type(e).__name__, e)))
+    return results
+
+
+class Localizations(object):
+    """locale by key view on the string tables of a bundle
+
+    every table keeps one interned key list shared by all locales, a locale
+    only holds a value list aligned with it, so repeated keys cost nothing
+
+    `.stringsdict` tables are named with their extension, e.g.
+    "Localizable.stringsdict", their values are the plural rule dicts
+    """
+
+    def __init__(self):
+        # table: {key: column}
+        self._columns = {}
+        # table: {locale: [value or None]}
+        self._values = {}
+        # [(path, error)] of the tables that couldn't be decoded
+        self.failed = []
+
+    @property
+    def locales(self):
+        result = set()
+        for values in self._values.values():
+            result.update(values)
+        return sorted(result)
+
+    @property
+    def tables(self):
+        return sorted(self._columns)
+
+    def keys(self, table="Localizable"):
+        return list(self._columns.get(table, ()))
+
+    def add(self, locale, table, strings):
+        columns = self._columns.setdefault(table, {})
+        locales = self._values.setdefault(table, {})
+        values = locales.setdefault(intern(str(locale)), [])
+        for key, value in strings.items():
+            key = intern(key) if type(key) is str else key
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = len(columns)
+            if column >= len(values):
+                values.extend([None] * (column + 1 - len(values)))
+            values[column] = value
+
+    def get(self, locale, key, table="Localizable", default=None):
+        column = self._columns.get(table, {}).get(key)
+        if column is None:
+            return default
+        values = self._values[table].get(locale, ())
+        if column >= len(values) or values[column] is None:
+            return default
+        return values[column]
+
+    def table(self, locale, table="Localizable"):
+        """key to value dict of one locale
+        """
+        values = self._values.get(table, {}).get(locale, ())
+        return dict([(key, values[column]) for key, column in self._columns.get(table, {}).items()
+                     if column < len(values) and values[column] is not None])
+
+    def missing(self, locale, table="Localizable"):
+        """keys some locale of `table` has and `locale` doesn't
+        """
+        values = self._values.get(table, {}).get(locale, ())
+        return sorted([key for key, column in self._columns.get(table, {}).items()
+                       if column >= len(values) or values[column] is None])
+
+    def coverage(self, table="Localizable"):
+        """locale to translated key ratio of `table`
+        """
+        total = len(self._columns.get(table, ()))
+        result = {}
+        for locale, values in self._values.get(table, {}).items():
+            translated = sum([1 for value in values if value is not None])
+            result[locale] = float(translated) / total if total else 1.0
+        return result
+
+
+def _list_app(app_path):
+    names = []
+    for root, dirs, files in os.walk(app_path):
+        relative = os.path.relpath(root, app_path)
+        dirs[:] = [d for d in dirs if not d.endswith(NESTED_BUNDLES)]
+        for name in files:
+            names.append(os.path.normpath(os.path.join(relative, name)).replace(os.path.sep, "/"))
+    return names
+
+
+def load_localizations(app_path, workers=None, batch_size=BATCH_SIZE):
+    """find every string table of an app bundle in one listing pass and decode
+    them, in parallel when there are many
+
+    :param app_path: *.app directory, *.ipa path, or a seekable binary file
+        object of an ipa
+    :param workers: process count, defaults to cpu count, decodes in this
+        process when 1
+    :type  workers: int
+    :rtype: Localizations
+    """
+    items = []
+    if hasattr(app_path, "read") or app_path.rstrip(os.path.sep).endswith(".ipa"):
+        with zipfile.ZipFile(app_path) as zip_file:
+            app_item = _find_ipa_app(zip_file, app_path)
+            names = [name[len(app_item):] for name in zip_file.namelist()
+                     if name.startswith(app_item)]
+            for locale, table, name in _find_tables(names):
+                items.append((locale, table, app_item + name, zip_file.read(app_item + name)))
+    elif app_path.rstrip(os.path.sep).endswith(".app") and os.path.isdir(app_path):
+        for locale, table, name in _find_tables(_list_app(app_path)):
+            items.append((locale, table, os.path.join(app_path, *name.split("/")), None))
+    else:
+        raise ValueError("app_path=%s is invalid" % app_path)
+
+    if workers is None:
+        import multiprocessing
+        workers = multiprocessing.cpu_count()
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    if workers < 2 or len(items) < PARALLEL_MIN_FILES:
+        results = map(_decode_batch, batches)
+    else:
+        from gplist.parallel import _get_context
+        pool = _get_context().Pool(min(workers, len(batches)))
+        try:
+            results = pool.map(_decode_batch, batches)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    localizations = Localizations()
+    for batch, batch_results in zip(batches, results):
+        for (locale, table, path, _), (strings, error) in zip(batch, batch_results):
+            if error is not None:
+                localizations.failed.append((path, error))
+            else:
+                localizations.add(locale, table, strings)
+    return localizations
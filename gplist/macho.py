@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""entitlements and embedded Info.plist of Mach-O executables
+
+only the headers, load commands and the needed blobs are read, so a signed
+executable costs a few KB of I/O however large it is
+"""
+
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+
+from gplist.plist import PlistInfo, InvalidPlistError, DEFAULT_LIMITS, _find_ipa_app
+
+
+FAT_MAGIC = 0xcafebabe
+FAT_MAGIC_64 = 0xcafebabf
+MH_MAGIC = 0xfeedface
+MH_MAGIC_64 = 0xfeedfacf
+MH_CIGAM = 0xcefaedfe
+MH_CIGAM_64 = 0xcffaedfe
+
+LC_SEGMENT = 0x1
+LC_SEGMENT_64 = 0x19
+LC_CODE_SIGNATURE = 0x1d
+
+CSMAGIC_EMBEDDED_SIGNATURE = 0xfade0cc0
+CSMAGIC_EMBEDDED_ENTITLEMENTS = 0xfade7171
+CSSLOT_ENTITLEMENTS = 5
+
+CPU_TYPES = {
+    7: "i386",
+    0x01000007: "x86_64",
+    12: "arm",
+    0x0100000c: "arm64",
+    0x0200000c: "arm64_32",
+}
+
+# fat slice count and load command size sanity limits
+MAX_SLICES = 64
+MAX_COMMANDS_SIZE = 16 << 20
+# members which can't seek are copied to memory up to this size, to disk above
+SPOOL_SIZE = 16 << 20
+
+
+class MachOError(InvalidPlistError):
+    """raised when an executable is not a valid Mach-O or fat binary
+    """
+
+
+class MachOSlice(object):
+    """one architecture of an executable, offsets are relative to the file
+
+    :param offset: slice start in the file
+    :param size: slice size
+    """
+
+    def __init__(self, cputype, offset, size):
+        self.cputype = cputype
+        self.arch = CPU_TYPES.get(cputype, "cpu%s" % cputype)
+        self.offset = offset
+        self.size = size
+        # (offset, size) in the file, None when missing
+        self.code_signature = None
+        self.info_plist = None
+
+    def __repr__(self):
+        return "<MachOSlice %s offset=%s size=%s>" % (self.arch, self.offset, self.size)
+
+
+def _read_exact(fd, offset, size):
+    fd.seek(offset)
+    buf = fd.read(size)
+    if len(buf) != size:
+        raise MachOError("read size=%s at offset=%s truncated to %s" % (size, offset, len(buf)))
+    return buf
+
+
+class MachOFile(object):
+    """Mach-O or fat executable read from a seekable binary file object
+
+    :param fd: file object, an mmap or a zip member
+    :param limits: limits applied to blob sizes and the plists in them
+    :type  limits: PlistLimits
+    """
+
+    def __init__(self, fd, limits=None):
+        self._fd = fd
+        self._limits = limits or DEFAULT_LIMITS
+        self._closer = None
+        self.slices = self._read_slices()
+
+    @classmethod
+    def from_file(cls, file_path, limits=None):
+        """map `file_path` so that only the touched pages are read
+        """
+        fd = open(file_path, "rb")
+        try:
+            mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            # empty files can't be mapped
+            mapped = fd
+        try:
+            macho = cls(mapped, limits=limits)
+        except Exception:
+            mapped.close()
+            fd.close()
+            raise
+        macho._closer = (mapped, fd)
+        return macho
+
+    def close(self):
+        if self._closer:
+            for item in self._closer:
+                item.close()
+            self._closer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _read_slices(self):
+        head = _read_exact(self._fd, 0, 8)
+        magic = struct.unpack(">I", head[:4])[0]
+        if magic not in (FAT_MAGIC, FAT_MAGIC_64):
+            fat_slice = MachOSlice(None, 0, None)
+            self._read_commands(fat_slice)
+            return [fat_slice]
+        count = struct.unpack(">I", head[4:])[0]
+        if count > MAX_SLICES:
+            raise MachOError("fat slice count=%s exceeds %s" % (count, MAX_SLICES))
+        if magic == FAT_MAGIC:
+            arch_format, arch_size = ">iiIII", 20
+        else:
+            arch_format, arch_size = ">iiQQII", 32
+        buf = _read_exact(self._fd, 8, count * arch_size)
+        slices = []
+        for i in range(count):
+            item = struct.unpack(arch_format, buf[i * arch_size:(i + 1) * arch_size])
+            fat_slice = MachOSlice(item[0], item[2], item[3])
+            self._read_commands(fat_slice)
+            slices.append(fat_slice)
+        return slices
+
+    def _read_commands(self, macho_slice):
+        base = macho_slice.offset
+        magic = struct.unpack("<I", _read_exact(self._fd, base, 4))[0]
+        if magic in (MH_MAGIC, MH_MAGIC_64):
+            endian = "<"
+        elif magic in (MH_CIGAM, MH_CIGAM_64):
+            endian = ">"
+        else:
+            raise MachOError("magic=0x%08x at offset=%s is not Mach-O" % (magic, base))
+        is_64 = magic in (MH_MAGIC_64, MH_CIGAM_64)
+        header_size = 32 if is_64 else 28
+        cputype, _, _, ncmds, commands_size = struct.unpack(
+            endian + "iIIII", _read_exact(self._fd, base + 4, 20))
+        if macho_slice.cputype is None:
+            macho_slice.cputype = cputype
+            macho_slice.arch = CPU_TYPES.get(cputype, "cpu%s" % cputype)
+        if commands_size > MAX_COMMANDS_SIZE:
+            raise MachOError("load commands size=%s exceeds %s" % (commands_size, MAX_COMMANDS_SIZE))
+        commands = _read_exact(self._fd, base + header_size, commands_size)
+        position = 0
+        for _ in range(ncmds):
+            if position + 8 > commands_size:
+                raise MachOError("load command at %s out of range %s" % (position, commands_size))
+            cmd, cmd_size = struct.unpack(endian + "II", commands[position:position + 8])
+            if cmd_size < 8 or position + cmd_size > commands_size:
+                raise MachOError("load command size=%s at %s is invalid" % (cmd_size, position))
+            command = commands[position:position + cmd_size]
+            if cmd == LC_CODE_SIGNATURE:
+                if cmd_size < 16:
+                    raise MachOError("code signature command size=%s at %s is invalid" %
+                                     (cmd_size, position))
+                data_offset, data_size = struct.unpack(endian + "II", command[8:16])
+                macho_slice.code_signature = (base + data_offset, data_size)
+            elif cmd in (LC_SEGMENT, LC_SEGMENT_64):
+                self._find_info_plist(macho_slice, command, endian, cmd == LC_SEGMENT_64)
+            position += cmd_size
+
+    def _find_info_plist(self, macho_slice, command, endian, is_64):
+        if command[8:24].rstrip(b"\x00") != b"__TEXT":
+            return
+        if is_64:
+            start, section_size, section_format = 72, 80, endian + "QQI"
+        else:
+            start, section_size, section_format = 56, 68, endian + "III"
+        if len(command) < start:
+            raise MachOError("segment command size=%s is invalid" % len(command))
+        section_count = struct.unpack(endian + "I", command[start - 8:start - 4])[0]
+        if start + section_count * section_size > len(command):
+            raise MachOError("segment sections count=%s out of range %s" %
+                             (section_count, len(command)))
+        for i in range(section_count):
+            section = command[start + i * section_size:start + (i + 1) * section_size]
+            if section[:16].rstrip(b"\x00") == b"__info_plist":
+                _, size, offset = struct.unpack(section_format, section[32:32 + struct.calcsize(
+                    section_format)])
+                macho_slice.info_plist = (macho_slice.offset + offset, size)
+
+    def _get_slice(self, arch):
+        if arch is None:
+            return self.slices[0]
+        for macho_slice in self.slices:
+            if macho_slice.arch == arch:
+                return macho_slice
+        raise ValueError("arch=%s not in %s" % (arch, ", ".join([s.arch for s in self.slices])))
+
+    def entitlements_xml(self, arch=None):
+        """raw entitlements of the code signature, None when unsigned or
+        signed without entitlements
+
+        :param arch: slice architecture name, e.g. "arm64", defaults to the first
+        :rtype: bytes
+        """
+        code_signature = self._get_slice(arch).code_signature
+        if code_signature is None:
+            return None
+        offset, size = code_signature
+        magic, length, count = struct.unpack(">III", _read_exact(self._fd, offset, 12))
+        if magic != CSMAGIC_EMBEDDED_SIGNATURE:
+            raise MachOError("code signature magic=0x%08x is invalid" % magic)
+        if length > size or 12 + count * 8 > length:
+            raise MachOError("code signature length=%s count=%s invalid" % (length, count))
+        index = _read_exact(self._fd, offset + 12, count * 8)
+        for i in range(count):
+            slot, blob_offset = struct.unpack(">II", index[i * 8:i * 8 + 8])
+            if slot != CSSLOT_ENTITLEMENTS:
+                continue
+            if blob_offset + 8 > length:
+                raise MachOError("entitlements offset=%s out of range %s" % (blob_offset, length))
+            blob_magic, blob_length = struct.unpack(
+                ">II", _read_exact(self._fd, offset + blob_offset, 8))
+            if blob_magic != CSMAGIC_EMBEDDED_ENTITLEMENTS:
+                continue
+            if blob_length < 8 or blob_offset + blob_length > length:
+                raise MachOError("entitlements length=%s invalid" % blob_length)
+            self._limits.check("max_bytes", blob_length - 8)
+            return _read_exact(self._fd, offset + blob_offset + 8, blob_length - 8)
+        return None
+
+    def entitlements(self, arch=None):
+        """
+        :rtype: PlistInfo
+        """
+        xml = self.entitlements_xml(arch)
+        if xml is None:
+            return None
+        return PlistInfo(xml, limits=self._limits)
+
+    def info_plist(self, arch=None):
+        """plist embedded in the `__TEXT,__info_plist` section, which command
+        line tools have instead of a bundle Info.plist
+
+        :rtype: PlistInfo
+        """
+        section = self._get_slice(arch).info_plist
+        if section is None:
+            return None
+        self._limits.check("max_bytes", section[1])
+        return PlistInfo(_read_exact(self._fd, section[0], section[1]), limits=self._limits)
+
+
+class _MemberWindow(object):
+    """seekable view on a stored zip member, read from the archive directly
+    """
+
+    def __init__(self, fd, start, size):
+        self._fd = fd
+        self._start = start
+        self._size = size
+        self._position = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._size
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._size - self._position
+        size = max(0, min(size, self._size - self._position))
+        self._fd.seek(self._start + self._position)
+        buf = self._fd.read(size)
+        self._position += len(buf)
+        return buf
+
+
+def _seekable(member):
+    """`member` when it can seek, otherwise a temporary copy of it, e.g. of
+    deflated zip members on python 2
+    """
+    if getattr(member, "seekable", None) is not None and member.seekable():
+        return member
+    copy = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    shutil.copyfileobj(member, copy)
+    member.close()
+    copy.seek(0)
+    return copy
+
+
+def _open_member(zip_file, info, fd):
+    if info.compress_type != zipfile.ZIP_STORED:
+        # deflated members can only be read forward, skipped bytes are inflated
+        return _seekable(zip_file.open(info))
+    header = _read_exact(fd, info.header_offset, 30)
+    name_size, extra_size = struct.unpack("<HH", header[26:30])
+    return _MemberWindow(fd, info.header_offset + 30 + name_size + extra_size, info.file_size)
+
+
+def read_app_entitlements(app_path, arch=None, limits=None):
+    """entitlements of the main executable of an app
+
+    :param app_path: *.app directory, *.ipa path, or a seekable binary file
+        object of an ipa such as a `gplist.rangeio.RangeReader`
+    :param arch: slice architecture name, defaults to the first slice
+    :rtype: PlistInfo
+    """
+    if hasattr(app_path, "read") or app_path.rstrip(os.path.sep).endswith(".ipa"):
+        fd = app_path if hasattr(app_path, "read") else open(app_path, "rb")
+        try:
+            with zipfile.ZipFile(fd) as zip_file:
+                app_item = _find_ipa_app(zip_file, app_path)
+                info = PlistInfo(zip_file.read(app_item + "Info.plist"), limits=limits)
+                member = zip_file.getinfo(app_item + info["CFBundleExecutable"])
+                return MachOFile(_open_member(zip_file, member, fd), limits=limits).entitlements(arch)
+        finally:
+            if fd is not app_path:
+                fd.close()
+    elif app_path.rstrip(os.path.sep).endswith(".app"):
+        info = PlistInfo.from_file(os.path.join(app_path, "Info.plist"), limits=limits)
+        with MachOFile.from_file(os.path.join(app_path, info["CFBundleExecutable"]),
+                                 limits=limits) as macho:
+            return macho.entitlements(arch)
+    raise ValueError("app_path=%s is invalid" % app_path)
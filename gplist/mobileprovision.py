@@ -3,8 +3,12 @@
 """
 
 from datetime import datetime
+from gplist.compress import READ_ERRORS, read_file, strip_extension
 from gplist.plist import PlistInfo, PY2
 import binascii
+import json
+import os
+from xml.parsers.expat import ExpatError
 
 from cryptography import x509
 from cryptography.hazmat import backends
@@ -81,20 +85,60 @@ class Cert(object):
         return now < self.invalid_before or now > self.invalid_after
 
 
+class _DeviceList(list):
+    """`ProvisionedDevices` keeping a set of its udids for constant time
+    lookups, the set is dropped by every change to the list
+    """
+
+    def __init__(self, items=()):
+        super(_DeviceList, self).__init__(items)
+        self._set = None
+
+    def as_set(self):
+        if self._set is None:
+            self._set = frozenset(self)
+        return self._set
+
+
+def _invalidating(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *args):
+        self._set = None
+        return method(self, *args)
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in ("__setitem__", "__delitem__", "__setslice__", "__delslice__", "__iadd__",
+              "__imul__", "append", "extend", "insert", "pop", "remove", "clear"):
+    if hasattr(list, _name):
+        setattr(_DeviceList, _name, _invalidating(_name))
+
+
 class MobileProvision(PlistInfo):
 
-    def __init__(self, binary):
-        super(MobileProvision, self).__init__(binary)
+    def __init__(self, binary, limits=None, keys=None):
+        super(MobileProvision, self).__init__(binary, limits=limits, keys=keys)
         self._certs = None
+        devices = self.get("ProvisionedDevices")
+        if isinstance(devices, list):
+            self["ProvisionedDevices"] = _DeviceList(devices)
 
     @classmethod
-    def from_file(cls, provision_file):
-        with open(provision_file, "rb") as fd:
-            content = fd.read()
+    def from_file(cls, provision_file, limits=None, compression="auto", keys=None):
+        """
+        :param compression: "gzip", "bz2", "xz", None, or "auto" to detect it
+            by magic bytes
+        :type  compression: str
+        :param keys: decode only these top level keys, e.g. ["Name", "UUID"]
+        :type  keys: list
+        """
+        content = read_file(provision_file, limits=limits, compression=compression)
         start_pos = content.find(b"<?xml")
         end_pos = content.find(b"</plist>") + len(b"</plist>")
         plist_buf = content[start_pos:end_pos]
-        return cls(plist_buf)
+        return cls(plist_buf, limits=limits, keys=keys)
 
     @property
     def certs(self):
@@ -110,8 +154,148 @@ class MobileProvision(PlistInfo):
     def is_expired(self):
         return datetime.utcnow() > self["ExpirationDate"]
 
+    @property
+    def udids(self):
+        """set of provisioned device udids, kept until `ProvisionedDevices` is
+        changed, use `ProvisionIndex` to check many udids against many profiles
+        """
+        devices = self.get("ProvisionedDevices", [])
+        if isinstance(devices, _DeviceList):
+            return devices.as_set()
+        # a list assigned after parsing may be changed behind our back
+        return frozenset(devices)
+
     def has_udid(self, udid):
         if "ProvisionsAllDevices" in self:
             return self["ProvisionsAllDevices"]
         else:
-            return udid in self["ProvisionedDevices"]
+            devices = self.get("ProvisionedDevices", [])
+            if isinstance(devices, _DeviceList):
+                return udid in devices.as_set()
+            return udid in devices
+
+
+PROVISION_EXTENSIONS = (".mobileprovision", ".provisionprofile")
+
+
+def find_provisions(paths):
+    """expand directories in `paths` to the provision files below them,
+    compressed ones included
+    """
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if strip_extension(name).endswith(PROVISION_EXTENSIONS):
+                        result.append(os.path.join(root, name))
+        else:
+            result.append(path)
+    return result
+
+
+class ProvisionIndex(object):
+    """inverted index from udid to the provision files containing it
+
+    entries remember the mtime and size of their file, so `update` only parses
+    new or changed profiles, and the index can be persisted with `save`
+    """
+
+    VERSION = 1
+
+    def __init__(self):
+        self._profiles = {}
+        self._udids = {}
+        self._all_devices = set()
+
+    def __len__(self):
+        return len(self._profiles)
+
+    @classmethod
+    def load(cls, index_file):
+        index = cls()
+        if not os.path.isfile(index_file):
+            return index
+        with open(index_file) as fd:
+            content = json.load(fd)
+        if content.get("version") != cls.VERSION:
+            return index
+        for path, entry in content["profiles"].items():
+            index._add(path, entry)
+        return index
+
+    def save(self, index_file):
+        temp_file = index_file + ".tmp"
+        with open(temp_file, "w") as fd:
+            json.dump({"version": self.VERSION, "profiles": self._profiles}, fd)
+        os.rename(temp_file, index_file)
+
+    def _add(self, path, entry):
+        self._remove(path)
+        self._profiles[path] = entry
+        if entry["all_devices"]:
+            self._all_devices.add(path)
+        for udid in entry["udids"]:
+            self._udids.setdefault(udid, set()).add(path)
+
+    def _remove(self, path):
+        entry = self._profiles.pop(path, None)
+        if entry is None:
+            return
+        self._all_devices.discard(path)
+        for udid in entry["udids"]:
+            paths = self._udids.get(udid)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self._udids[udid]
+
+    def update(self, paths, prune=True):
+        """index new or changed provision files
+
+        :param paths: provision files or directories containing them
+        :type  paths: list
+        :param prune: drop indexed profiles not found in `paths`
+        :type  prune: bool
+        :return: paths failed to parse
+        :rtype: list
+        """
+        found = set()
+        failed = []
+        for path in find_provisions(paths):
+            path = os.path.abspath(path)
+            found.add(path)
+            try:
+                stat = os.stat(path)
+                entry = self._profiles.get(path)
+                if entry is not None and entry["mtime"] == stat.st_mtime and \
+                        entry["size"] == stat.st_size:
+                    continue
+                m = MobileProvision.from_file(path)
+            except (ValueError, ExpatError) + READ_ERRORS:
+                # deleted since listed, unreadable, corrupt or badly compressed
+                self._remove(path)
+                failed.append(path)
+                continue
+            # same semantics as `has_udid`, ProvisionsAllDevices wins when present
+            if "ProvisionsAllDevices" in m:
+                all_devices, udids = bool(m["ProvisionsAllDevices"]), []
+            else:
+                all_devices, udids = False, list(m.get("ProvisionedDevices", []))
+            self._add(path, {
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+                "all_devices": all_devices,
+                "udids": udids})
+        if prune:
+            for path in list(self._profiles):
+                if path not in found:
+                    self._remove(path)
+        return failed
+
+    def lookup(self, udid):
+        """
+        :return: sorted provision files containing `udid`
+        :rtype: list
+        """
+        return sorted(self._udids.get(udid, set()) | self._all_devices)
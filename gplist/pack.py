@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""packs of many small plists in one file, read by key through a memory map
+
+layout, big-endian:
+
+    header      b"gppack00"
+    payloads    binary plists, identical ones are stored once
+    keys        utf-8 keys, sorted
+    records     (key offset Q, key size I, payload offset Q, payload size I,
+                 sha1 20s) per key, sorted by key
+    trailer     (b"gppack00", keys offset Q, records offset Q, count Q)
+
+a lookup is a binary search over the fixed size records of the mapping, so
+it costs no system call whatever the pack size
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import zipfile
+
+from gplist.plist import PlistInfo
+
+
+MAGIC = b"gppack00"
+RECORD_FORMAT = ">QIQI20s"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+TRAILER_FORMAT = ">8sQQQ"
+TRAILER_SIZE = struct.calcsize(TRAILER_FORMAT)
+PACK_EXTENSIONS = (".plist", ".strings", ".stringsdict")
+# files per worker task, and the file count below which encoding is serial
+BATCH_SIZE = 256
+PARALLEL_MIN_FILES = 64
+
+
+class PackError(ValueError):
+    """raised when a pack file is malformed
+    """
+
+
+def encode_payload(data):
+    """binary plist content of a binary plist, xml plist or text .strings
+    file, binary content is kept as is
+    """
+    if data.startswith(b"bplist00"):
+        return data
+    from gplist.localization import decode_table
+    return PlistInfo(decode_table(data)).to_binary()
+
+
+def _encode_key(key):
+    return key if isinstance(key, bytes) else key.encode("utf-8")
+
+
+class PlistPack(object):
+    """read only pack mapped in memory
+
+    :param file_path: pack file path
+    """
+
+    def __init__(self, file_path):
+        with open(file_path, "rb") as fd:
+            try:
+                self._data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, mmap.error):
+                raise PackError("file=%s is not a plist pack" % file_path)
+        if len(self._data) < len(MAGIC) + TRAILER_SIZE or self._data[:len(MAGIC)] != MAGIC:
+            self._data.close()
+            raise PackError("file=%s is not a plist pack" % file_path)
+        magic, self._keys_offset, self._records_offset, self._count = struct.unpack(
+            TRAILER_FORMAT, self._data[-TRAILER_SIZE:])
+        records_end = self._records_offset + self._count * RECORD_SIZE
+        if magic != MAGIC or not len(MAGIC) <= self._keys_offset <= self._records_offset or \
+                records_end != len(self._data) - TRAILER_SIZE:
+            self._data.close()
+            raise PackError("file=%s trailer is invalid" % file_path)
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, index):
+        return struct.unpack_from(RECORD_FORMAT, self._data,
+                                  self._records_offset + index * RECORD_SIZE)
+
+    def _key(self, index):
+        key_offset, key_size = struct.unpack_from(">QI", self._data,
+                                                  self._records_offset + index * RECORD_SIZE)
+        return self._data[key_offset:key_offset + key_size]
+
+    def _bisect(self, key):
+        """index of the first record whose key isn't lower than `key`
+        """
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find(self, key):
+        key = _encode_key(key)
+        index = self._bisect(key)
+        if index < self._count and self._key(index) == key:
+            return self._record(index)
+        return None
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def keys(self, prefix=""):
+        """sorted keys starting with `prefix`
+        """
+        prefix = _encode_key(prefix)
+        for index in range(self._bisect(prefix), self._count):
+            key = self._key(index)
+            if not key.startswith(prefix):
+                break
+            yield key.decode("utf-8")
+
+    def raw(self, key):
+        """binary plist content of `key` as a memoryview on the mapping,
+        None when missing, views must be released before `close`
+        """
+        record = self._find(key)
+        if record is None:
+            return None
+        return memoryview(self._data)[record[2]:record[2] + record[3]]
+
+    def get(self, key, default=None, keys=None, limits=None):
+        """
+        :param keys: decode only these top level keys, see `PlistInfo`
+        :type  keys: list
+        :rtype: PlistInfo
+        """
+        record = self._find(key)
+        if record is None:
+            return default
+        data = self._data[record[2]:record[2] + record[3]]
+        if keys is None:
+            return PlistInfo(data, limits=limits)
+        return PlistInfo(data, limits=limits, keys=keys)
+
+    def __getitem__(self, key):
+        p = self.get(key)
+        if p is None:
+            raise KeyError(key)
+        return p
+
+
+class PackBuilder(object):
+    """writes a pack, payloads are streamed to the file as they are added and
+    the index is written on `close`
+
+    when appending, new payloads are written after the old trailer so the pack
+    stays valid until `close`, and it is truncated back to its old size when
+    the `with` block fails. The old index is left as unused space
+
+    :param file_path: pack file path
+    :param append: add to an existing pack, its keys are kept unless added again
+    :type  append: bool
+    """
+
+    def __init__(self, file_path, append=False):
+        # key: (payload offset, payload size, sha1)
+        self._entries = {}
+        # sha1: (payload offset, payload size)
+        self._payloads = {}
+        # size to truncate back to when appending fails
+        self._old_size = None
+        if append and os.path.exists(file_path):
+            with PlistPack(file_path) as pack:
+                for index in range(len(pack)):
+                    key_offset, key_size, offset, size, digest = pack._record(index)
+                    self._entries[pack._key(index)] = (offset, size, digest)
+                    self._payloads[digest] = (offset, size)
+                self._old_size = len(pack._data)
+            self._fd = open(file_path, "r+b")
+            self._fd.seek(self._old_size)
+        else:
+            self._fd = open(file_path, "wb")
+            self._fd.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            if self._old_size is not None:
+                self._fd.truncate(self._old_size)
+            self._fd.close()
+
+    def add(self, key, value):
+        """
+        :param value: binary plist, xml plist or .strings content, or a dict
+        :type  value: bytes or dict
+        """
+        if isinstance(value, dict):
+            value = PlistInfo(value).to_binary()
+        else:
+            value = encode_payload(value)
+        self.add_payload(key, value, hashlib.sha1(value).digest())
+
+    def add_payload(self, key, payload, digest):
+        position = self._payloads.get(digest)
+        if position is None:
+            position = self._payloads[digest] = (self._fd.tell(), len(payload))
+            self._fd.write(payload)
+        self._entries[_encode_key(key)] = position + (digest,)
+
+    def close(self):
+        keys = sorted(self._entries)
+        keys_offset = self._fd.tell()
+        records = []
+        key_offset = keys_offset
+        for key in keys:
+            offset, size, digest = self._entries[key]
+            records.append(struct.pack(RECORD_FORMAT, key_offset, len(key), offset, size, digest))
+            key_offset += len(key)
+        self._fd.write(b"".join(keys))
+        self._fd.write(b"".join(records))
+        self._fd.write(struct.pack(TRAILER_FORMAT, MAGIC, keys_offset, key_offset, len(keys)))
+        self._fd.truncate()
+        self._fd.close()
+
+
+def _encode_batch(items):
+    """encode (key, path, content) items, files are read when content is
+    None, returns (key, payload, sha1, error) tuples
+    """
+    results = []
+    for key, path, data in items:
+        try:
+            if data is None:
+                with open(path, "rb") as fd:
+                    data = fd.read()
+            payload = encode_payload(data)
+            results.append((key, payload, hashlib.sha1(payload).digest(), None))
+        except Exception as e:
+            results.append((key, None, None, "%s: %s" % (type(e).__name__, e)))
+    return results
+
+
+def _list_source(source):
+    """yield (key, path, content) of the plist files of a directory or ipa,
+    keys are relative to the parent of `source`
+    """
+    source = source.rstrip(os.path.sep)
+    base = os.path.basename(source)
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            relative = os.path.relpath(root, source)
+            for name in sorted(files):
+                if name.endswith(PACK_EXTENSIONS):
+                    key = os.path.normpath(os.path.join(base, relative, name))
+                    yield key.replace(os.path.sep, "/"), os.path.join(root, name), None
+    elif source.endswith(".ipa"):
+        with zipfile.ZipFile(source) as zip_file:
+            for info in zip_file.infolist():
+                if info.filename.endswith(PACK_EXTENSIONS):
+                    yield base + "/" + info.filename, source, zip_file.read(info)
+    else:
+        raise ValueError("source=%s is neither a directory nor an ipa" % source)
+
+
+def build_pack(file_path, sources, append=False, workers=None, batch_size=BATCH_SIZE):
+    """pack the .plist, .strings and .stringsdict files of directories and
+    ipas, keyed by their path from the source parent, e.g.
+    "FooApp.ipa/Payload/FooApp.app/Info.plist"
+
+    :param sources: directory or ipa paths
+    :type  sources: list
+    :param append: add to an existing pack
+    :type  append: bool
+    :param workers: process count for encoding, defaults to cpu count
+    :type  workers: int
+    :return: [(key, error)] of the files which couldn't be encoded
+    :rtype: list
+    """
+    items = []
+    for source in sources:
+        items.extend(_list_source(source))
+    if workers is None:
+        import multiprocessing
+        workers = multiprocessing.cpu_count()
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    failed = []
+    pool = None
+    if workers < 2 or len(items) < PARALLEL_MIN_FILES:
+        results = map(_encode_batch, batches)
+    else:
+        from gplist.parallel import _get_context
+        pool = _get_context().Pool(min(workers, len(batches)))
+        results = pool.imap(_encode_batch, batches)
+    try:
+        with PackBuilder(file_path, append=append) as builder:
+            for batch_results in results:
+                for key, payload, digest, error in batch_results:
+                    if error is not None:
+                        failed.append((key, error))
+                    else:
+                        builder.add_payload(key, payload, digest)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return failed
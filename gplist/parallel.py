@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""parallel decoding of huge binary plists
+"""
+
+from collections import OrderedDict
+import mmap
+import multiprocessing
+import os
+
+from gplist.plist import PlistInfo
+
+
+# benchmarks/bench_parallel.py breaks even at about 25 MB on a single core
+# host, re-tune it there on multi-core hosts
+PARALLEL_MIN_SIZE = 24 << 20
+CHUNKS_PER_WORKER = 4
+
+_reader = None
+
+
+def _open_reader(plist_file, limits=None, packed_arrays=False):
+    """map `plist_file` and read its trailer and offset table
+    """
+    reader = PlistInfo({}, limits=limits, packed_arrays=packed_arrays)
+    with open(plist_file, "rb") as fd:
+        reader._binary_data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    reader._path = plist_file
+    reader._top = reader._read_trailer()
+    return reader
+
+
+def _init_worker(plist_file, limits, packed_arrays):
+    # with fork the parent reader, mapping and offset table are inherited
+    global _reader
+    if _reader is None or _reader._path != plist_file:
+        _reader = _open_reader(plist_file, limits, packed_arrays)
+
+
+def _decode_range(refs):
+    return [_reader._read_object(ref, 1) for ref in refs]
+
+
+def _split(refs, chunk_count):
+    chunk_size = max(1, -(-len(refs) // chunk_count))
+    return [refs[i:i + chunk_size] for i in range(0, len(refs), chunk_size)]
+
+
+def _decode_parallel(reader, refs, workers, init_args):
+    global _reader
+    _reader = reader
+    try:
+        pool = _get_context().Pool(workers, _init_worker, init_args)
+        try:
+            values = []
+            for chunk_values in pool.imap(_decode_range,
+                                          _split(refs, workers * CHUNKS_PER_WORKER)):
+                values.extend(chunk_values)
+            return values
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        _reader = None
+
+
+def _get_context():
+    if hasattr(multiprocessing, "get_context"):
+        methods = multiprocessing.get_all_start_methods()
+        if "fork" in methods:
+            return multiprocessing.get_context("fork")
+        return multiprocessing.get_context()
+    return multiprocessing
+
+
+def from_file_parallel(plist_file, workers=None, min_size=PARALLEL_MIN_SIZE,
+                       limits=None, packed_arrays=False, cls=PlistInfo):
+    """decode a binary plist with a pool of worker processes
+
+    the file is mapped once and the values of the top level dict, or the items
+    of its largest array when there are too few values, are split into ranges
+    decoded by workers attached to the same file mapping. Inputs smaller than `min_size`, xml plists,
+    compressed files and single worker setups are decoded serially with `cls.from_file`
+
+    :param plist_file: plist file path
+    :type  plist_file: str
+    :param workers: worker process count, defaults to cpu count
+    :type  workers: int
+    :param min_size: minimal file size in bytes to decode in parallel
+    :type  min_size: int
+    :rtype: PlistInfo
+    """
+    if not os.path.exists(plist_file):
+        raise ValueError("plist_info=%s is not valid" % plist_file)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    file_size = os.path.getsize(plist_file)
+    if limits is not None:
+        limits.check("max_bytes", file_size)
+    with open(plist_file, "rb") as fd:
+        is_binary = fd.read(8) == b"bplist00"
+    if not is_binary or workers < 2 or file_size < min_size:
+        return cls.from_file(plist_file, limits=limits, packed_arrays=packed_arrays)
+
+    reader = _open_reader(plist_file, limits, packed_arrays)
+    try:
+        top_refs = reader._read_container_refs(reader._top)
+        if top_refs is None or top_refs[0] is None:
+            raise ValueError("top object of %s is not a dict" % plist_file)
+        key_refs, value_refs = top_refs
+        keys = [reader._read_object(ref, 1) for ref in key_refs]
+
+        # too few top level values to share out, split the largest array instead
+        split_index = None
+        split_refs = value_refs
+        if len(value_refs) < workers * CHUNKS_PER_WORKER and not packed_arrays:
+            for i, ref in enumerate(value_refs):
+                refs = reader._read_container_refs(ref)
+                if refs is not None and refs[0] is None and len(refs[1]) > len(split_refs):
+                    split_index, split_refs = i, refs[1]
+
+        if split_index is None and len(value_refs) < workers * CHUNKS_PER_WORKER:
+            split_values = [reader._read_object(ref, 1) for ref in value_refs]
+        else:
+            split_values = _decode_parallel(reader, split_refs, workers,
+                                            (plist_file, limits, packed_arrays))
+
+        if split_index is None:
+            values = split_values
+        else:
+            values = []
+            for i, ref in enumerate(value_refs):
+                if i == split_index:
+                    values.append(split_values)
+                else:
+                    values.append(reader._read_object(ref, 1))
+        p = cls(OrderedDict(zip(keys, values)))
+        p._format = "binary"
+        p.ref_size = reader.ref_size
+        p.obj_count = reader.obj_count
+        return p
+    finally:
+        reader._binary_data.close()
@@ -2,11 +2,15 @@
 """plist
 """
 from collections import OrderedDict
-from xml.dom.expatbuilder import parseString
+from xml.dom.expatbuilder import ExpatBuilder, parse, parseString
 from xml.dom.minidom import Element, Document, DocumentType
+from xml.dom.NodeFilter import NodeFilter
+from xml.dom.xmlbuilder import DOMBuilderFilter, Options
+import array
 import base64
 import binascii
 import datetime
+import io
 import json
 import os
 import shutil
@@ -15,6 +19,7 @@ import sys
 import tempfile
 import zipfile
 
+from gplist.compress import LimitedReader, detect_compression, open_file
 
 if sys.version_info[0] == 2:
     PY2 = True
@@ -27,6 +32,28 @@ else:
 
 
 STRUCT_SIZE_MAP = {1: "B", 2: "H", 4: "I", 8: "q", 16: "Q"}
+UID_STRUCT_MAP = {1: "B", 2: "H", 4: "I", 8: "Q"}
+INT_TYPECODE = "l" if PY2 else "q"
+PACKED_INT_TOKENS = {0x10: ">B", 0x11: ">H", 0x12: ">I", 0x13: ">q"}
+PACKED_REAL_TOKENS = {0x22: ">f", 0x23: ">d"}
+PACKED_MIN_LENGTH = 16
+
+
+def get_numpy():
+    """import numpy lazily, returns None when it is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def is_packed_array(value):
+    if isinstance(value, array.array):
+        return True
+    numpy = sys.modules.get("numpy")
+    return numpy is not None and isinstance(value, numpy.ndarray)
 
 
 def unzip(file_path, dir_path, members=None):
@@ -41,13 +68,92 @@ def unzip(file_path, dir_path, members=None):
         temp_file.close()
 
 
+def _find_ipa_app(zip_file, ipa_file):
+    for item in zip_file.namelist():
+        if item[:-1].endswith(".app"):
+            return item
+    else:
+        raise RuntimeError("no .app directory found in %s" % ipa_file)
+
+
 def get_ipa_app(ipa_file):
+    """
+    :param ipa_file: ipa path or a seekable binary file object
+    """
     with zipfile.ZipFile(ipa_file) as fd:
-        for item in fd.namelist():
-            if item[:-1].endswith(".app"):
-                return item
-        else:
-            raise RuntimeError("no .app directory found in %s" % ipa_file)
+        return _find_ipa_app(fd, ipa_file)
+
+
+class InvalidPlistError(ValueError):
+    """raised when plist data is malformed
+    """
+
+
+class PlistLimitError(InvalidPlistError):
+    """raised when plist data exceeds the configured `PlistLimits`
+    """
+
+
+class PlistLimits(object):
+    """resource limits applied while parsing untrusted plist data
+
+    every limit defaults to None which means unlimited, except `max_depth`
+    which is kept below the interpreter recursion limit
+    """
+
+    def __init__(self, max_bytes=None, max_objects=None, max_depth=512,
+                 max_container_length=None, max_string_size=None,
+                 max_data_size=None):
+        self.max_bytes = max_bytes
+        self.max_objects = max_objects
+        self.max_depth = max_depth
+        self.max_container_length = max_container_length
+        self.max_string_size = max_string_size
+        self.max_data_size = max_data_size
+
+    def check(self, name, value):
+        limit = getattr(self, name)
+        if limit is not None and value > limit:
+            raise PlistLimitError("%s=%s exceeds limit %s" % (name, value, limit))
+
+
+DEFAULT_LIMITS = PlistLimits()
+
+
+class _TopKeysFilter(DOMBuilderFilter):
+    """build only the wanted entries of the top dict, the others are dropped
+    before their content is collected, and stop the parser once every wanted
+    key is read
+    """
+
+    whatToShow = NodeFilter.SHOW_ELEMENT
+
+    def __init__(self, keys):
+        self._remaining = set(keys)
+        self._wanted = False
+
+    def _is_top_entry(self, element):
+        parent = element.parentNode
+        return parent.nodeName == "dict" and \
+            parent.parentNode is parent.ownerDocument.documentElement
+
+    def startContainer(self, element):
+        if element.nodeName == "key" or self._wanted or not self._is_top_entry(element):
+            return self.FILTER_ACCEPT
+        return self.FILTER_REJECT
+
+    def acceptNode(self, element):
+        if not self._is_top_entry(element):
+            return self.FILTER_ACCEPT
+        if element.nodeName == "key":
+            key = element.childNodes[0].nodeValue if element.childNodes else ""
+            self._wanted = key in self._remaining
+            self._remaining.discard(key)
+            return self.FILTER_ACCEPT if self._wanted else self.FILTER_REJECT
+        if self._wanted and not self._remaining:
+            return self.FILTER_INTERRUPT
+        self._wanted = False
+        return self.FILTER_ACCEPT
 
 
 class UID(int):
@@ -62,12 +168,53 @@ class UID(int):
     __repr__ = __str__
 
 
+class PackedArrayElement(Element):
+    """`<array>` element rendering a packed numeric array in bulk instead of
+    holding one DOM node per item
+    """
+
+    CHUNK_SIZE = 4096
+
+    def __init__(self, values):
+        Element.__init__(self, "array")
+        self.values = values
+        if hasattr(values, "dtype"):
+            is_real = values.dtype.kind == "f"
+        else:
+            is_real = values.typecode in "fd"
+        if is_real:
+            self.item_tag = "real"
+        else:
+            self.item_tag = "integer"
+
+    def writexml(self, writer, indent="", addindent="", newl=""):
+        if len(self.values) == 0:
+            writer.write("%s<array/>%s" % (indent, newl))
+            return
+        writer.write("%s<array>%s" % (indent, newl))
+        template = "%s%s<%s>%%s</%s>%s" % (indent, addindent, self.item_tag,
+                                           self.item_tag, newl)
+        for start in range(0, len(self.values), self.CHUNK_SIZE):
+            chunk = self.values[start:start + self.CHUNK_SIZE].tolist()
+            writer.write("".join([template % str(v) for v in chunk]))
+        writer.write("%s</array>%s" % (indent, newl))
+
+
 class Data(str):
 
     def __init__(self, val):
         super(Data, self).__init__()
         self._raw = None
 
+    @classmethod
+    def from_raw(cls, raw):
+        data = base64.b64encode(raw)
+        if not PY2:
+            data = data.decode("ascii")
+        data = cls(data)
+        data._raw = raw
+        return data
+
     @property
     def raw(self):
         if self._raw is None:
@@ -78,18 +225,97 @@ class Data(str):
         return self._raw
 
 
+def _unpickle_plist(cls, data, packed_arrays, fmt):
+    if packed_arrays:
+        p = cls(data, packed_arrays=packed_arrays)
+    else:
+        p = cls(data)
+    p._format = fmt
+    return p
+
+
 class PlistInfo(OrderedDict):
 
-    def __init__(self, data):
+    def __init__(self, data, limits=None, packed_arrays=False, release=True, keys=None):
+        """
+        :param data: raw plist content, a dict, or a binary file object, xml
+            read from a file object is parsed as it is read
+        :type  data: bytes or dict or file
+        :param limits: resource limits for untrusted data
+        :type  limits: PlistLimits
+        :param packed_arrays: decode homogeneous int/real arrays into
+            `array.array` ("array"), `numpy.ndarray` ("numpy") or numpy when
+            installed (True)
+        :type  packed_arrays: bool or str
+        :param release: drop the source content and parse state once decoded,
+            see `release`
+        :type  release: bool
+        :param keys: decode only these top level keys and their values, xml
+            read from a file object stops being read once all of them are found
+        :type  keys: list
+        """
         self._objs = OrderedDict()
+        self._format = None
+        self._keys = None if keys is None else frozenset(keys)
+        self._limits = limits or DEFAULT_LIMITS
+        if packed_arrays is True:
+            packed_arrays = "numpy" if get_numpy() else "array"
+        elif packed_arrays == "numpy" and get_numpy() is None:
+            raise ValueError("packed_arrays=numpy requires numpy installed")
+        self._packed_arrays = packed_arrays
         if isinstance(data, bytes_type):
+            self._limits.check("max_bytes", len(data))
             self._binary_data = data
+            self._top = 0
             self._parse()
-            super(PlistInfo, self).__init__(self._objs[0])
+            super(PlistInfo, self).__init__(self._get_top())
+            if release:
+                self.release()
         elif isinstance(data, dict):
             super(PlistInfo, self).__init__(data)
+        elif hasattr(data, "read"):
+            head = data.read(32)
+            reader = LimitedReader(head, data, self._limits)
+            self._binary_data = head
+            self._top = 0
+            if self._get_fmt() == "xml":
+                self._xml_stream = reader
+            else:
+                self._binary_data = reader.read()
+            self._parse()
+            self._xml_stream = None
+            super(PlistInfo, self).__init__(self._get_top())
+            if release:
+                self.release()
         else:
-            raise TypeError("data=%s didn't match bytes or dict type" % data)
+            raise TypeError("data=%s didn't match bytes, dict or file type" % data)
+
+    def _get_top(self):
+        top = self._objs[self._top]
+        if not isinstance(top, dict):
+            raise InvalidPlistError("top object type=%s is not a dict" % type(top).__name__)
+        return top
+
+    def release(self):
+        """drop the source content, the object index to value map and the
+        offset table kept from parsing, which otherwise about double the
+        memory of a parsed plist. `format`, `ref_size` and `obj_count` stay
+        available
+        """
+        if getattr(self, "_binary_data", None) is not None and self._format is None:
+            self._format = self._get_fmt()
+        self._binary_data = None
+        self._objs = OrderedDict()
+        for name in ("obj_offsets", "_offsets_array", "_reading", "_xml_stream"):
+            self.__dict__.pop(name, None)
+
+    def __reduce__(self):
+        # pickled as compact binary plist content instead of the dict items
+        # plus every attribute
+        from gplist.writer import write_binary
+        fd = io.BytesIO()
+        write_binary(self, fd)
+        return _unpickle_plist, (type(self), fd.getvalue(), self._packed_arrays, self._format)
 
     def __eq__(self, other):
         return dict.__eq__(self, other)
@@ -102,19 +328,54 @@ class PlistInfo(OrderedDict):
 
     @property
     def format(self):
-        return self._get_fmt()
+        return self._format or self._get_fmt()
 
     @classmethod
-    def from_file(cls, plist_file):
+    def from_file(cls, plist_file, limits=None, packed_arrays=False, compression="auto",
+                  keys=None):
+        """
+        :param compression: "gzip", "bz2", "xz", None, or "auto" to detect it
+            by magic bytes, compressed content is decompressed as it is parsed
+        :type  compression: str
+        :param keys: decode only these top level keys, xml files are read up to
+            the last of them
+        :type  keys: list
+        """
         if not os.path.exists(plist_file):
             raise ValueError("plist_info=%s is not valid" % plist_file)
-        with open(plist_file, "rb") as fd:
-            return cls(fd.read())
+        if compression == "auto":
+            compression = detect_compression(plist_file)
+        if compression is None and keys is None:
+            if limits is not None:
+                limits.check("max_bytes", os.path.getsize(plist_file))
+            with open(plist_file, "rb") as fd:
+                return cls(fd.read(), limits=limits, packed_arrays=packed_arrays)
+        with open_file(plist_file, "rb", compression) as fd:
+            if keys is None:
+                return cls(fd, limits=limits, packed_arrays=packed_arrays)
+            return cls(fd, limits=limits, packed_arrays=packed_arrays, keys=keys)
 
     @classmethod
-    def from_app(cls, app_path):
+    def from_app(cls, app_path, limits=None, packed_arrays=False, keys=None):
         """from a *.ipa or *.app file
+
+        :param app_path: app path, ipa path, or a seekable binary file object of
+            an ipa, e.g. a `gplist.rangeio.RangeReader`. Only the zip central
+            directory and the Info.plist member of a file object are read
+        :param keys: decode only these top level keys
+        :type  keys: list
         """
+        if hasattr(app_path, "read"):
+            with zipfile.ZipFile(app_path) as zip_file:
+                plist_item = _find_ipa_app(zip_file, app_path) + "Info.plist"
+                try:
+                    info = zip_file.getinfo(plist_item)
+                except KeyError:
+                    raise RuntimeError("plist_item=%s not found" % plist_item)
+                if limits is not None:
+                    limits.check("max_bytes", info.file_size)
+                return cls(zip_file.read(info), limits=limits,
+                           packed_arrays=packed_arrays, keys=keys)
         if not os.path.exists(app_path):
             raise ValueError("app_path=%s not found" % app_path)
         app_path = app_path.rstrip(os.path.sep)
@@ -127,7 +388,8 @@ class PlistInfo(OrderedDict):
                 plist_file = os.path.join(dir_path, plist_item)
                 if not os.path.isfile(plist_file):
                     raise RuntimeError("plist_file=%s not found" % plist_file)
-                p = cls.from_file(plist_file)
+                p = cls.from_file(plist_file, limits=limits,
+                                  packed_arrays=packed_arrays, keys=keys)
                 return p
             finally:
                 shutil.rmtree(dir_path, ignore_errors=True)
@@ -135,7 +397,8 @@ class PlistInfo(OrderedDict):
             plist_file = os.path.join(app_path, "Info.plist")
             if not os.path.isfile(plist_file):
                 raise RuntimeError("plist_file=%s not found" % plist_file)
-            return cls.from_file(plist_file)
+            return cls.from_file(plist_file, limits=limits,
+                                 packed_arrays=packed_arrays, keys=keys)
         else:
             raise ValueError("app_path=%s is invalid" % app_path)
 
@@ -148,31 +411,96 @@ class PlistInfo(OrderedDict):
         else:
             raise ValueError("header=%s unrecognized" % header)
 
+    def _check_range(self, start, end):
+        if start < 8 or end > self._table_offset:
+            raise InvalidPlistError("range=[%s, %s) out of object area [8, %s)" %
+                                    (start, end, self._table_offset))
+
     def _read_ints(self, count, unit_size, offset):
-        obj_offsets = []
         buf_end = offset + count * unit_size
         obj_buf = self._binary_data[offset:buf_end]
-        struct_type = ">" + STRUCT_SIZE_MAP[unit_size]
-        for i in range(count):
-            start = unit_size * i
-            end = start + unit_size
-            obj_offset = struct.unpack(struct_type,
-                                       obj_buf[start:end])[0]
-            obj_offsets.append(obj_offset)
-        return obj_offsets
-
-    def _parse_binary(self):
+        if len(obj_buf) != buf_end - offset:
+            raise InvalidPlistError("ints at offset=%s truncated" % offset)
+        struct_type = ">%d%s" % (count, STRUCT_SIZE_MAP[unit_size])
+        return list(struct.unpack(struct_type, obj_buf))
+
+    def _read_refs(self, count, offset):
+        self._check_range(offset, offset + count * self.ref_size)
+        refs = self._read_ints(count, self.ref_size, offset)
+        for ref in refs:
+            if ref >= self.obj_count:
+                raise InvalidPlistError("object ref=%s out of range %s" %
+                                        (ref, self.obj_count))
+        return refs
+
+    def _read_trailer(self):
+        """validate trailer and offset table, returns the top object index
+        """
+        data_size = len(self._binary_data)
+        if data_size < 40:
+            raise InvalidPlistError("binary plist size=%s too small" % data_size)
         tailer = self._binary_data[-32:]
         unit_size, self.ref_size, self.obj_count, top, table_offset = struct.unpack(
             ">6xBBQQQ", tailer)
+        if unit_size not in (1, 2, 4, 8) or self.ref_size not in (1, 2, 4, 8):
+            raise InvalidPlistError("unit_size=%s or ref_size=%s invalid" %
+                                    (unit_size, self.ref_size))
+        self._limits.check("max_objects", self.obj_count)
+        table_end = table_offset + self.obj_count * unit_size
+        if table_offset < 8 or table_end > data_size - 32:
+            raise InvalidPlistError("offset table [%s, %s) out of data size=%s" %
+                                    (table_offset, table_end, data_size))
+        if top >= self.obj_count:
+            raise InvalidPlistError("top=%s out of range %s" % (top, self.obj_count))
+        self._table_offset = table_offset
         self.obj_offsets = self._read_ints(
             self.obj_count, unit_size, table_offset)
-        self._read_object(top)
+        for obj_offset in self.obj_offsets:
+            # some writers leave a trailing unreferenced entry at table_offset
+            if obj_offset < 8 or obj_offset > table_offset:
+                raise InvalidPlistError("object offset=%s out of range [8, %s]" %
+                                        (obj_offset, table_offset))
+        self._reading = set()
+        return top
+
+    def _parse_binary(self):
+        self._top = self._read_trailer()
+        if self._keys is None:
+            self._read_object(self._top)
+        else:
+            self._read_top_keys(self._top)
+
+    def _read_top_keys(self, obj_index):
+        """decode the `_keys` entries of the top dict, stops at the last
+        of them without touching other values
+        """
+        refs = self._read_container_refs(obj_index)
+        if refs is None or refs[0] is None:
+            raise InvalidPlistError("top object=%s is not a dict" % obj_index)
+        remaining = set(self._keys)
+        result = OrderedDict()
+        self._reading.add(obj_index)
+        for key_ref, value_ref in zip(*refs):
+            if not remaining:
+                break
+            key = self._read_object(key_ref, 1)
+            if not isinstance(key, string_type):
+                raise InvalidPlistError("dict key=%r of object=%s is not a string" %
+                                        (key, obj_index))
+            if key in remaining:
+                remaining.discard(key)
+                result[key] = self._read_object(value_ref, 1)
+        self._reading.discard(obj_index)
+        self._objs[obj_index] = result
 
-    def _read_object(self, obj_index):
+    def _read_object(self, obj_index, depth=0):
         if obj_index in self._objs:
             return self._objs[obj_index]
+        if obj_index in self._reading:
+            raise InvalidPlistError("cyclic reference to object=%s" % obj_index)
+        self._limits.check("max_depth", depth)
         obj_offset = self.obj_offsets[obj_index]
+        self._check_range(obj_offset, obj_offset + 1)
         if PY2:
             token = ord(self._binary_data[obj_offset])
         else:
@@ -189,72 +517,184 @@ class PlistInfo(OrderedDict):
             result = ""
         elif token_h == 0x10:  # int
             length = 1 << token_l
-            if length == 16:  # unsigned long long
+            if length == 16:  # 128 bits, only the low 64 bits are kept
+                start += 8
                 end = start + 8
-            else:
+            elif length in STRUCT_SIZE_MAP:
                 end = start + length
+            else:
+                raise InvalidPlistError("invalid int token=0x%x" % token)
+            self._check_range(start, end)
             struct_type = STRUCT_SIZE_MAP[length]
             obj_buf = self._binary_data[start:end]
             result = struct.unpack(">" + struct_type, obj_buf)[0]
         elif token == 0x22:  # float
             end = start + 4
+            self._check_range(start, end)
             obj_buf = self._binary_data[start:end]
             result = struct.unpack(">f", obj_buf)[0]
         elif token == 0x23:  # double
             end = start + 8
+            self._check_range(start, end)
             obj_buf = self._binary_data[start:end]
             result = struct.unpack(">d", obj_buf)[0]
         elif token == 0x33:  # date
-            obj_buf = self._binary_data[start:end]
             end = start + 8
+            self._check_range(start, end)
+            obj_buf = self._binary_data[start:end]
             delta = struct.unpack(">d", obj_buf)[0]
-            date = datetime.datetime(2001, 1, 1) + \
-                datetime.timedelta(seconds=delta)
-            result = date
+            try:
+                result = datetime.datetime(2001, 1, 1) + \
+                    datetime.timedelta(seconds=delta)
+            except (OverflowError, ValueError):
+                raise InvalidPlistError("date delta=%s is out of range" % delta)
         elif token_h == 0x40:  # data
             obj_size, length_size = self._get_size(token_l, start)
+            self._limits.check("max_data_size", obj_size)
             start += length_size
             end = start + obj_size
-            result = Data(self._binary_data[start:end])
+            self._check_range(start, end)
+            result = Data.from_raw(self._binary_data[start:end])
         elif token_h == 0x50:  # ascii string
             obj_size, length_size = self._get_size(token_l, start)
+            self._limits.check("max_string_size", obj_size)
             start += length_size
             end = start + obj_size
+            self._check_range(start, end)
             result = self._binary_data[start:end].decode("ascii")
         elif token_h == 0x60:  # unicode
             obj_size, length_size = self._get_size(token_l, start)
+            self._limits.check("max_string_size", obj_size)
             start += length_size
             end = start + obj_size * 2
+            self._check_range(start, end)
             result = self._binary_data[start:end].decode('utf-16be')
         elif token_h == 0x80:  # UID
-            length = token_l
+            length = token_l + 1
+            if length not in UID_STRUCT_MAP:
+                raise InvalidPlistError("invalid uid token=0x%x" % token)
             end = start + length
-            struct_type = STRUCT_SIZE_MAP[length]
+            self._check_range(start, end)
+            struct_type = UID_STRUCT_MAP[length]
             obj_buf = self._binary_data[start:end]
             result = UID(struct.unpack(">" + struct_type, obj_buf)[0])
         elif token_h == 0xa0:  # array
             obj_count, length_size = self._get_size(token_l, start)
+            self._limits.check("max_container_length", obj_count)
             start += length_size
-            obj_offsets = self._read_ints(obj_count, self.ref_size, start)
+            if self._packed_arrays and obj_count >= PACKED_MIN_LENGTH:
+                result = self._read_packed(obj_count, start)
+                if result is not None:
+                    self._objs[obj_index] = result
+                    return result
+            obj_offsets = self._read_refs(obj_count, start)
             result = []
+            self._reading.add(obj_index)
             for index in obj_offsets:
-                result.append(self._read_object(index))
+                result.append(self._read_object(index, depth + 1))
+            self._reading.discard(obj_index)
         elif token_h == 0xd0:  # dict
             obj_count, length_size = self._get_size(token_l, start)
+            self._limits.check("max_container_length", obj_count)
             start += length_size
-            key_offsets = self._read_ints(obj_count, self.ref_size, start)
+            key_offsets = self._read_refs(obj_count, start)
             start += obj_count * self.ref_size
-            value_offsets = self._read_ints(obj_count, self.ref_size, start)
+            value_offsets = self._read_refs(obj_count, start)
             result = {}
+            self._reading.add(obj_index)
             for key_index, value_index in zip(key_offsets, value_offsets):
-                key = self._read_object(key_index)
-                value = self._read_object(value_index)
+                key = self._read_object(key_index, depth + 1)
+                if not isinstance(key, string_type):
+                    raise InvalidPlistError("dict key=%r of object=%s is not a string" %
+                                            (key, obj_index))
+                value = self._read_object(value_index, depth + 1)
                 result[key] = value
+            self._reading.discard(obj_index)
         else:
-            raise ValueError("invalid token=0x%x" % token)
+            raise InvalidPlistError("invalid token=0x%x" % token)
         self._objs[obj_index] = result
         return result
 
+    def _read_container_refs(self, obj_index):
+        """returns (key_refs, value_refs) of a dict, (None, item_refs) of an
+        array or None for other objects, without decoding any item
+        """
+        obj_offset = self.obj_offsets[obj_index]
+        self._check_range(obj_offset, obj_offset + 1)
+        if PY2:
+            token = ord(self._binary_data[obj_offset])
+        else:
+            token = self._binary_data[obj_offset]
+        token_h, token_l = token & 0xf0, token & 0x0f
+        if token_h not in (0xa0, 0xd0):
+            return None
+        start = obj_offset + 1
+        obj_count, length_size = self._get_size(token_l, start)
+        self._limits.check("max_container_length", obj_count)
+        start += length_size
+        first_refs = self._read_refs(obj_count, start)
+        if token_h == 0xa0:
+            return None, first_refs
+        start += obj_count * self.ref_size
+        return first_refs, self._read_refs(obj_count, start)
+
+    def _read_packed(self, count, offset):
+        """decode a homogeneous int or real array in bulk, returns None when
+        the items are not all ints or all reals
+        """
+        if self._packed_arrays == "numpy":
+            return self._read_packed_numpy(count, offset)
+        data = self._binary_data
+        offsets = [self.obj_offsets[ref] for ref in self._read_refs(count, offset)]
+        if PY2:
+            tokens = [ord(data[obj_offset]) for obj_offset in offsets]
+        else:
+            tokens = [data[obj_offset] for obj_offset in offsets]
+        token_set = set(tokens)
+        if token_set.issubset(PACKED_INT_TOKENS):
+            formats, typecode = PACKED_INT_TOKENS, INT_TYPECODE
+        elif token_set.issubset(PACKED_REAL_TOKENS):
+            formats, typecode = PACKED_REAL_TOKENS, "d"
+        else:
+            return None
+        result = array.array(typecode)
+        unpack_from = struct.unpack_from
+        for obj_offset, token in zip(offsets, tokens):
+            fmt = formats[token]
+            self._check_range(obj_offset, obj_offset + 1 + struct.calcsize(fmt))
+            result.append(unpack_from(fmt, data, obj_offset + 1)[0])
+        return result
+
+    def _read_packed_numpy(self, count, offset):
+        numpy = get_numpy()
+        self._check_range(offset, offset + count * self.ref_size)
+        if getattr(self, "_offsets_array", None) is None:
+            self._offsets_array = numpy.array(self.obj_offsets, dtype=numpy.int64)
+        buf = numpy.frombuffer(self._binary_data, dtype=numpy.uint8)
+        refs = numpy.frombuffer(self._binary_data, count=count, offset=offset,
+                                dtype=">u%d" % self.ref_size)
+        if refs.max() >= self.obj_count:
+            raise InvalidPlistError("object ref=%s out of range %s" %
+                                    (refs.max(), self.obj_count))
+        offsets = self._offsets_array[refs]
+        tokens = buf[offsets]
+        token_set = set(numpy.unique(tokens).tolist())
+        if token_set.issubset(PACKED_INT_TOKENS):
+            formats, dtype = PACKED_INT_TOKENS, numpy.int64
+        elif token_set.issubset(PACKED_REAL_TOKENS):
+            formats, dtype = PACKED_REAL_TOKENS, numpy.float64
+        else:
+            return None
+        result = numpy.empty(count, dtype=dtype)
+        for token in token_set:
+            item_dtype = numpy.dtype(formats[token])
+            mask = tokens == token
+            starts = offsets[mask] + 1
+            self._check_range(8, int(starts.max()) + item_dtype.itemsize)
+            index = starts[:, None] + numpy.arange(item_dtype.itemsize)
+            result[mask] = buf[index].view(item_dtype).ravel()
+        return result
+
     def _get_size(self, token_l, offset):
         if token_l == 0xf:
             if PY2:
@@ -262,213 +702,51 @@ class PlistInfo(OrderedDict):
             else:
                 length_size = 1 << (self._binary_data[offset] & 0x3)
             struct_type = STRUCT_SIZE_MAP[length_size]
+            self._check_range(offset, offset + 1 + length_size)
             length_buf = self._binary_data[(
                 offset + 1):(offset + 1 + length_size)]
             return struct.unpack(">" + struct_type, length_buf)[0], length_size + 1
         else:
             return token_l, 0
 
-    def _pack_int(self, value):
-        for max_int, bit_offset in [(1 << 8, 0), (1 << 16, 1), (1 << 32, 2), (1 << 64, 3)]:
-            if value < max_int:
-                break
-        else:
-            raise ValueError("int=%s out of range %s" % (value, 1 << 64))
-        struct_type = STRUCT_SIZE_MAP[1 << bit_offset]
-        int_buf = struct.pack(">" + struct_type, value)
-        return int_buf, bit_offset | 0x10, 1 << bit_offset
-
-    def _write_object(self, value, index, offset):
-        if not isinstance(value, (dict, list, bool)):
-            if value in self._values:
-                value_index = self._values[value]
-                return value_index, b"", offset
-            else:
-                self._values[value] = index
-
-        self.obj_index += 1
-        self.obj_offsets[index] = offset
-        value_buf = b""
-        if value is None:
-            token = 0x0
-        elif value is False:
-            token = 0x8
-        elif value is True:
-            token = 0x9
-        elif isinstance(value, int):
-            token_h = 0x10
-            value_buf, token_l, _ = self._pack_int(value)
-            token = token_h | token_l
-        elif isinstance(value, float):  # we don't use double
-            token = 0x22
-            value_buf = struct.pack(">f", value)
-        elif isinstance(value, datetime.datetime):
-            token = 0x33
-            date_delta = value - datetime.datetime(2001, 1, 1)
-            value_buf = struct.pack(">d", date_delta.seconds)
-        elif isinstance(value, Data):
-            token_h = 0x40
-            length = len(value)
-            if length < 0xf:
-                token_l = length
-            else:
-                token_l = 0xf
-                int_buf, bit_offset, _ = self._pack_int(length)
-                value_buf += int_buf
-                value_buf += struct.pack("B", bit_offset)
-            value_buf += value
-            token = token_h | token_l
-        elif isinstance(value, string_type):
-            is_ascii = True
-            target_value = value
-            if PY2:
-                if isinstance(value, str):
-                    try:
-                        value.decode("ascii")
-                    except UnicodeError:
-                        is_ascii = False
-                        try:
-                            target_value = value.decode("utf8")
-                        except UnicodeError:
-                            target_value = value.decode("gbk")
-                else:
-                    try:
-                        target_value = value.encode("ascii")
-                    except UnicodeError:
-                        target_value = value
-                        is_ascii = False
-            else:
-                try:
-                    target_value = value.encode("ascii")
-                except UnicodeError:
-                    is_ascii = False
-
-            if is_ascii:
-                token_h = 0x50
-            else:
-                token_h = 0x60
-
-            # string length instead of bytes length
-            length = len(target_value)
-            if length < 0xf:
-                token_l = length
-            else:
-                token_l = 0xf
-                int_buf, bit_offset, _ = self._pack_int(length)
-                value_buf += struct.pack("B", bit_offset)
-                value_buf += int_buf
-            if is_ascii:
-                value_buf += target_value
-            else:
-                value_buf += value.encode("utf-16be")
-            token = token_h | token_l
-        elif isinstance(value, UID):
-            token_h = 0x80
-            int_buf, bit_offset, _ = self._pack_int(value)
-            value_buf += int_buf
-            token_l = 1 << bit_offset
-            token = token_h | token_l
-        elif isinstance(value, list):
-            token_h = 0xa0
-            length = len(value)
-            if length < 0xf:
-                token_l = length
-            else:
-                token_l = 0xf
-                int_buf, bit_offset, _ = self._pack_int(length)
-                value_buf += struct.pack("B", bit_offset)
-                value_buf += int_buf
-            item_count = len(value)
-            offset += 1 + len(value_buf)
-            offset += item_count * self.ref_size
-            data_buf = b""
-            struct_type = ">" + STRUCT_SIZE_MAP[self.ref_size]
-            for item_value in value:
-                obj_offset, item_buf, offset = self._write_object(
-                    item_value, self.obj_index, offset)
-                value_buf += struct.pack(struct_type, obj_offset)
-                self.obj_offsets[self.obj_index] = offset
-                data_buf += item_buf
-            value_buf += data_buf
-            token = token_h | token_l
-        elif isinstance(value, dict):
-            token_h = 0xd0
-            length = len(value)
-            if length < 0xf:
-                token_l = length
-            else:
-                token_l = 0xf
-                int_buf, bit_offset, _ = self._pack_int(length)
-                value_buf += struct.pack("B", bit_offset)
-                value_buf += int_buf
-            item_count = len(value)
-            offset += 1 + len(value_buf)
-            offset += 2 * item_count * self.ref_size
-            data_buf = b""
-            struct_type = ">" + STRUCT_SIZE_MAP[self.ref_size]
-            for k in value.keys():
-                obj_offset, k_buf, offset = self._write_object(
-                    k, self.obj_index, offset)
-                data_buf += k_buf
-                value_buf += struct.pack(struct_type, obj_offset)
-            for v in value.values():
-                obj_offset, v_buf, offset = self._write_object(
-                    v, self.obj_index, offset)
-                data_buf += v_buf
-                value_buf += struct.pack(struct_type, obj_offset)
-            value_buf += data_buf
-            token = token_h | token_l
-        else:
-            raise ValueError("unexpected value=%s" % value)
-        buf = struct.pack("B", token) + value_buf
-        if not isinstance(value, (list, dict)):
-            offset += len(buf)
-        return index, buf, offset
-
-    def _get_obj_count(self):
-        obj_count = 1
-        roots = [self]
-        values = []
-        while roots:
-            temp_root = roots.pop(0)
-            if isinstance(temp_root, dict):
-                obj_count += 1
-                roots.extend(temp_root.keys())
-                roots.extend(temp_root.values())
-            elif isinstance(temp_root, list):
-                obj_count += 1
-                roots.extend(temp_root)
-            elif isinstance(temp_root, bool):
-                obj_count += 1
-            else:
-                if temp_root not in values:
-                    values.append(temp_root)
-                    obj_count += 1
-        return obj_count
-
-    def to_binary(self):
-        import biplist
-        return biplist.writePlistToString(self)
-
-        self.obj_index = 0
-        self.obj_offsets = {}
-        self._values = {}
-        self.obj_count = self._get_obj_count()
-        self.ref_size = self._pack_int(self.obj_count)[2]
-        _, buf, offset = self._write_object(self, 0, 8)
-        if (len(buf) + 8) != offset:
-            raise RuntimeError(
-                "(buf length[%s] + 8) != offset[%s]" % (len(buf), offset))
-        for obj_offset in self.obj_offsets.values():
-            buf += struct.pack(">H", obj_offset)
-
-        buf += struct.pack(">6xBBQQQ", 2, self.ref_size, self.obj_count,
-                           0, offset)
-        return b"bplist00" + buf
-
-    def to_binary_file(self, file_path):
-        with open(file_path, "wb") as fd:
-            fd.write(self.to_binary())
+    def to_binary(self, canonical=False):
+        """
+        :param canonical: write canonical output, see `fingerprint`
+        :type  canonical: bool
+        """
+        from gplist.writer import write_binary
+        fd = io.BytesIO()
+        write_binary(self, fd, canonical=canonical)
+        return fd.getvalue()
+
+    def fingerprint(self, algorithm="sha256"):
+        """hex digest of the canonical binary form, equal for plists with the
+        same content whatever their format, key order or object sharing. The
+        canonical form is hashed while it is generated, it is never held in
+        memory
+
+        :param algorithm: `hashlib` algorithm name
+        :type  algorithm: str
+        :rtype: str
+        """
+        from gplist.writer import fingerprint
+        return fingerprint(self, algorithm)
+
+    def to_binary_file(self, file_path, compression="auto", level=None, canonical=False):
+        """stream objects to `file_path` as they are encoded, the output is
+        never held in memory
+
+        :param compression: "gzip", "bz2", "xz", None, or "auto" to pick it
+            from the extension of `file_path`
+        :type  compression: str
+        :param level: compression level from 1 to 9
+        :type  level: int
+        :param canonical: write canonical output, see `fingerprint`
+        :type  canonical: bool
+        """
+        from gplist.writer import write_binary
+        with open_file(file_path, "wb", compression, level) as fd:
+            write_binary(self, fd, canonical=canonical)
 
     def _parse(self):
         fmt = self._get_fmt()
@@ -492,7 +770,18 @@ class PlistInfo(OrderedDict):
                 index += 1
 
     def _get_plist_node(self):
-        dom = parseString(self._binary_data)
+        if self._keys is not None:
+            options = Options()
+            options.filter = _TopKeysFilter(self._keys)
+            builder = ExpatBuilder(options)
+            if getattr(self, "_xml_stream", None) is not None:
+                dom = builder.parseFile(self._xml_stream)
+            else:
+                dom = builder.parseString(self._binary_data)
+        elif getattr(self, "_xml_stream", None) is not None:
+            dom = parse(self._xml_stream)
+        else:
+            dom = parseString(self._binary_data)
         for child in self._get_next_element(dom):
             tree = child
             break
@@ -513,6 +802,7 @@ class PlistInfo(OrderedDict):
         elif node_type == "string":
             if len(node.childNodes) > 0:
                 node_value = node.childNodes[0].nodeValue
+                self._limits.check("max_string_size", len(node_value))
             else:
                 node_value = ""
         elif node_type == "integer":
@@ -525,6 +815,7 @@ class PlistInfo(OrderedDict):
             node_value = []
         elif node_type == "data":
             content = node.childNodes[0].nodeValue
+            self._limits.check("max_data_size", len(content) * 3 // 4)
             if PY2:
                 node_value = Data(content)
             else:
@@ -537,38 +828,129 @@ class PlistInfo(OrderedDict):
             raise ValueError("unexpected node_type=%s" % node_type)
         return node_value
 
+    def _read_uid_node(self, root, default):
+        """decode `<dict><key>CF$UID</key><integer>n</integer></dict>` into
+        `UID`, returns `default` for other dicts
+        """
+        children = []
+        for child in self._get_next_element(root):
+            children.append(child)
+            if len(children) > 2:
+                return default
+        if len(children) != 2 or children[1].nodeName != "integer":
+            return default
+        key_node, value_node = children
+        if key_node.childNodes[0].nodeValue != "CF$UID":
+            return default
+        return UID(int(value_node.childNodes[0].nodeValue))
+
+    def _read_packed_nodes(self, root, default):
+        """decode `<integer>` or `<real>` children of an array node in bulk,
+        returns `default` when they are not all of the same type
+        """
+        tags = set()
+        texts = []
+        for child in self._get_next_element(root):
+            tags.add(child.nodeName)
+            if len(tags) > 1 or child.nodeName not in ("integer", "real"):
+                return default
+            texts.append(child.childNodes[0].nodeValue)
+        if len(texts) < PACKED_MIN_LENGTH:
+            return default
+        self._limits.check("max_container_length", len(texts))
+        if "real" in tags:
+            typecode, dtype, convert = "d", "float64", float
+        else:
+            typecode, dtype, convert = INT_TYPECODE, "int64", int
+        try:
+            if self._packed_arrays == "numpy":
+                numpy = get_numpy()
+                return numpy.array(texts, dtype=dtype)
+            return array.array(typecode, map(convert, texts))
+        except (OverflowError, ValueError):
+            return default
+
     def _parse_xml(self):
         tree = self._get_plist_node()
         d = OrderedDict()
-        nodes = [(tree, d)]
+        nodes = [(tree, d, 0)]
+        obj_count = 1
         while nodes:
-            root, value = nodes.pop(0)
+            root, value, depth = nodes.pop(0)
+            self._limits.check("max_depth", depth)
             if root.nodeName == "dict":
                 elem_nodes = self._get_next_element(root)
                 for child in elem_nodes:
                     key = child.childNodes[0].nodeValue
                     value_node = next(elem_nodes)
                     child_value = self._get_node_value(value_node)
-                    if value_node.nodeName in ["dict", "array"]:
-                        nodes.append([value_node, child_value])
+                    if value_node.nodeName == "array" and self._packed_arrays:
+                        child_value = self._read_packed_nodes(value_node, child_value)
+                    elif value_node.nodeName == "dict":
+                        child_value = self._read_uid_node(value_node, child_value)
+                    if is_packed_array(child_value):
+                        obj_count += len(child_value)
+                    elif isinstance(child_value, UID):
+                        pass
+                    elif value_node.nodeName in ["dict", "array"]:
+                        nodes.append([value_node, child_value, depth + 1])
                     value[key] = child_value
+                    obj_count += 2
+                self._limits.check("max_container_length", len(value))
             elif root.nodeName == "array":
                 elem_nodes = self._get_next_element(root)
                 for child in elem_nodes:
                     child_value = self._get_node_value(child)
-                    if child.nodeName in ["dict", "array"]:
-                        nodes.append([child, child_value])
+                    if child.nodeName == "array" and self._packed_arrays:
+                        child_value = self._read_packed_nodes(child, child_value)
+                    elif child.nodeName == "dict":
+                        child_value = self._read_uid_node(child, child_value)
+                    if is_packed_array(child_value):
+                        obj_count += len(child_value)
+                    elif isinstance(child_value, UID):
+                        pass
+                    elif child.nodeName in ["dict", "array"]:
+                        nodes.append([child, child_value, depth + 1])
                     value.append(child_value)
+                    obj_count += 1
+                self._limits.check("max_container_length", len(value))
             else:
                 raise TypeError("unexpected node type: %s" % root.nodeName)
+            self._limits.check("max_objects", obj_count)
         self._objs[0] = d
 
-    def _to_dom_node(self, data, dom):
-        if isinstance(data, bool):
+    def _to_dom_node(self, data, dom, canonical=False):
+        if canonical:
+            # one text form per value: data re-encoded from its bytes and
+            # reals as their shortest round-trip repr
+            if isinstance(data, float):
+                data_node = dom.createElement("real")
+                data_node.appendChild(dom.createTextNode(repr(data)))
+                return data_node
+            elif isinstance(data, Data):
+                data = Data.from_raw(data.raw)
+            elif isinstance(data, bytes_type) and not isinstance(data, string_type):
+                data = Data.from_raw(data)
+        if is_packed_array(data):
+            data_node = PackedArrayElement(data)
+            data_node.ownerDocument = dom
+        elif isinstance(data, UID):
+            data_node = dom.createElement("dict")
+            k_node = dom.createElement("key")
+            k_node.appendChild(dom.createTextNode("CF$UID"))
+            data_node.appendChild(k_node)
+            v_node = dom.createElement("integer")
+            v_node.appendChild(dom.createTextNode(str(int(data))))
+            data_node.appendChild(v_node)
+        elif isinstance(data, bool):
             if data is True:
                 data_node = dom.createElement("true")
             else:
                 data_node = dom.createElement("false")
+        elif isinstance(data, Data):
+            data_node = dom.createElement("data")
+            text_node = dom.createTextNode(data)
+            data_node.appendChild(text_node)
         elif isinstance(data, string_type):
             data_node = dom.createElement("string")
             if data:
@@ -582,10 +964,6 @@ class PlistInfo(OrderedDict):
             data_node = dom.createElement("real")
             text_node = dom.createTextNode(str(data))
             data_node.appendChild(text_node)
-        elif isinstance(data, Data):
-            data_node = dom.createElement("data")
-            text_node = dom.createTextNode(data)
-            data_node.appendChild(text_node)
         elif isinstance(data, datetime.datetime):
             data_node = dom.createElement("date")
             data = data.strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -595,7 +973,9 @@ class PlistInfo(OrderedDict):
             raise ValueError("value=%s is unsupported" % data)
         return data_node
 
-    def to_xml(self, encoding="UTF-8", pretty=True):
+    def _new_xml_document(self):
+        """returns (document, plist root dict element)
+        """
         dom = Document()
         dom.version = "1.0"
         dom.encoding = "UTF-8"
@@ -610,11 +990,19 @@ class PlistInfo(OrderedDict):
 
         plist_root = dom.createElement("dict")
         plist_node.appendChild(plist_root)
-        temp_pairs = [(self, plist_root)]
+        return dom, plist_root
+
+    def _build_dom(self, data, root, dom, canonical=False):
+        temp_pairs = [(data, root)]
         while temp_pairs:
             data, root = temp_pairs.pop(0)
             if isinstance(data, dict):
-                for k, v in data.items():
+                items = data.items()
+                if canonical:
+                    items = sorted(items, key=lambda item: item[0])
+                for k, v in items:
+                    if canonical and is_packed_array(v):
+                        v = v.tolist()
                     k_node = dom.createElement("key")
                     text_node = dom.createTextNode(k)
                     k_node.appendChild(text_node)
@@ -627,10 +1015,12 @@ class PlistInfo(OrderedDict):
                         v_node = dom.createElement("array")
                         temp_pairs.append((v, v_node))
                     else:
-                        v_node = self._to_dom_node(v, dom)
+                        v_node = self._to_dom_node(v, dom, canonical)
                     root.appendChild(v_node)
             elif isinstance(data, list):
                 for v in data:
+                    if canonical and is_packed_array(v):
+                        v = v.tolist()
                     if isinstance(v, dict):
                         v_node = dom.createElement("dict")
                         temp_pairs.append((v, v_node))
@@ -638,22 +1028,50 @@ class PlistInfo(OrderedDict):
                         v_node = dom.createElement("array")
                         temp_pairs.append((v, v_node))
                     else:
-                        v_node = self._to_dom_node(v, dom)
+                        v_node = self._to_dom_node(v, dom, canonical)
                     root.appendChild(v_node)
             else:
-                data_node = self._to_dom_node(data, dom)
+                data_node = self._to_dom_node(data, dom, canonical)
                 root.appendChild(data_node)
 
+    def to_xml(self, encoding="UTF-8", pretty=True, canonical=False):
+        """
+        :param canonical: sort dict keys and give every value one text form,
+            so that equal plists render to equal bytes
+        :type  canonical: bool
+        """
+        dom, plist_root = self._new_xml_document()
+        self._build_dom(self, plist_root, dom, canonical)
+
         if pretty:
             xml_content = dom.toprettyxml(encoding=encoding)
         else:
             xml_content = dom.toxml(encoding=encoding)
         return xml_content
 
-    def to_xml_file(self, file_path, encoding="UTF-8", pretty=True):
-        with open(file_path, "wb") as fd:
-            fd.write(self.to_xml(encoding=encoding,
-                                 pretty=pretty))
+    def to_xml_file(self, file_path, encoding="UTF-8", pretty=True,
+                    compression="auto", level=None, canonical=False):
+        """
+        :param compression: "gzip", "bz2", "xz", None, or "auto" to pick it
+            from the extension of `file_path`
+        :type  compression: str
+        :param level: compression level from 1 to 9
+        :type  level: int
+        """
+        with open_file(file_path, "wb", compression, level) as fd:
+            if PY2:
+                fd.write(self.to_xml(encoding=encoding, pretty=pretty, canonical=canonical))
+                return
+            dom, plist_root = self._new_xml_document()
+            self._build_dom(self, plist_root, dom, canonical)
+            # same output as to_xml, written to the file as it is rendered
+            writer = io.TextIOWrapper(fd, encoding=encoding,
+                                      errors="xmlcharrefreplace", newline="\n")
+            if pretty:
+                dom.writexml(writer, "", "\t", "\n", encoding=encoding)
+            else:
+                dom.writexml(writer, "", "", "", encoding=encoding)
+            writer.detach()
 
     def _get_prop_parent(self, prop_fields):
         if len(prop_fields) < 1:
@@ -725,4 +1143,6 @@ class PlistEncoder(json.encoder.JSONEncoder):
             return binascii.hexlify(o).encode("ascii")
         elif isinstance(o, map):
             return list(o)
+        elif is_packed_array(o):
+            return o.tolist()
         return o
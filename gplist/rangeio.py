@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""seekable file objects over ranged reads, e.g. from an object store
+"""
+
+from collections import OrderedDict
+import io
+import os
+
+
+BLOCK_SIZE = 16 << 10
+MAX_BLOCKS = 256
+
+
+class RangeReader(io.RawIOBase):
+    """read-only seekable file whose content is fetched by byte ranges
+
+    reads are served from a cache of fixed size blocks, the missing blocks of
+    one read are fetched together as a single range, so that the few small
+    reads `zipfile` makes around one spot cost one fetch. Subclasses implement
+    `fetch`, e.g. with an HTTP `Range` request
+
+        class S3Reader(RangeReader):
+            def __init__(self, client, bucket, key):
+                size = client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+                super(S3Reader, self).__init__(size)
+                ...
+
+            def fetch(self, start, end):
+                return self.client.get_object(
+                    Bucket=self.bucket, Key=self.key,
+                    Range="bytes=%d-%d" % (start, end - 1))["Body"].read()
+
+    :param size: total content size
+    :type  size: int
+    :param block_size: cache block size in bytes
+    :type  block_size: int
+    :param max_blocks: cached block count, least recently used ones are dropped
+    :type  max_blocks: int
+    """
+
+    def __init__(self, size, block_size=BLOCK_SIZE, max_blocks=MAX_BLOCKS):
+        super(RangeReader, self).__init__()
+        self.size = size
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.fetch_count = 0
+        self.bytes_fetched = 0
+        self._position = 0
+        self._blocks = OrderedDict()
+
+    def fetch(self, start, end):
+        """return content bytes in range [start, end)
+        """
+        raise NotImplementedError
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError("whence=%s is invalid" % whence)
+        if position < 0:
+            raise ValueError("position=%s is negative" % position)
+        self._position = position
+        return position
+
+    def read(self, size=-1):
+        start = self._position
+        end = self.size if size is None or size < 0 else min(start + size, self.size)
+        if start >= end:
+            return b""
+        first = start // self.block_size
+        last = (end - 1) // self.block_size
+        self._load(first, last)
+        buf = b"".join([self._blocks[index] for index in range(first, last + 1)])
+        offset = first * self.block_size
+        self._position = end
+        return buf[start - offset:end - offset]
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def _load(self, first, last):
+        missing = None
+        for index in range(first, last + 1):
+            if index in self._blocks:
+                self._blocks[index] = self._blocks.pop(index)
+                if missing is not None:
+                    self._fetch_blocks(missing, index - 1)
+                    missing = None
+            elif missing is None:
+                missing = index
+        if missing is not None:
+            self._fetch_blocks(missing, last)
+        # blocks of the current read are the most recent, never dropped here
+        while len(self._blocks) > max(self.max_blocks, last - first + 1):
+            self._blocks.popitem(last=False)
+
+    def _fetch_blocks(self, first, last):
+        start = first * self.block_size
+        end = min((last + 1) * self.block_size, self.size)
+        buf = self.fetch(start, end)
+        if len(buf) != end - start:
+            raise IOError("range=[%s, %s) returned %s bytes" % (start, end, len(buf)))
+        self.fetch_count += 1
+        self.bytes_fetched += len(buf)
+        for index in range(first, last + 1):
+            offset = (index - first) * self.block_size
+            self._blocks[index] = buf[offset:offset + self.block_size]
+
+
+class FileRangeReader(RangeReader):
+    """`RangeReader` over a local file, counting the fetched ranges and bytes,
+    a stand-in for remote storage
+
+    :param file_path: local file path
+    :type  file_path: str
+    """
+
+    def __init__(self, file_path, block_size=BLOCK_SIZE, max_blocks=MAX_BLOCKS):
+        super(FileRangeReader, self).__init__(
+            os.path.getsize(file_path), block_size=block_size, max_blocks=max_blocks)
+        self._fd = open(file_path, "rb")
+
+    def fetch(self, start, end):
+        self._fd.seek(start)
+        return self._fd.read(end - start)
+
+    def close(self):
+        if not self.closed:
+            self._fd.close()
+        super(FileRangeReader, self).close()
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""schema compiled plist decoding into slotted records
+"""
+
+import datetime
+import keyword
+import os
+import re
+
+from gplist.compress import read_file
+from gplist.plist import PlistInfo, Data, InvalidPlistError, string_type
+
+
+class SchemaError(InvalidPlistError):
+    """raised when a plist value doesn't match its declared type
+    """
+
+
+def _is_reserved(name):
+    return name == "_extra" or hasattr(Record, name)
+
+
+def attribute_name(key):
+    """record attribute name of a plist key, characters not allowed in an
+    identifier become "_", e.g. "UISupportedInterfaceOrientations~ipad" gives
+    "UISupportedInterfaceOrientations_ipad"
+    """
+    name = re.sub(r"[^0-9A-Za-z_]", "_", key)
+    if name.startswith("__"):
+        # private names would be mangled in __slots__
+        name = name.lstrip("_")
+    if not name or name[0].isdigit():
+        name = "_" + name
+    if keyword.iskeyword(name) or _is_reserved(name):
+        name += "_"
+    return name
+
+
+class Field(object):
+    """a declared plist key
+
+    :param key: plist key
+    :type  key: str
+    :param type: python type, `Schema`, or a one item list `[type]` for arrays,
+        None accepts any value
+    :param name: record attribute name, defaults to `key` made a valid
+        identifier, see `attribute_name`
+    :type  name: str
+    :param default: attribute value when the key is missing
+    """
+
+    def __init__(self, key, type=None, name=None, default=None):
+        self.key = key
+        self.type = type
+        self.name = name or attribute_name(key)
+        self.default = default
+
+
+class Record(object):
+    """base class of schema records
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init__(self, **kwargs):
+        for field in self._fields:
+            setattr(self, field.name, kwargs.pop(field.name, field.default))
+        if "_extra" in self.__slots__:
+            self._extra = kwargs.pop("_extra", None)
+        if kwargs:
+            raise TypeError("unexpected fields=%s" % ", ".join(kwargs))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "<%s %s>" % (type(self).__name__, ", ".join(
+            ["%s=%r" % (f.name, getattr(self, f.name)) for f in self._fields]))
+
+    @property
+    def extra(self):
+        """unknown keys, only kept with `unknown="keep"`
+        """
+        if "_extra" in self.__slots__:
+            return self._extra
+        return None
+
+    def to_dict(self):
+        """back to a plain dict keyed by plist keys, missing keys are omitted
+        """
+        result = {}
+        for field in self._fields:
+            value = getattr(self, field.name)
+            if value is None:
+                continue
+            if isinstance(value, Record):
+                value = value.to_dict()
+            elif isinstance(value, list):
+                value = [v.to_dict() if isinstance(v, Record) else v for v in value]
+            result[field.key] = value
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+
+def _type_checker(value_type):
+    if value_type is None:
+        return lambda value: True
+    if value_type is str:
+        value_type = string_type
+    elif value_type is float:
+        value_type = (int, float)
+    elif value_type is dict or value_type is list:
+        pass
+    elif value_type not in (int, bool, Data, datetime.datetime):
+        raise ValueError("type=%s is unsupported" % value_type)
+    if value_type is int:
+        return lambda value: isinstance(value, int) and not isinstance(value, bool)
+    return lambda value: isinstance(value, value_type)
+
+
+class _Converter(object):
+    """convert a decoded value, or a binary object reference, to its declared
+    type
+    """
+
+    def __init__(self, value_type):
+        self.schema = None
+        self.item = None
+        self.check = None
+        if isinstance(value_type, Schema):
+            self.schema = value_type
+        elif isinstance(value_type, list):
+            if len(value_type) != 1:
+                raise ValueError("array type=%s needs exactly one item type" % value_type)
+            self.item = _Converter(value_type[0])
+        else:
+            self.check = _type_checker(value_type)
+            self.type_name = getattr(value_type, "__name__", str(value_type))
+
+    def from_value(self, value, key):
+        if self.schema is not None:
+            if not isinstance(value, dict):
+                raise SchemaError("key=%s expects dict, got %r" % (key, value))
+            return self.schema.from_dict(value)
+        elif self.item is not None:
+            if not isinstance(value, list):
+                raise SchemaError("key=%s expects array, got %r" % (key, value))
+            return [self.item.from_value(v, key) for v in value]
+        if not self.check(value):
+            raise SchemaError("key=%s expects %s, got %r" % (key, self.type_name, value))
+        return value
+
+    def from_binary(self, reader, obj_index, key, depth):
+        if self.schema is not None:
+            return self.schema._decode_binary(reader, obj_index, depth)
+        elif self.item is not None:
+            refs = reader._read_container_refs(obj_index)
+            if refs is None or refs[0] is not None:
+                raise SchemaError("key=%s expects array" % key)
+            return [self.item.from_binary(reader, ref, key, depth + 1) for ref in refs[1]]
+        return self.from_value(reader._read_object(obj_index, depth), key)
+
+
+class Schema(object):
+    """declare the expected keys and types of a plist dict, compiled once into
+    a `__slots__` record class and a decoder
+
+        InfoPlist = Schema("InfoPlist", [
+            Field("CFBundleIdentifier", str),
+            Field("CFBundleVersion", str),
+            Field("UIDeviceFamily", [int]),
+        ])
+        info = InfoPlist.from_file("Info.plist")
+        print(info.CFBundleIdentifier)
+
+    :param name: record class name
+    :type  name: str
+    :param fields: `Field` list, or a dict of plist key to type
+    :param unknown: "drop" undeclared keys or "keep" them in `record.extra`
+    :type  unknown: str
+    """
+
+    def __init__(self, name, fields, unknown="drop"):
+        if unknown not in ("drop", "keep"):
+            raise ValueError("unknown=%s should be drop or keep" % unknown)
+        if isinstance(fields, dict):
+            fields = [Field(key, value_type) for key, value_type in fields.items()]
+        self.name = name
+        self.fields = list(fields)
+        self.unknown = unknown
+        slots = tuple([field.name for field in self.fields])
+        for i, slot in enumerate(slots):
+            if slot in slots[:i]:
+                raise ValueError("field name=%s is used twice" % slot)
+            if _is_reserved(slot):
+                raise ValueError("field name=%s is reserved by Record" % slot)
+        if unknown == "keep":
+            slots += ("_extra",)
+        self.record_class = type(str(name), (Record,), {
+            "__slots__": slots, "_fields": tuple(self.fields)})
+        self._by_key = dict([(field.key, (field, _Converter(field.type)))
+                             for field in self.fields])
+
+    def from_dict(self, data):
+        """
+        :rtype: Record
+        """
+        record = self.record_class.__new__(self.record_class)
+        for field in self.fields:
+            setattr(record, field.name, field.default)
+        extra = None
+        for key, value in data.items():
+            item = self._by_key.get(key)
+            if item is not None:
+                setattr(record, item[0].name, item[1].from_value(value, key))
+            elif self.unknown == "keep":
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        if self.unknown == "keep":
+            record._extra = extra
+        return record
+
+    def _decode_binary(self, reader, obj_index, depth):
+        refs = reader._read_container_refs(obj_index)
+        if refs is None or refs[0] is None:
+            raise SchemaError("%s expects dict" % self.name)
+        record = self.record_class.__new__(self.record_class)
+        for field in self.fields:
+            setattr(record, field.name, field.default)
+        extra = None
+        for key_ref, value_ref in zip(*refs):
+            key = reader._read_object(key_ref, depth + 1)
+            item = self._by_key.get(key)
+            if item is not None:
+                setattr(record, item[0].name,
+                        item[1].from_binary(reader, value_ref, key, depth + 1))
+            elif self.unknown == "keep":
+                if extra is None:
+                    extra = {}
+                extra[key] = reader._read_object(value_ref, depth + 1)
+        if self.unknown == "keep":
+            record._extra = extra
+        return record
+
+    def loads(self, data, limits=None):
+        """decode plist content into a record, undeclared values of binary
+        plists are skipped without being decoded
+
+        :rtype: Record
+        """
+        if not data.startswith(b"bplist00"):
+            return self.from_dict(PlistInfo(data, limits=limits))
+        reader = PlistInfo({}, limits=limits)
+        reader._binary_data = data
+        return self._decode_binary(reader, reader._read_trailer(), 0)
+
+    def from_file(self, plist_file, limits=None):
+        """
+        :rtype: Record
+        """
+        if not os.path.exists(plist_file):
+            raise ValueError("plist_info=%s is not valid" % plist_file)
+        return self.loads(read_file(plist_file, limits=limits), limits=limits)
+
+
+INFO_PLIST = Schema("InfoPlist", [
+    Field("CFBundleIdentifier", str),
+    Field("CFBundleName", str),
+    Field("CFBundleDisplayName", str),
+    Field("CFBundleExecutable", str),
+    Field("CFBundleVersion"),
+    Field("CFBundleShortVersionString"),
+    Field("CFBundlePackageType", str),
+    Field("CFBundleSupportedPlatforms", [str]),
+    Field("MinimumOSVersion"),
+    Field("UIDeviceFamily", [int]),
+    Field("DTPlatformName", str),
+    Field("DTSDKName", str),
+    Field("DTXcode"),
+    Field("DTXcodeBuild", str),
+])
+
+MOBILE_PROVISION = Schema("MobileProvisionInfo", [
+    Field("AppIDName", str),
+    Field("ApplicationIdentifierPrefix", [str]),
+    Field("CreationDate", datetime.datetime),
+    Field("ExpirationDate", datetime.datetime),
+    Field("DeveloperCertificates", [Data]),
+    Field("Entitlements", dict),
+    Field("Name", str),
+    Field("Platform", [str]),
+    Field("ProvisionedDevices", [str]),
+    Field("ProvisionsAllDevices", bool),
+    Field("TeamIdentifier", [str]),
+    Field("TeamName", str),
+    Field("TimeToLive", int),
+    Field("UUID", str),
+    Field("Version", int),
+])
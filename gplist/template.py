@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""batch plist variants generated from one pre-encoded base
+"""
+
+from collections import OrderedDict
+import copy
+import io
+import multiprocessing
+
+from gplist.plist import PlistInfo, PY2, string_type
+from gplist.writer import BinaryPlistWriter, write_binary, pack_uints, _get_int_size
+
+
+# room left in object refs and offsets for the objects added by variants
+CAPACITY_FACTOR = 4
+
+REMOVE = object()
+
+_template = None
+
+
+def _new_writer():
+    """text buffer minidom can write both str and unicode to on python 2
+    """
+    if PY2:
+        from StringIO import StringIO
+        return StringIO()
+    return io.StringIO()
+
+
+def _encode_xml(parts, encoding):
+    """join rendered parts the way `PlistInfo.to_xml` encodes, characters the
+    encoding lacks become character references
+    """
+    if PY2:
+        parts = [part.decode("utf-8") if isinstance(part, str) else part for part in parts]
+    return u"".join(parts).encode(encoding, "xmlcharrefreplace")
+
+
+class PlistTemplate(object):
+    """encode a base plist once and render variants of it
+
+    the binary base keeps the index of every object written, a variant only
+    writes its new scalars and the containers on the paths it changes, then
+    appends them to the cached base objects. Replaced base objects are kept as
+    unreferenced objects so that cached offsets stay valid. The xml base keeps
+    one rendered fragment per top level key, a variant re-renders the changed
+    keys only.
+
+    the base is deep copied, later changes to it are not seen by the template
+
+    :param base: base plist
+    :type  base: dict
+    """
+
+    def __init__(self, base):
+        self._base = copy.deepcopy(OrderedDict(base))
+        self._binary = None
+        self._xml = {}
+
+    def __getstate__(self):
+        # cached object indices are keyed by id() and meaningless elsewhere
+        return {"_base": self._base, "_binary": None, "_xml": self._xml}
+
+    def _prepare_binary(self):
+        fd = io.BytesIO()
+        writer = BinaryPlistWriter(fd)
+        writer.record_containers = True
+        obj_count = writer.count_objects(self._base)
+        writer.ref_size = _get_int_size(obj_count * CAPACITY_FACTOR)
+        writer._write(b"bplist00")
+        top = writer.write_objects(self._base)
+        body = fd.getvalue()
+        offset_size = _get_int_size(len(body) * CAPACITY_FACTOR)
+        self._binary = {
+            "body": body,
+            "top": top,
+            "obj_count": len(writer._offsets),
+            "ref_size": writer.ref_size,
+            "offset_size": offset_size,
+            "table": pack_uints(writer._offsets, offset_size),
+            "scalars": writer._scalars,
+            "containers": writer._containers,
+        }
+
+    def _prepare_xml(self, pretty):
+        indent, addindent, newl = ("\t\t", "\t", "\n") if pretty else ("", "", "")
+        p = PlistInfo({})
+        dom, plist_root = p._new_xml_document()
+        writer = _new_writer()
+        writer.write('<?xml version="1.0" encoding="%%s"?>%s' % newl)
+        dom.childNodes[0].writexml(writer, "", addindent, newl)
+        writer.write('<plist version="1.0">%s%s<dict>%s' % (newl, addindent, newl))
+        prefix = writer.getvalue()
+        suffix = "%s</dict>%s</plist>%s" % (addindent, newl, newl)
+        fragments = {}
+        for key, value in self._base.items():
+            fragments[key] = self._render_xml_item(p, dom, key, value, indent, addindent, newl)
+        self._xml[pretty] = (prefix, suffix, fragments, (indent, addindent, newl))
+
+    def _render_xml_item(self, p, dom, key, value, indent, addindent, newl):
+        holder = dom.createElement("dict")
+        p._build_dom({key: value}, holder, dom)
+        writer = _new_writer()
+        for node in holder.childNodes:
+            node.writexml(writer, indent, addindent, newl)
+        return writer.getvalue()
+
+    def apply(self, overrides):
+        """return the base with `overrides` applied, only the containers on the
+        changed paths are copied, unchanged subtrees are shared with the base
+
+        :param overrides: maps a top level key, or a tuple path of keys and
+            indices, to its new value or `REMOVE`
+        :type  overrides: dict
+        """
+        root = OrderedDict(self._base)
+        copied = set([id(root)])
+        for path, value in overrides.items():
+            if isinstance(path, string_type):
+                path = (path,)
+            parent = root
+            for i, field in enumerate(path[:-1]):
+                try:
+                    child = parent[field]
+                except (IndexError, KeyError, TypeError):
+                    raise ValueError("`%s` of `%s` not found" % (
+                        "/".join(map(str, path[i:])), "/".join(map(str, path[:i]))))
+                if id(child) not in copied:
+                    if isinstance(child, dict):
+                        child = OrderedDict(child)
+                    elif isinstance(child, list):
+                        child = list(child)
+                    else:
+                        raise ValueError("`%s` is not a container" % "/".join(map(str, path[:i + 1])))
+                    copied.add(id(child))
+                    parent[field] = child
+                parent = child
+            if value is REMOVE:
+                del parent[path[-1]]
+            else:
+                parent[path[-1]] = value
+        return root
+
+    def to_binary(self, overrides=None, compact=False):
+        """
+        a variant carries the whole base body, the base objects it replaces
+        included, so it is larger than a full encoding by at most the base size
+
+        :param compact: encode the variant from scratch without unreferenced
+            objects, slower but as small as `PlistInfo.to_binary`
+        :type  compact: bool
+        :rtype: bytes
+        """
+        tree = self.apply(overrides or {})
+        if compact:
+            return self._to_binary_full(tree)
+        if self._binary is None:
+            self._prepare_binary()
+        base = self._binary
+        fd = io.BytesIO()
+        fd.write(base["body"])
+        writer = BinaryPlistWriter(fd)
+        writer._position = len(base["body"])
+        writer._index_base = base["obj_count"]
+        writer._base_scalars = base["scalars"]
+        writer._containers = base["containers"]
+        writer.ref_size = base["ref_size"]
+        new_count = writer.count_objects(tree)
+        writer._scalars = {}
+        obj_count = base["obj_count"] + new_count
+        if _get_int_size(obj_count) > base["ref_size"]:
+            return self._to_binary_full(tree)
+        top = writer.write_objects(tree)
+        if _get_int_size(writer._position) > base["offset_size"]:
+            return self._to_binary_full(tree)
+        writer.write_table(top, base["offset_size"], base["table"])
+        return fd.getvalue()
+
+    def _to_binary_full(self, tree):
+        fd = io.BytesIO()
+        write_binary(tree, fd)
+        return fd.getvalue()
+
+    def to_xml(self, overrides=None, encoding="UTF-8", pretty=True):
+        """
+        :rtype: bytes
+        """
+        tree = self.apply(overrides or {})
+        if pretty not in self._xml:
+            self._prepare_xml(pretty)
+        prefix, suffix, fragments, indents = self._xml[pretty]
+        p = PlistInfo({})
+        dom = None
+        parts = [prefix % encoding]
+        for key, value in tree.items():
+            if key in self._base and value is self._base[key]:
+                parts.append(fragments[key])
+            else:
+                if dom is None:
+                    dom = p._new_xml_document()[0]
+                parts.append(self._render_xml_item(p, dom, key, value, *indents))
+        parts.append(suffix)
+        return _encode_xml(parts, encoding)
+
+    def render(self, overrides=None, fmt="binary"):
+        if fmt == "binary":
+            return self.to_binary(overrides)
+        elif fmt == "xml":
+            return self.to_xml(overrides)
+        raise ValueError("fmt=%s should be binary or xml" % fmt)
+
+    def render_many(self, overrides_iter, fmt="binary", workers=None, chunk_size=16):
+        """render a variant for every overrides dict, in order
+
+        :param workers: process count, renders in this process when None or 1
+        :type  workers: int
+        :rtype: iterator
+        """
+        global _template
+        if workers is None or workers < 2:
+            for overrides in overrides_iter:
+                yield self.render(overrides, fmt)
+            return
+        if fmt == "binary" and self._binary is None:
+            self._prepare_binary()
+        elif fmt == "xml" and True not in self._xml:
+            self._prepare_xml(True)
+        from gplist.parallel import _get_context
+        _template = self
+        try:
+            pool = _get_context().Pool(workers, _init_worker, (self, ))
+            try:
+                for buf in pool.imap(_render, ((overrides, fmt) for overrides in overrides_iter),
+                                     chunk_size):
+                    yield buf
+            finally:
+                pool.terminate()
+                pool.join()
+        finally:
+            _template = None
+
+
+def _init_worker(template):
+    global _template
+    if _template is None:
+        _template = template
+
+
+def _render(args):
+    return _template.render(*args)
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""streaming binary plist writer
+"""
+
+from array import array
+import datetime
+import hashlib
+import itertools
+import struct
+import sys
+
+from gplist.plist import Data, UID, PY2, INT_TYPECODE, bytes_type, string_type, is_packed_array
+
+
+OFFSET_TYPECODE = "L" if PY2 else "Q"
+UINT_FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+APPLE_EPOCH = datetime.datetime(2001, 1, 1)
+TRAILER_FORMAT = ">6xBBQQQ"
+HASH_BUFFER_SIZE = 64 << 10
+CONTAINER_TYPES = (dict, list, tuple)
+
+
+def _get_int_size(value):
+    for size in (1, 2, 4, 8):
+        if value < 1 << (size * 8):
+            return size
+    raise ValueError("int=%s out of range %s" % (value, 1 << 64))
+
+
+def _to_bytes(values, typecode):
+    """big-endian bytes of `values` stored as `typecode` items
+    """
+    if isinstance(values, array) and values.typecode == typecode:
+        items = array(typecode, values.tostring() if PY2 else values.tobytes())
+    else:
+        items = array(typecode, values)
+    if sys.byteorder == "little":
+        items.byteswap()
+    return items.tostring() if PY2 else items.tobytes()
+
+
+def pack_uints(values, size):
+    """pack unsigned ints into big-endian items of `size` bytes without boxing
+    every item when `values` is already an array
+    """
+    if len(values) < 256:
+        return struct.pack(">%d%s" % (len(values), UINT_FORMATS[size]), *values)
+    raw = _to_bytes(values, OFFSET_TYPECODE)
+    item_size = array(OFFSET_TYPECODE).itemsize
+    if size == item_size:
+        return raw
+    buf = bytearray(len(raw) // item_size * size)
+    for i in range(size):
+        buf[i::size] = raw[item_size - size + i::item_size]
+    return bytes(buf)
+
+
+def _scalar_key(value):
+    return type(value), value
+
+
+class BinaryPlistWriter(object):
+    """write a binary plist object by object to a file
+
+    objects are emitted children first while walking the tree with an explicit
+    stack, so each container is written as soon as the indices of its items are
+    known. Only object offsets, the index of every distinct scalar and the item
+    indices of the containers being walked are kept in memory, the output
+    itself never is. The file only needs to support `write`, it is never seeked
+
+    canonical output only depends on the content: dict keys are sorted, equal
+    scalars and equal containers are written once, packed arrays are written
+    as plain arrays and every number has one representation, so equal plists
+    give equal bytes whatever their key order or object sharing. Equal objects
+    are found by the sha1 digest of their encoding, so 20 bytes are kept per
+    distinct object rather than the object
+
+    tuples are written as arrays, numpy scalars as their python value and
+    timezone aware datetimes in UTC. Dict keys must be strings
+
+    :param canonical: write canonical output
+    :type  canonical: bool
+    """
+
+    def __init__(self, fd, canonical=False):
+        self._fd = fd
+        self._position = 0
+        self._offsets = array(OFFSET_TYPECODE)
+        self._scalars = {}
+        self.ref_size = 1
+        self.obj_count = 0
+        # continuing after objects already written, see `gplist.template`
+        self._index_base = 0
+        self._base_scalars = {}
+        self._containers = {}
+        self.record_containers = False
+        self.canonical = canonical
+        self._canonical_containers = {}
+        numpy = sys.modules.get("numpy")
+        self._numpy_scalar = numpy.generic if numpy else None
+        if canonical:
+            self._packed_types = ()
+        else:
+            self._packed_types = (array, numpy.ndarray) if numpy else (array,)
+
+    def _write(self, buf):
+        self._fd.write(buf)
+        self._position += len(buf)
+
+    def _new_index(self):
+        self._offsets.append(self._position)
+        return self._index_base + len(self._offsets) - 1
+
+    def _get_scalar(self, key):
+        index = self._scalars.get(key)
+        if index is None:
+            index = self._base_scalars.get(key)
+        return index
+
+    def _header(self, token_h, length):
+        if length < 0xf:
+            return struct.pack(">B", token_h | length)
+        size = _get_int_size(length)
+        return struct.pack(">BB", token_h | 0xf, 0x10 | (size.bit_length() - 1)) + \
+            struct.pack(">" + UINT_FORMATS[size], length)
+
+    def _iter_items(self, value):
+        if isinstance(value, dict):
+            for key in value:
+                if not isinstance(key, string_type):
+                    raise ValueError("dict key=%r should be a string" % (key,))
+            if self.canonical:
+                keys = sorted(value.keys())
+                return itertools.chain(keys, [value[key] for key in keys])
+            return itertools.chain(value.keys(), value.values())
+        return iter(value)
+
+    def _scalar_entry(self, value):
+        """returns (key, encoding or None), canonical keys are digests of the
+        encoding so that no distinct scalar is kept, e.g. data blobs
+        """
+        if self.canonical:
+            buf = self._encode_scalar(value)
+            return hashlib.sha1(buf).digest(), buf
+        try:
+            hash(value)
+        except TypeError:
+            # e.g. sets, which aren't plist types
+            raise ValueError("unexpected value=%s" % (value,))
+        return _scalar_key(value), None
+
+    def _unpack(self, value):
+        if self.canonical and is_packed_array(value):
+            return value.tolist()
+        if self._numpy_scalar is not None and isinstance(value, self._numpy_scalar):
+            return value.item()
+        return value
+
+    def count_objects(self, root):
+        """count the objects `root` will be written as, distinct scalars are
+        written once
+        """
+        count = 0
+        stack = [(None, iter([root]))]
+        walking = set()
+        while stack:
+            try:
+                value = next(stack[-1][1])
+            except StopIteration:
+                walking.discard(stack.pop()[0])
+                continue
+            value = self._unpack(value)
+            if isinstance(value, CONTAINER_TYPES):
+                if id(value) in self._containers:
+                    continue
+                if id(value) in walking:
+                    raise ValueError("cyclic reference is unsupported")
+                count += 1
+                walking.add(id(value))
+                stack.append((id(value), self._iter_items(value)))
+            elif isinstance(value, self._packed_types):
+                count += 1 + len(value)
+            else:
+                key = self._scalar_entry(value)[0]
+                if key not in self._scalars and key not in self._base_scalars:
+                    self._scalars[key] = None
+                    count += 1
+        return count
+
+    def write(self, root):
+        """write `root` as a complete binary plist
+        """
+        self.obj_count = self.count_objects(root)
+        self.ref_size = _get_int_size(self.obj_count)
+        self._write(b"bplist00")
+        top = self.write_objects(root)
+        # canonical output shares equal containers, so it may write fewer
+        if len(self._offsets) != self.obj_count and not self.canonical:
+            raise RuntimeError("written objects=%s != counted objects=%s" %
+                               (len(self._offsets), self.obj_count))
+        self.write_table(top)
+
+    def write_objects(self, root):
+        """write the objects of `root` not written yet, returns its index
+        """
+        roots = array(OFFSET_TYPECODE)
+        stack = [(None, iter([root]), roots)]
+        while stack:
+            value, items, indices = stack[-1]
+            try:
+                item = next(items)
+            except StopIteration:
+                stack.pop()
+                if stack:
+                    index = self._write_container(value, indices)
+                    if self.record_containers:
+                        self._containers[id(value)] = index
+                    stack[-1][2].append(index)
+                continue
+            item = self._unpack(item)
+            if isinstance(item, CONTAINER_TYPES):
+                index = self._containers.get(id(item))
+                if index is None:
+                    stack.append((item, self._iter_items(item), array(OFFSET_TYPECODE)))
+                else:
+                    indices.append(index)
+            elif isinstance(item, self._packed_types):
+                indices.append(self._write_packed(item))
+            else:
+                key, buf = self._scalar_entry(item)
+                index = self._get_scalar(key)
+                if index is None:
+                    index = self._write_scalar(item, buf)
+                    self._scalars[key] = index
+                indices.append(index)
+        return roots[0]
+
+    def write_table(self, top, offset_size=None, base_table=b""):
+        """write the offset table and the trailer
+
+        :param offset_size: offset table unit size, defaults to the smallest fitting one
+        :param base_table: already packed offsets of the objects before `_index_base`
+        """
+        table_offset = self._position
+        if offset_size is None:
+            offset_size = _get_int_size(max(table_offset, 1))
+        self._write(base_table)
+        self._write(pack_uints(self._offsets, offset_size))
+        self._write(struct.pack(TRAILER_FORMAT, offset_size, self.ref_size,
+                                self._index_base + len(self._offsets), top, table_offset))
+
+    def _write_container(self, value, indices):
+        if isinstance(value, dict):
+            header = self._header(0xd0, len(value))
+        else:
+            header = self._header(0xa0, len(value))
+        buf = header + pack_uints(indices, self.ref_size)
+        if self.canonical:
+            digest = hashlib.sha1(buf).digest()
+            index = self._canonical_containers.get(digest)
+            if index is not None:
+                return index
+        index = self._new_index()
+        if self.canonical:
+            self._canonical_containers[digest] = index
+        self._write(buf)
+        return index
+
+    def _write_scalar(self, value, buf=None):
+        index = self._new_index()
+        self._write(buf or self._encode_scalar(value))
+        return index
+
+    def _encode_scalar(self, value):
+        if value is None:
+            buf = b"\x00"
+        elif value is False:
+            buf = b"\x08"
+        elif value is True:
+            buf = b"\x09"
+        elif isinstance(value, UID):
+            size = _get_int_size(value)
+            buf = struct.pack(">B", 0x80 | (size - 1)) + \
+                struct.pack(">" + UINT_FORMATS[size], value)
+        elif isinstance(value, Data):
+            raw = value.raw
+            buf = self._header(0x40, len(raw)) + raw
+        elif isinstance(value, bytes_type) and not isinstance(value, string_type):
+            buf = self._header(0x40, len(value)) + value
+        elif isinstance(value, string_type):
+            try:
+                encoded = value.encode("ascii")
+                buf = self._header(0x50, len(encoded)) + encoded
+            except UnicodeError:
+                encoded = value.encode("utf-16be")
+                buf = self._header(0x60, len(encoded) // 2) + encoded
+        elif isinstance(value, int) or (PY2 and isinstance(value, long)):  # noqa
+            if 0 <= value < 1 << 32:
+                size = _get_int_size(value)
+                buf = struct.pack(">B", 0x10 | (size.bit_length() - 1)) + \
+                    struct.pack(">" + UINT_FORMATS[size], value)
+            elif -(1 << 63) <= value < 1 << 63:
+                buf = struct.pack(">Bq", 0x13, value)
+            elif value < 1 << 64:
+                buf = struct.pack(">BQQ", 0x14, 0, value)
+            else:
+                raise ValueError("int=%s out of range %s" % (value, 1 << 64))
+        elif isinstance(value, float):
+            buf = struct.pack(">Bd", 0x23, value)
+        elif isinstance(value, datetime.datetime):
+            offset = value.utcoffset()
+            if offset is not None:
+                value = value.replace(tzinfo=None) - offset
+            delta = value - APPLE_EPOCH
+            seconds = delta.days * 86400.0 + delta.seconds + delta.microseconds / 1e6
+            buf = struct.pack(">Bd", 0x33, seconds)
+        else:
+            raise ValueError("unexpected value=%s" % value)
+        return buf
+
+    def _write_packed(self, values):
+        """write every item of a packed array as an 8 bytes int or double,
+        moving bytes with slice assignments instead of boxing the items
+        """
+        count = len(values)
+        if hasattr(values, "dtype"):
+            is_real = values.dtype.kind == "f"
+            raw = values.astype(">f8" if is_real else ">i8").tobytes()
+        else:
+            is_real = values.typecode in "fd"
+            raw = _to_bytes(values, "d" if is_real else INT_TYPECODE)
+        buf = bytearray(count * 9)
+        buf[0::9] = (b"\x23" if is_real else b"\x13") * count
+        for i in range(8):
+            buf[i + 1::9] = raw[i::8]
+        start = self._position
+        first_index = self._index_base + len(self._offsets)
+        self._offsets.extend(range(start, start + count * 9, 9))
+        self._write(bytes(buf))
+        return self._write_container(values, range(first_index, first_index + count))
+
+
+def write_binary(value, fd, canonical=False):
+    """write `value` as a binary plist to the file object `fd`
+    """
+    BinaryPlistWriter(fd, canonical=canonical).write(value)
+
+
+class _HashWriter(object):
+    """file object feeding what is written to a hash in batches
+    """
+
+    def __init__(self, hasher):
+        self._hasher = hasher
+        self._chunks = []
+        self._size = 0
+
+    def write(self, buf):
+        self._chunks.append(buf)
+        self._size += len(buf)
+        if self._size >= HASH_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        self._hasher.update(b"".join(self._chunks))
+        self._chunks = []
+        self._size = 0
+
+
+def fingerprint(value, algorithm="sha256"):
+    """hex digest of the canonical binary plist of `value`, hashed while it is
+    written without keeping the output
+    """
+    writer = _HashWriter(hashlib.new(algorithm))
+    write_binary(value, writer, canonical=True)
+    writer.flush()
+    return writer._hasher.hexdigest()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""keyed archiver test
+"""
+
+import datetime
+import unittest
+
+from gplist.archiver import (ArchivedObject, KeyedUnarchiver, archive, unarchive,
+                             register_class)
+from gplist.plist import PlistInfo, UID
+
+
+class ArchiverTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        shared = {"name": "shared", "when": datetime.datetime(2020, 1, 2, 3, 4, 5)}
+        root = {"a": [1, 2.5, True, "text", None], "b": shared, "c": [shared, shared],
+                "d": b"\x00\x01\x02"}
+        plist = archive(root)
+        self.assertEqual(plist["$archiver"], "NSKeyedArchiver")
+        # equal scalars and class descriptions are archived once
+        self.assertEqual(plist["$objects"].count("shared"), 1)
+        self.assertEqual(len([o for o in plist["$objects"]
+                              if isinstance(o, dict) and o.get("$classname") == "NSArray"]), 1)
+
+        for buf in [plist.to_binary(), plist.to_xml()]:
+            for lazy in [True, False]:
+                result = unarchive(buf, lazy=lazy)
+                self.assertEqual(result["a"], root["a"])
+                self.assertEqual(result["b"], shared)
+                self.assertIs(result["c"][0], result["c"][1])
+                self.assertIs(result["c"][0], result["b"])
+                self.assertEqual(result["d"].raw, b"\x00\x01\x02")
+
+    def test_cyclic(self):
+        root = ["head"]
+        root.append(root)
+        result = unarchive(archive(root).to_binary())
+        self.assertEqual(result[0], "head")
+        self.assertIs(result[1], result)
+
+    def test_custom_class(self):
+        plist = PlistInfo({
+            "$version": 100000,
+            "$archiver": "NSKeyedArchiver",
+            "$top": {"root": UID(1)},
+            "$objects": ["$null",
+                         {"$class": UID(3), "x": 1, "y": UID(2)},
+                         "label",
+                         {"$classname": "CGPoint", "$classes": ["CGPoint", "NSObject"]}]})
+        buf = plist.to_binary()
+        result = unarchive(buf)
+        self.assertIsInstance(result, ArchivedObject)
+        self.assertEqual(result.classname, "CGPoint")
+        self.assertEqual(dict(result), {"x": 1, "y": "label"})
+        self.assertEqual(unarchive(archive(result).to_binary()), result)
+
+        decoders = {"CGPoint": lambda u, archived: (archived["x"], u.decode(archived["y"]))}
+        self.assertEqual(unarchive(buf, decoders=decoders), (1, "label"))
+        register_class("CGPoint", decoders["CGPoint"])
+        self.addCleanup(register_class, "CGPoint", None)
+        self.assertEqual(KeyedUnarchiver.from_binary(buf).top, {"root": (1, "label")})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""daemon test
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from gplist.daemon import DaemonError, DaemonUnavailable, FileCache, recv_frame, request
+from gplist.plist import PlistInfo
+
+
+py_exe = "python%s.%s" % (sys.version_info[0], sys.version_info[1])
+cur_dir = os.path.dirname(os.path.abspath(__file__))
+env = dict(os.environ, PYTHONPATH=os.path.dirname(cur_dir))
+
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, self.dir_path)
+        self.socket_path = os.path.join(self.dir_path, "gplist.sock")
+
+    def start_daemon(self):
+        proc = subprocess.Popen([py_exe, "-m", "gplist", "serve", "--socket", self.socket_path],
+                                env=env)
+
+        def stop():
+            proc.terminate()
+            proc.wait()
+        self.addCleanup(stop)
+        for _ in range(100):
+            if os.path.exists(self.socket_path):
+                return
+            time.sleep(0.05)
+        self.fail("daemon didn't listen on %s" % self.socket_path)
+
+    def run_cli(self, *args):
+        proc = subprocess.Popen([py_exe, "-m", "gplist", "--socket", self.socket_path] + list(args),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cur_dir, env=env)
+        stdout, stderr = proc.communicate()
+        return proc.returncode, stdout.decode("utf-8")
+
+    def test_fallback(self):
+        self.assertRaises(DaemonUnavailable, request, self.socket_path, ["Info.plist"])
+        code, stdout = self.run_cli("Info.plist")
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(stdout), PlistInfo.from_file(os.path.join(cur_dir, "Info.plist")))
+
+    def test_failed_request(self):
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(self.socket_path)
+        server.listen(4)
+        answers = ["hang", "close", "close"]
+
+        def serve():
+            for answer in answers:
+                conn = server.accept()[0]
+                recv_frame(conn)
+                if answer == "hang":
+                    time.sleep(1)
+                conn.close()
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+
+        with self.assertRaises(DaemonError) as context:
+            request(self.socket_path, ["Info.plist"], timeout=0.2)
+        self.assertNotIsInstance(context.exception, DaemonUnavailable)
+        with self.assertRaises(DaemonError) as context:
+            request(self.socket_path, ["Info.plist"])
+        self.assertNotIsInstance(context.exception, DaemonUnavailable)
+        # the request was sent, so the command isn't run again in process
+        xml_file = os.path.join(self.dir_path, "Info.xml")
+        code, stdout = self.run_cli("Info.plist", "--convert", "xml", "--output", xml_file)
+        self.assertNotEqual(code, 0)
+        self.assertFalse(os.path.exists(xml_file))
+        thread.join()
+
+    def test_daemon(self):
+        self.start_daemon()
+        plist_file = os.path.join(cur_dir, "Info.plist")
+        code, stdout, _ = request(self.socket_path, ["Info.plist"], cwd=cur_dir)
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(stdout), PlistInfo.from_file(plist_file))
+
+        code, stdout = self.run_cli("Info.plist", "--query", "CFBundleIdentifier")
+        self.assertEqual((code, json.loads(stdout)), (0, "com.guying.app.foo"))
+        code, stdout = self.run_cli("Info.plist", "--query", "Missing")
+        self.assertEqual((code, stdout), (1, ""))
+        code, stdout = self.run_cli("Info.plist", "--cert")
+        self.assertEqual(code, 1)
+        code, _ = self.run_cli("--bogus")
+        self.assertEqual(code, 2)
+
+        results = []
+
+        def query():
+            results.append(request(self.socket_path, ["Info.xml", "--query", "CFBundleName"],
+                                   cwd=cur_dir))
+        threads = [threading.Thread(target=query) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [(0, '"FooApp"', "")] * 8)
+
+        xml_file = os.path.join(self.dir_path, "Info.xml")
+        code, _, _ = request(self.socket_path, [plist_file, "--convert", "xml", "--output", xml_file])
+        self.assertEqual(code, 0)
+        self.assertEqual(PlistInfo.from_file(xml_file), PlistInfo.from_file(plist_file))
+
+        provision_file = os.path.join(self.dir_path, "a.mobileprovision")
+        with open(provision_file, "wb") as fd:
+            # xml plist wrapped like in a signed profile
+            fd.write(b"0\x80" + PlistInfo({"ProvisionedDevices": ["U1"]}).to_xml() + b"\x00\x00")
+        code, stdout, _ = request(self.socket_path, ["--has-udid", "U1", provision_file])
+        self.assertEqual((code, stdout), (0, "yes\n"))
+        code, stdout, _ = request(self.socket_path, ["--has-udid", "U1", "--has-udid", "U2",
+                                                     self.dir_path])
+        self.assertEqual(code, 0)
+        self.assertEqual([json.loads(line)["profiles"] for line in stdout.splitlines()],
+                         [[provision_file], []])
+
+    def test_file_cache(self):
+        plist_file = os.path.join(self.dir_path, "a.plist")
+        loaded = []
+
+        def loader(path):
+            loaded.append(path)
+            return PlistInfo.from_file(path)
+        cache = FileCache(loader, size=1)
+        PlistInfo({"a": 1}).to_binary_file(plist_file)
+        self.assertEqual(cache.load(plist_file), {"a": 1})
+        self.assertEqual(cache.load(plist_file), {"a": 1})
+        self.assertEqual(len(loaded), 1)
+        PlistInfo({"a": 22}).to_binary_file(plist_file)
+        self.assertEqual(cache.load(plist_file), {"a": 22})
+        self.assertEqual(len(loaded), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""data blob export test
+"""
+
+from collections import OrderedDict
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from gplist.extract import extract_data
+from gplist.plist import InvalidPlistError, PlistInfo, PlistLimits, PlistLimitError, Data
+
+
+cur_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class ExtractDataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, self.dir_path)
+        self.blobs = [os.urandom(200000), os.urandom(70000), b"", b"icon"]
+        self.plist = PlistInfo(OrderedDict([
+            ("DeveloperCertificates", [Data.from_raw(blob) for blob in self.blobs[:3]]),
+            ("Name", "foo"),
+            ("Icons", {"icon/../1x": Data.from_raw(self.blobs[3])}),
+        ]))
+
+    def check_results(self, results, blobs):
+        self.assertEqual([size for _, _, size in results], [len(blob) for blob in blobs])
+        for (_, file_path, _), blob in zip(results, blobs):
+            with open(file_path, "rb") as fd:
+                self.assertEqual(fd.read(), blob)
+
+    def test_extract(self):
+        sources = [self.plist.to_binary(), self.plist.to_xml()]
+        for name in ("Info.plist", "Info.xml", "Info.plist.gz"):
+            file_path = os.path.join(self.dir_path, name)
+            if name == "Info.plist":
+                self.plist.to_binary_file(file_path)
+            else:
+                self.plist.to_xml_file(file_path)
+            sources.append(file_path)
+        for i, source in enumerate(sources):
+            out_dir = os.path.join(self.dir_path, "out%s" % i)
+            results = extract_data(source, out_dir)
+            self.assertEqual([path for path, _, _ in results], [
+                ("DeveloperCertificates", 0), ("DeveloperCertificates", 1),
+                ("DeveloperCertificates", 2), ("Icons", "icon/../1x")])
+            self.assertEqual([os.path.basename(file_path) for _, file_path, _ in results], [
+                "DeveloperCertificates.0", "DeveloperCertificates.1",
+                "DeveloperCertificates.2", "Icons.icon_.._1x"])
+            self.check_results(results, self.blobs)
+
+            results = extract_data(source, out_dir, ["DeveloperCertificates/1", ("Icons", "*")])
+            self.check_results(results, self.blobs[1:2] + self.blobs[3:])
+
+        limits = PlistLimits(max_data_size=100000)
+        self.assertRaises(PlistLimitError, extract_data, sources[0], self.dir_path, limits=limits)
+        self.assertRaises(PlistLimitError, extract_data, sources[1], self.dir_path, limits=limits)
+
+    def test_partial(self):
+        # parse errors inside and at the end of a blob leave no partial file
+        xml = self.plist.to_xml()
+        sources = [xml[:xml.index(b"</data>") - 1000], xml.replace(b"</data>", b"A</data>", 1)]
+        for i, source in enumerate(sources):
+            out_dir = os.path.join(self.dir_path, "out%s" % i)
+            self.assertRaises(InvalidPlistError, extract_data, source, out_dir)
+            self.assertEqual(os.listdir(out_dir), [])
+
+        limits = PlistLimits(max_data_size=100000)
+        out_dir = os.path.join(self.dir_path, "limited")
+        self.assertRaises(PlistLimitError, extract_data, xml, out_dir, limits=limits)
+        self.assertEqual(os.listdir(out_dir), [])
+
+    def test_command(self):
+        provision_file = os.path.join(self.dir_path, "a.mobileprovision")
+        with open(provision_file, "wb") as fd:
+            fd.write(b"0\x80" + self.plist.to_xml() + b"\x00\x00")
+        out_dir = os.path.join(self.dir_path, "out")
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(cur_dir))
+        output = subprocess.check_output(
+            [sys.executable, "-m", "gplist", "extract-data", provision_file, "--out", out_dir,
+             "--path", "DeveloperCertificates/*"], env=env)
+        lines = [json.loads(line) for line in output.decode("utf-8").splitlines()]
+        self.assertEqual([line["path"] for line in lines],
+                         [["DeveloperCertificates", i] for i in range(3)])
+        self.check_results([(None, line["file"], line["size"]) for line in lines], self.blobs[:3])
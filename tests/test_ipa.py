@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""ipa patching test
+"""
+
+import binascii
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from gplist import ipa
+from gplist.ipa import patch_ipa, IPAPatchError
+from gplist.plist import PlistInfo
+
+
+cur_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class PatchIPATest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, self.dir_path)
+        self.ipa_file = os.path.join(self.dir_path, "FooApp.ipa")
+        shutil.copyfile(os.path.join(cur_dir, "FooApp.ipa"), self.ipa_file)
+        with zipfile.ZipFile(self.ipa_file) as zip_file:
+            self.members = dict([(name, zip_file.read(name)) for name in zip_file.namelist()])
+
+    def check_members(self, ipa_file, changed):
+        with zipfile.ZipFile(ipa_file) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            names = zip_file.namelist()
+            self.assertEqual(len(names), len(set(names)))
+            for name in names:
+                if name not in changed:
+                    self.assertEqual(zip_file.read(name), self.members[name])
+            for name, content in changed.items():
+                self.assertEqual(zip_file.read(name), content)
+
+    def test_patch(self):
+        p = PlistInfo.from_app(self.ipa_file)
+        p["CFBundleIdentifier"] = "com.guying.app.bar"
+        del p["UISupportedInterfaceOrientations"]
+        results = patch_ipa(self.ipa_file, {
+            "Info.plist": p,
+            "embedded.mobileprovision": b"signed provision",
+        })
+        self.assertEqual(results, [("FooApp.app/Info.plist", True),
+                                   ("FooApp.app/embedded.mobileprovision", False)])
+        self.check_members(self.ipa_file, {
+            "FooApp.app/Info.plist": p.to_binary(),
+            "FooApp.app/embedded.mobileprovision": b"signed provision",
+        })
+        self.assertEqual(PlistInfo.from_app(self.ipa_file)["CFBundleIdentifier"],
+                         "com.guying.app.bar")
+
+        # larger members are appended, the source is kept when writing to output
+        p["Padding"] = binascii.hexlify(os.urandom(4096)).decode("ascii")
+        self.members["FooApp.app/embedded.mobileprovision"] = b"signed provision"
+        output = os.path.join(self.dir_path, "Bar.ipa")
+        results = patch_ipa(self.ipa_file, {"FooApp.app/Info.plist": p}, output=output)
+        self.assertEqual(results, [("FooApp.app/Info.plist", False)])
+        self.check_members(output, {"FooApp.app/Info.plist": p.to_binary()})
+        self.assertNotIn("Padding", PlistInfo.from_app(self.ipa_file))
+
+    def test_cp437_names(self):
+        # names without the utf-8 flag are cp437, as written by Info-ZIP or ditto
+        ipa_file = os.path.join(self.dir_path, "Cafe.ipa")
+        with zipfile.ZipFile(ipa_file, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("Payload/", b"")
+            zip_file.writestr("Payload/CafX.app/", b"")
+            zip_file.writestr("Payload/CafX.app/Info.plist", PlistInfo({"a": 1}).to_binary())
+        with open(ipa_file, "rb") as fd:
+            content = fd.read()
+        with open(ipa_file, "wb") as fd:
+            fd.write(content.replace(b"CafX", b"Caf\x82"))
+
+        results = patch_ipa(ipa_file, {"Info.plist": PlistInfo({"a": 2})})
+        self.assertEqual(results, [(u"Payload/Caf\xe9.app/Info.plist", True)])
+        with zipfile.ZipFile(ipa_file) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(zip_file.namelist(), [u"Payload/", u"Payload/Caf\xe9.app/",
+                                                   u"Payload/Caf\xe9.app/Info.plist"])
+        self.assertEqual(PlistInfo.from_app(ipa_file), {"a": 2})
+
+    def test_old_directory_kept(self):
+        with open(self.ipa_file, "rb") as fd:
+            content = fd.read()
+        # appended entries go after the old end record, nothing before it changes
+        patch_ipa(self.ipa_file, {"embedded.mobileprovision": b"signed provision"})
+        with open(self.ipa_file, "rb") as fd:
+            self.assertEqual(fd.read(len(content)), content)
+        self.check_members(self.ipa_file, {"FooApp.app/embedded.mobileprovision": b"signed provision"})
+
+        # limits are checked before the first write
+        with open(self.ipa_file, "rb") as fd:
+            content = fd.read()
+        p = PlistInfo.from_app(self.ipa_file)
+        p["CFBundleIdentifier"] = "com.guying.app.bar"
+        self.addCleanup(setattr, ipa, "ZIP64_LIMIT", ipa.ZIP64_LIMIT)
+        ipa.ZIP64_LIMIT = len(content) + 100
+        self.assertRaises(IPAPatchError, patch_ipa, self.ipa_file, {
+            "Info.plist": p, "embedded.mobileprovision": os.urandom(1000)})
+        with open(self.ipa_file, "rb") as fd:
+            self.assertEqual(fd.read(), content)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, patch_ipa, self.ipa_file,
+                          {"embedded.mobileprovision": PlistInfo({"Name": "a"})})
+        self.check_members(self.ipa_file, {})
+        with open(self.ipa_file, "r+b") as fd:
+            fd.truncate(os.path.getsize(self.ipa_file) - 10)
+        self.assertRaises(IPAPatchError, patch_ipa, self.ipa_file, {"Info.plist": b""})
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""event streaming test
+"""
+
+import gzip
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from gplist.iterparse import iterparse, items, build, ANY
+from gplist.plist import PlistInfo, PlistLimits, InvalidPlistError
+
+
+cur_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class IterparseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, self.dir_path)
+
+    def test_events(self):
+        p = PlistInfo({"a": [1, {"b": "c"}], "d": True})
+        expected = [
+            ((), "start_dict", None),
+            ((), "key", "a"),
+            (("a",), "start_array", None),
+            (("a", 0), "value", 1),
+            (("a", 1), "start_dict", None),
+            (("a", 1), "key", "b"),
+            (("a", 1, "b"), "value", "c"),
+            (("a", 1), "end_dict", None),
+            (("a",), "end_array", None),
+            ((), "key", "d"),
+            (("d",), "value", True),
+            ((), "end_dict", None),
+        ]
+        self.assertEqual(list(iterparse(p.to_binary())), expected)
+        self.assertEqual(list(iterparse(p.to_xml())), expected)
+
+    def test_files(self):
+        for name in ("Info.plist", "Info.xml", "large.plist"):
+            file_path = os.path.join(cur_dir, name)
+            p = PlistInfo.from_file(file_path)
+            events = iterparse(file_path)
+            self.assertEqual(build(events, next(events)), p)
+            with open(file_path, "rb") as fd:
+                events = iterparse(fd)
+                self.assertEqual(build(events, next(events)), p)
+
+        file_path = os.path.join(self.dir_path, "Info.plist.gz")
+        with open(os.path.join(cur_dir, "Info.xml"), "rb") as src, gzip.open(file_path, "wb") as fd:
+            fd.write(src.read())
+        events = iterparse(file_path, formats=("xml",))
+        self.assertEqual(build(events, next(events)), PlistInfo.from_file(file_path))
+        self.assertRaises(ValueError, list, iterparse(file_path, formats=("binary",)))
+
+    def test_items(self):
+        p = PlistInfo({"objects": [{"type": "X", "id": i} for i in range(3000)]})
+        for data in (p.to_binary(), p.to_xml()):
+            matches = [(path, value["id"]) for path, value in items(data, ("objects", ANY))
+                       if value["type"] == "X"]
+            self.assertEqual(matches, [(("objects", i), i) for i in range(3000)])
+            self.assertEqual(list(items(data, ("objects", 7, "id"))), [(("objects", 7, "id"), 7)])
+
+    def test_invalid(self):
+        cyclic = b"bplist00\xa1\x00\x08" + struct.pack(">6xBBQQQ", 1, 1, 1, 0, 10)
+        self.assertRaises(InvalidPlistError, list, iterparse(cyclic))
+        deep = PlistInfo({"a": [[[[1]]]]})
+        limits = PlistLimits(max_depth=3)
+        for data in (deep.to_binary(), deep.to_xml()):
+            self.assertRaises(InvalidPlistError, list, iterparse(data, limits=limits))
+        self.assertRaises(InvalidPlistError, list, iterparse(b"<plist><dict><key>a</key>"))
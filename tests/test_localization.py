@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""localization test
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from gplist.localization import load_localizations, parse_strings_text
+from gplist.plist import PlistInfo
+
+
+class LocalizationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, self.dir_path)
+        self.app_path = os.path.join(self.dir_path, "FooApp.app")
+        self.locales = ["l%02d" % i for i in range(70)]
+        for i, locale in enumerate(self.locales):
+            lproj = os.path.join(self.app_path, locale + ".lproj")
+            os.makedirs(lproj)
+            strings = PlistInfo({"title": "title %s" % locale, "ok": "ok %s" % locale})
+            if i % 7 == 0:
+                del strings["ok"]
+            if i % 2:
+                strings.to_binary_file(os.path.join(lproj, "Localizable.strings"))
+            else:
+                strings.to_xml_file(os.path.join(lproj, "Localizable.strings"))
+            PlistInfo({"apples": {"NSStringLocalizedFormatKey": "%#@n@"}}).to_binary_file(
+                os.path.join(lproj, "Localizable.stringsdict"))
+        with open(os.path.join(self.app_path, "l00.lproj", "InfoPlist.strings"), "wb") as fd:
+            fd.write(u'/* name */\n"CFBundleDisplayName" = "Foo \\"App\\"";\n'.encode("utf-16"))
+        with open(os.path.join(self.app_path, "l01.lproj", "Broken.strings"), "wb") as fd:
+            fd.write(b'"a" = ')
+        framework = os.path.join(self.app_path, "Frameworks", "Bar.framework", "l00.lproj")
+        os.makedirs(framework)
+        PlistInfo({"bar": "bar"}).to_binary_file(os.path.join(framework, "Bar.strings"))
+
+    def check(self, localizations):
+        self.assertEqual(localizations.locales, self.locales)
+        self.assertEqual(localizations.tables,
+                         ["InfoPlist", "Localizable", "Localizable.stringsdict"])
+        self.assertEqual(sorted(localizations.keys()), ["ok", "title"])
+        self.assertEqual(localizations.get("l03", "ok"), "ok l03")
+        self.assertEqual(localizations.get("l07", "ok"), None)
+        self.assertEqual(localizations.table("l07"), {"title": "title l07"})
+        self.assertEqual(localizations.missing("l14"), ["ok"])
+        self.assertEqual(localizations.coverage()["l14"], 0.5)
+        self.assertEqual(localizations.get("l00", "CFBundleDisplayName", "InfoPlist"), 'Foo "App"')
+        self.assertEqual(localizations.get("l05", "apples", "Localizable.stringsdict"),
+                         {"NSStringLocalizedFormatKey": "%#@n@"})
+        self.assertEqual(len(localizations.failed), 1)
+        self.assertTrue(localizations.failed[0][0].endswith("Broken.strings"))
+
+    def test_app(self):
+        self.check(load_localizations(self.app_path, workers=1))
+        self.check(load_localizations(self.app_path, workers=2))
+
+    def test_ipa(self):
+        ipa_file = os.path.join(self.dir_path, "FooApp.ipa")
+        with zipfile.ZipFile(ipa_file, "w") as fd:
+            fd.write(self.app_path, "Payload/FooApp.app/")
+            for root, _, files in os.walk(self.app_path):
+                for name in files:
+                    file_path = os.path.join(root, name)
+                    fd.write(file_path, "Payload/" + os.path.relpath(file_path, self.dir_path))
+        self.check(load_localizations(ipa_file, workers=2))
+        with open(ipa_file, "rb") as fd:
+            self.check(load_localizations(fd, workers=1))
+
+    def test_strings_text(self):
+        content = u'// comment\nkey = "a\\nb";\n"\\U00e9t\\u00e9" = "\\"x\\"";\n"same";\n'
+        self.assertEqual(parse_strings_text(content.encode("utf-8")),
+                         {"key": "a\nb", u"été": '"x"', "same": "same"})
+        self.assertRaises(ValueError, parse_strings_text, b'"a" "b";')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""mach-o test
+"""
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+
+from gplist.macho import MachOError, MachOFile, _seekable, read_app_entitlements
+from gplist.plist import PlistInfo
+from gplist.rangeio import FileRangeReader
+
+
+def build_macho(entitlements, info_plist=None, cputype=0x0100000c, padding=0):
+    """64-bit little-endian executable with an optional __info_plist section
+    and a code signature holding a code directory stand-in and entitlements
+    """
+    info_plist = info_plist or b""
+    commands = []
+    header_size = 32
+    segment_size = 72 + 80
+    signature_command_size = 16
+    text_offset = header_size + segment_size + signature_command_size
+    body = info_plist + b"\x00" * padding
+
+    slots = [(0, b"\xfa\xde\x0c\x02" + struct.pack(">I", 8 + 64) + b"\x11" * 64)]
+    if entitlements is not None:
+        slots.append((5, struct.pack(">II", 0xfade7171, 8 + len(entitlements)) + entitlements))
+    blobs = b""
+    index = b""
+    blob_offset = 12 + 8 * len(slots)
+    for slot, blob in slots:
+        index += struct.pack(">II", slot, blob_offset + len(blobs))
+        blobs += blob
+    signature = struct.pack(">III", 0xfade0cc0, blob_offset + len(blobs), len(slots)) + index + blobs
+    signature_offset = text_offset + len(body)
+
+    section = b"__info_plist".ljust(16, b"\x00") + b"__TEXT".ljust(16, b"\x00") + \
+        struct.pack("<QQIIIIIIII", 0, len(info_plist), text_offset, 0, 0, 0, 0, 0, 0, 0)
+    commands.append(struct.pack("<II", 0x19, segment_size) + b"__TEXT".ljust(16, b"\x00") +
+                    struct.pack("<QQQQiiII", 0, 0, 0, 0, 5, 5, 1 if info_plist else 0, 0) + section)
+    commands.append(struct.pack("<IIII", 0x1d, 16, signature_offset, len(signature)))
+    commands = b"".join(commands)
+    header = struct.pack("<IiiIIIII", 0xfeedfacf, cputype, 0, 2, 2, len(commands), 0, 0)
+    return header + commands + body + signature
+
+
+def build_fat(slices):
+    offset = 4096
+    header = struct.pack(">II", 0xcafebabe, len(slices))
+    body = b""
+    for cputype, content in slices:
+        header += struct.pack(">iiIII", cputype, 0, offset + len(body), len(content), 12)
+        body += content
+    return header.ljust(offset, b"\x00") + body
+
+
+class MachOTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, self.dir_path)
+        self.entitlements = PlistInfo({"application-identifier": "TEAM.com.guying.app.foo",
+                                       "get-task-allow": True})
+
+    def write(self, name, content):
+        file_path = os.path.join(self.dir_path, name)
+        with open(file_path, "wb") as fd:
+            fd.write(content)
+        return file_path
+
+    def test_thin(self):
+        info = PlistInfo({"CFBundleIdentifier": "com.guying.tool"})
+        file_path = self.write("tool", build_macho(self.entitlements.to_xml(), info.to_xml()))
+        with MachOFile.from_file(file_path) as macho:
+            self.assertEqual([s.arch for s in macho.slices], ["arm64"])
+            self.assertEqual(macho.entitlements(), self.entitlements)
+            self.assertEqual(macho.info_plist(), info)
+
+        file_path = self.write("unsigned", build_macho(None))
+        with MachOFile.from_file(file_path) as macho:
+            self.assertEqual(macho.entitlements(), None)
+            self.assertEqual(macho.info_plist(), None)
+
+        file_path = self.write("bad", b"\x00" * 64)
+        self.assertRaises(MachOError, MachOFile.from_file, file_path)
+
+        # code signature command too short for its offset and size
+        executable = build_macho(self.entitlements.to_xml())
+        command = struct.pack("<II", 0x1d, 16)
+        self.assertEqual(executable.count(command), 1)
+        file_path = self.write("short", executable.replace(command, struct.pack("<II", 0x1d, 8)))
+        self.assertRaises(MachOError, MachOFile.from_file, file_path)
+
+    def test_fat(self):
+        other = PlistInfo({"application-identifier": "TEAM.other"})
+        file_path = self.write("fat", build_fat([
+            (0x01000007, build_macho(other.to_xml(), cputype=0x01000007)),
+            (0x0100000c, build_macho(self.entitlements.to_xml()))]))
+        with MachOFile.from_file(file_path) as macho:
+            self.assertEqual([s.arch for s in macho.slices], ["x86_64", "arm64"])
+            self.assertEqual(macho.entitlements(), other)
+            self.assertEqual(macho.entitlements("arm64"), self.entitlements)
+            self.assertRaises(ValueError, macho.entitlements, "i386")
+
+    def test_app(self):
+        executable = build_macho(self.entitlements.to_xml(), padding=4 << 20)
+        app_path = os.path.join(self.dir_path, "FooApp.app")
+        os.mkdir(app_path)
+        PlistInfo({"CFBundleExecutable": "FooApp"}).to_binary_file(os.path.join(app_path, "Info.plist"))
+        self.write("FooApp.app/FooApp", executable)
+        self.assertEqual(read_app_entitlements(app_path), self.entitlements)
+
+        for compression in [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]:
+            ipa_file = os.path.join(self.dir_path, "FooApp.ipa")
+            with zipfile.ZipFile(ipa_file, "w", compression) as fd:
+                fd.write(app_path, "Payload/FooApp.app/")
+                fd.write(os.path.join(app_path, "Info.plist"), "Payload/FooApp.app/Info.plist")
+                fd.write(os.path.join(app_path, "FooApp"), "Payload/FooApp.app/FooApp")
+            self.assertEqual(read_app_entitlements(ipa_file), self.entitlements)
+            reader = FileRangeReader(ipa_file, block_size=4096)
+            self.assertEqual(read_app_entitlements(reader), self.entitlements)
+            if compression == zipfile.ZIP_STORED:
+                self.assertLess(reader.bytes_fetched, 64 << 10)
+
+        # members which can't seek, like deflated ones on python 2, are copied
+        class ForwardReader(object):
+            def __init__(self, content):
+                self._fd = io.BytesIO(content)
+                self.read = self._fd.read
+                self.close = self._fd.close
+
+        self.assertEqual(MachOFile(_seekable(ForwardReader(executable))).entitlements(),
+                         self.entitlements)
+
+
+if __name__ == "__main__":
+    unittest.main()
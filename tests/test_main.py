@@ -4,10 +4,12 @@
 
 import json
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 
-from gplist.__main__ import PlistEncoder
+from gplist.plist import PlistEncoder
 from gplist.mobileprovision import MobileProvision
 from gplist.plist import PlistInfo
 
@@ -65,6 +67,26 @@ class MainTest(unittest.TestCase):
                 content = fd.read()
             self.assertEqual(content, "no\n")
 
+    def test_udid_batch(self):
+        dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, dir_path)
+        PlistInfo({"ProvisionedDevices": ["U1", "U2"]}).to_xml_file(
+            os.path.join(dir_path, "a.mobileprovision"))
+        PlistInfo({"ProvisionedDevices": ["U2"]}).to_xml_file(
+            os.path.join(dir_path, "b.mobileprovision"))
+        udid_file = os.path.join(dir_path, "udids.txt")
+        with open(udid_file, "w") as fd:
+            fd.write("U2\n# comment\nU3\n")
+        index_file = os.path.join(dir_path, "index.json")
+
+        cmdline = "%s -m gplist --has-udid U1 --udid-file %s --index %s %s" % (
+            py_exe, udid_file, index_file, dir_path)
+        with os.popen(cmdline) as fd:
+            lines = [json.loads(line) for line in fd.read().splitlines()]
+        self.assertEqual([line["udid"] for line in lines], ["U1", "U2", "U3"])
+        self.assertEqual([len(line["profiles"]) for line in lines], [1, 2, 0])
+        self.assertTrue(os.path.isfile(index_file))
+
 
 if __name__ == "__main__":
     unittest.main()
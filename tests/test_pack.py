@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""plist pack test
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gplist.pack import PlistPack, PackBuilder, PackError, build_pack
+from gplist.plist import PlistInfo
+
+
+cur_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class PlistPackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, self.dir_path)
+        self.pack_file = os.path.join(self.dir_path, "apps.pack")
+
+    def test_build(self):
+        apps_dir = os.path.join(self.dir_path, "apps")
+        for i in range(100):
+            app_dir = os.path.join(apps_dir, "App%s.app" % i)
+            os.makedirs(os.path.join(app_dir, "fr.lproj"))
+            PlistInfo({"CFBundleIdentifier": "com.foo.%s" % (i % 10)}).to_binary_file(
+                os.path.join(app_dir, "Info.plist"))
+            with open(os.path.join(app_dir, "fr.lproj", "Localizable.strings"), "wb") as fd:
+                fd.write(b'"OK" = "D\'accord";')
+        with open(os.path.join(apps_dir, "broken.plist"), "wb") as fd:
+            fd.write(b"broken")
+
+        for workers in (1, 2):
+            failed = build_pack(self.pack_file, [apps_dir, os.path.join(cur_dir, "FooApp.ipa")],
+                                workers=workers)
+            self.assertEqual([key for key, _ in failed], ["apps/broken.plist"])
+            with PlistPack(self.pack_file) as pack:
+                self.assertEqual(len(pack), 201)
+                self.assertEqual(pack["apps/App42.app/Info.plist"], {"CFBundleIdentifier": "com.foo.2"})
+                self.assertEqual(pack["apps/App7.app/fr.lproj/Localizable.strings"], {"OK": "D'accord"})
+                self.assertEqual(pack["FooApp.ipa/FooApp.app/Info.plist"],
+                                 PlistInfo.from_app(os.path.join(cur_dir, "FooApp.ipa")))
+                self.assertNotIn("apps/App100.app/Info.plist", pack)
+                self.assertRaises(KeyError, pack.__getitem__, "apps")
+                self.assertEqual(list(pack.keys("apps/App1")), sorted(
+                    ["apps/App1%s.app/%s" % (suffix, name) for suffix in [""] + list(range(10))
+                     for name in ("Info.plist", "fr.lproj/Localizable.strings")]))
+                view = pack.raw("apps/App1.app/Info.plist")
+                self.assertEqual(bytes(view[:8]), b"bplist00")
+                view.release()
+                self.assertEqual(pack.get("FooApp.ipa/FooApp.app/Info.plist", keys=["CFBundleName"]),
+                                 {"CFBundleName": "FooApp"})
+            # identical payloads are stored once
+            self.assertLess(os.path.getsize(self.pack_file), 20000)
+
+    def test_append(self):
+        with PackBuilder(self.pack_file) as builder:
+            builder.add("a", {"a": 1})
+            builder.add("b", PlistInfo({"b": 1}).to_xml())
+        with PackBuilder(self.pack_file, append=True) as builder:
+            builder.add("b", {"b": 2})
+            builder.add("c", {"a": 1})
+        with PlistPack(self.pack_file) as pack:
+            self.assertEqual(list(pack.keys()), ["a", "b", "c"])
+            self.assertEqual(pack["b"], {"b": 2})
+            self.assertEqual(pack["c"], {"a": 1})
+            self.assertEqual(pack.get("d", "missing"), "missing")
+
+        # a failed append leaves the pack as it was
+        size = os.path.getsize(self.pack_file)
+        with self.assertRaises(ValueError):
+            with PackBuilder(self.pack_file, append=True) as builder:
+                builder.add("d", {"d": 1})
+                builder.add("e", b"not a plist")
+        self.assertEqual(os.path.getsize(self.pack_file), size)
+        with PlistPack(self.pack_file) as pack:
+            self.assertEqual(list(pack.keys()), ["a", "b", "c"])
+            self.assertEqual(pack["a"], {"a": 1})
+
+        with open(self.pack_file, "r+b") as fd:
+            fd.truncate(os.path.getsize(self.pack_file) - 1)
+        self.assertRaises(PackError, PlistPack, self.pack_file)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""parallel decoding test
+"""
+
+import os
+import unittest
+
+from gplist.parallel import from_file_parallel
+from gplist.plist import PlistInfo
+
+
+cur_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class ParallelTest(unittest.TestCase):
+
+    def write_plist(self, data):
+        plist_file = "parallel.plist"
+        PlistInfo(data).to_binary_file(plist_file)
+        self.addCleanup(os.remove, plist_file)
+        return plist_file
+
+    def test_dict_values(self):
+        plist_file = os.path.join(cur_dir, "large.plist")
+        p = from_file_parallel(plist_file, workers=2, min_size=0)
+        self.assertEqual(p, PlistInfo.from_file(plist_file))
+        self.assertEqual(p.ref_size, 2)
+
+    def test_array_items(self):
+        data = {"name": "cache", "items": [{"id": i, "tags": ["a", str(i)]} for i in range(200)]}
+        plist_file = self.write_plist(data)
+        p = from_file_parallel(plist_file, workers=2, min_size=0)
+        self.assertEqual(p, data)
+        self.assertEqual(list(p.keys()), list(PlistInfo.from_file(plist_file).keys()))
+
+    def test_serial_fallback(self):
+        plist_file = os.path.join(cur_dir, "Info.xml")
+        p = from_file_parallel(plist_file, workers=2, min_size=0)
+        self.assertEqual(p, PlistInfo.from_file(plist_file))
+
+        plist_file = self.write_plist({"a": 1})
+        p = from_file_parallel(plist_file, workers=2)
+        self.assertEqual(p, {"a": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
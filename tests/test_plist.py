@@ -2,8 +2,17 @@
 """test plist info
 """
 
-from gplist.plist import PlistInfo
+from gplist.plist import PlistInfo, PlistLimits, InvalidPlistError, PlistLimitError, Data
+from collections import OrderedDict
+import array
+import copy
+import gzip
+import io
 import os
+import pickle
+import shutil
+import struct
+import tempfile
 import unittest
 
 import biplist
@@ -33,6 +42,88 @@ class PlistInfoTest(unittest.TestCase):
         self.assertEqual(new_p.ref_size, 1)
         self.assertEqual(new_p, p)
 
+    def test_compressed_file(self):
+        p = PlistInfo.from_file(os.path.join(cur_dir, "Info.plist"))
+        dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, dir_path)
+        for ext in [".gz", ".bz2", ".xz"]:
+            binary_file = os.path.join(dir_path, "Info.plist" + ext)
+            p.to_binary_file(binary_file, level=1)
+            new_p = PlistInfo.from_file(binary_file)
+            self.assertEqual(new_p.format, "binary")
+            self.assertEqual(new_p, p)
+
+            xml_file = os.path.join(dir_path, "Info.xml" + ext)
+            p.to_xml_file(xml_file)
+            new_p = PlistInfo.from_file(xml_file)
+            self.assertEqual(new_p.format, "xml")
+            self.assertEqual(new_p, p)
+
+        # detected by magic bytes, not the extension
+        renamed_file = os.path.join(dir_path, "renamed.plist")
+        os.rename(xml_file, renamed_file)
+        self.assertEqual(PlistInfo.from_file(renamed_file), p)
+        plain_file = os.path.join(dir_path, "plain.xml")
+        p.to_xml_file(plain_file, pretty=False)
+        with open(plain_file, "rb") as fd:
+            self.assertEqual(fd.read(), p.to_xml(pretty=False))
+
+        limits = PlistLimits(max_bytes=100)
+        self.assertRaises(PlistLimitError, PlistInfo.from_file, binary_file, limits=limits)
+        self.assertRaises(PlistLimitError, PlistInfo.from_file, renamed_file, limits=limits)
+
+        # inflation stops at the limit instead of after the whole stream
+        bomb_file = os.path.join(dir_path, "bomb.plist.gz")
+        with gzip.open(bomb_file, "wb") as fd:
+            fd.write(b"bplist00")
+            for _ in range(64):
+                fd.write(b"\x00" * (1 << 20))
+
+        class CountingReader(object):
+            def __init__(self, fd):
+                self.fd = fd
+                self.size = 0
+
+            def read(self, size=-1):
+                buf = self.fd.read(size)
+                self.size += len(buf)
+                return buf
+
+        with gzip.open(bomb_file, "rb") as fd:
+            reader = CountingReader(fd)
+            self.assertRaises(PlistLimitError, PlistInfo, reader,
+                              limits=PlistLimits(max_bytes=1 << 20))
+            self.assertLessEqual(reader.size, (1 << 20) + (64 << 10))
+
+    def test_release_and_pickle(self):
+        with open(os.path.join(cur_dir, "large.plist"), "rb") as fd:
+            data = fd.read()
+        kept = PlistInfo(data, release=False)
+        self.assertTrue(len(kept._objs) > 1)
+        p = PlistInfo(data)
+        self.assertEqual(p, kept)
+        self.assertEqual(p._binary_data, None)
+        self.assertEqual(len(p._objs), 0)
+        self.assertFalse(hasattr(p, "obj_offsets"))
+        self.assertEqual((p.format, p.obj_count), ("binary", kept.obj_count))
+
+        buf = pickle.dumps(p, 2)
+        self.assertLess(len(buf), len(pickle.dumps(dict(p), 2)) * 2)
+        new_p = pickle.loads(buf)
+        self.assertEqual(type(new_p), PlistInfo)
+        self.assertEqual(list(new_p.items()), list(p.items()))
+        self.assertEqual(new_p.format, "binary")
+        self.assertEqual(copy.deepcopy(p), p)
+
+        xml_p = PlistInfo(PlistInfo({"a": [1.5], "b": Data.from_raw(b"\x00")}).to_xml())
+        new_p = pickle.loads(pickle.dumps(xml_p))
+        self.assertEqual(new_p, xml_p)
+        self.assertEqual(new_p.format, "xml")
+
+        packed = PlistInfo(PlistInfo({"a": list(range(20))}).to_binary(), packed_arrays="array")
+        new_p = pickle.loads(pickle.dumps(packed))
+        self.assertEqual(new_p["a"], array.array(packed["a"].typecode, range(20)))
+
     def test_large_binary_plist(self):
         plist_file = os.path.join(cur_dir, "large.plist")
         p = PlistInfo.from_file(plist_file)
@@ -42,6 +133,27 @@ class PlistInfoTest(unittest.TestCase):
         self.assertEqual(p2.ref_size, 2)
         self.assertEqual(dict(p), dict(p2))
 
+    def test_keys(self):
+        keys = ["CFBundleIdentifier", "UISupportedInterfaceOrientations", "missing"]
+        full = PlistInfo.from_file(os.path.join(cur_dir, "Info.xml"))
+        expected = dict([(key, full[key]) for key in keys[:2]])
+        for name in ("Info.plist", "Info.xml"):
+            p = PlistInfo.from_file(os.path.join(cur_dir, name), keys=keys)
+            self.assertEqual(p, expected)
+        for name in ("FooApp.app", "FooApp.ipa"):
+            p = PlistInfo.from_app(os.path.join(cur_dir, name), keys=keys)
+            self.assertEqual(p, expected)
+
+        # xml streams are read up to the last wanted key, other values are skipped
+        blob = Data.from_raw(os.urandom(1 << 20))
+        xml = PlistInfo(OrderedDict([("a", 1), ("b", [blob]), ("c", blob), ("d", 2)])).to_xml()
+        fd = io.BytesIO(xml)
+        self.assertEqual(PlistInfo(fd, keys=["a", "b"]), {"a": 1, "b": [blob]})
+        self.assertLess(fd.tell(), len(xml))
+        fd = io.BytesIO(xml)
+        self.assertEqual(PlistInfo(fd, keys=["a", "d"]), {"a": 1, "d": 2})
+        self.assertRaises(InvalidPlistError, PlistInfo, biplist.writePlistToString([1]), keys=["a"])
+
     def test_app(self):
         app_path = os.path.join(cur_dir, "FooApp.app")
         p = PlistInfo.from_app(app_path)
@@ -109,6 +221,86 @@ class PlistInfoTest(unittest.TestCase):
         p3 = biplist.readPlistFromString(p.to_binary())
         self.assertEqual(p, p3)
 
+    def test_limits(self):
+        plist_file = os.path.join(cur_dir, "large.plist")
+        self.assertRaises(PlistLimitError, PlistInfo.from_file, plist_file,
+                          limits=PlistLimits(max_bytes=1024))
+        self.assertRaises(PlistLimitError, PlistInfo.from_file, plist_file,
+                          limits=PlistLimits(max_objects=10))
+        self.assertRaises(PlistLimitError, PlistInfo.from_file, plist_file,
+                          limits=PlistLimits(max_depth=1))
+        self.assertRaises(PlistLimitError, PlistInfo.from_file, plist_file,
+                          limits=PlistLimits(max_string_size=4))
+        xml_file = os.path.join(cur_dir, "Info.xml")
+        self.assertRaises(PlistLimitError, PlistInfo.from_file, xml_file,
+                          limits=PlistLimits(max_container_length=2))
+        p = PlistInfo.from_file(plist_file, limits=PlistLimits(max_depth=8))
+        self.assertEqual(p, PlistInfo.from_file(plist_file))
+
+    def test_malformed_binary(self):
+        # array at offset 8 referencing itself
+        cyclic = b"bplist00\xa1\x00\x08" + struct.pack(">6xBBQQQ", 1, 1, 1, 0, 10)
+        self.assertRaises(InvalidPlistError, PlistInfo, cyclic)
+
+        huge_count = b"bplist00\x08\x08" + struct.pack(">6xBBQQQ", 1, 1, 1 << 40, 0, 9)
+        self.assertRaises(InvalidPlistError, PlistInfo, huge_count)
+
+        bad_ref = b"bplist00\xa1\x05\x08" + struct.pack(">6xBBQQQ", 1, 1, 1, 0, 10)
+        self.assertRaises(InvalidPlistError, PlistInfo, bad_ref)
+
+        long_string = b"bplist00\x5f\x10\xff\x08" + struct.pack(">6xBBQQQ", 1, 1, 1, 0, 11)
+        self.assertRaises(InvalidPlistError, PlistInfo, long_string)
+
+        # dict at offset 8 whose key is an empty array at offset 11
+        array_key = b"bplist00\xd1\x01\x01\xa0\x08\x0b" + struct.pack(">6xBBQQQ", 1, 1, 2, 0, 12)
+        self.assertRaises(InvalidPlistError, PlistInfo, array_key)
+        self.assertRaises(InvalidPlistError, PlistInfo, array_key, keys=["a"])
+
+        huge_date = b"bplist00\xd1\x01\x02\x51a\x33" + struct.pack(">d", 1e300) + \
+            b"\x08\x0b\x0d" + struct.pack(">6xBBQQQ", 1, 1, 3, 0, 22)
+        self.assertRaises(InvalidPlistError, PlistInfo, huge_date)
+
+        # uids are 1, 2, 4 or 8 bytes long, 0x8f would be 16
+        long_uid = b"bplist00\xd1\x01\x02\x51a\x8f" + b"\x00" * 16 + \
+            b"\x08\x0b\x0d" + struct.pack(">6xBBQQQ", 1, 1, 3, 0, 30)
+        self.assertRaises(InvalidPlistError, PlistInfo, long_uid)
+
+        for top in (b"\x09", b"\x10\x05"):
+            not_dict = b"bplist00" + top + b"\x08" + \
+                struct.pack(">6xBBQQQ", 1, 1, 1, 0, 8 + len(top))
+            self.assertRaises(InvalidPlistError, PlistInfo, not_dict)
+
+    def test_packed_arrays(self):
+        data = {"ints": list(range(-10, 100)) + [1 << 40],
+                "reals": [i * 0.5 for i in range(100)],
+                "mixed": [1, "a"] * 10,
+                "short": [1, 2]}
+        buf = PlistInfo(data).to_binary()
+        for raw in [buf, PlistInfo(buf).to_xml()]:
+            p = PlistInfo(raw, packed_arrays="array")
+            self.assertIsInstance(p["ints"], array.array)
+            self.assertIsInstance(p["reals"], array.array)
+            self.assertIsInstance(p["mixed"], list)
+            self.assertIsInstance(p["short"], list)
+            self.assertEqual(list(p["ints"]), data["ints"])
+            self.assertEqual(list(p["reals"]), data["reals"])
+            self.assertEqual(PlistInfo(p.to_binary()), data)
+            self.assertEqual(PlistInfo(p.to_xml()), data)
+            self.assertEqual(PlistInfo(p.to_xml(pretty=False)), data)
+
+    def test_packed_arrays_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest("numpy not installed")
+        data = {"ints": list(range(-10, 100)), "reals": [i * 0.5 for i in range(100)]}
+        p = PlistInfo(PlistInfo(data).to_binary(), packed_arrays=True)
+        self.assertIsInstance(p["ints"], numpy.ndarray)
+        self.assertEqual(p["ints"].tolist(), data["ints"])
+        self.assertEqual(p["reals"].tolist(), data["reals"])
+        self.assertEqual(PlistInfo(p.to_xml()), data)
+        self.assertEqual(PlistInfo(p.to_binary()), data)
+
 
 if __name__ == "__main__":
     unittest.main(defaultTest="PlistInfoTest.test_with_biplist")
@@ -3,9 +3,13 @@
 """
 
 import os
+import pickle
+import shutil
+import tempfile
 import unittest
 
-from gplist.mobileprovision import MobileProvision
+from gplist.mobileprovision import MobileProvision, ProvisionIndex
+from gplist.plist import PlistInfo
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -43,6 +47,82 @@ class MobileProvisionTest(unittest.TestCase):
         new_m = MobileProvision(xml_data)
         self.assertEqual(dict(new_m), dict(m))
 
+    def test_index(self):
+        dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, dir_path)
+        profiles = {
+            "a.mobileprovision": {"Name": "a", "ProvisionedDevices": ["U1", "U2"]},
+            "b.mobileprovision": {"Name": "b", "ProvisionedDevices": ["U2"]},
+            "c.mobileprovision": {"Name": "c", "ProvisionsAllDevices": True},
+        }
+        for name, data in profiles.items():
+            PlistInfo(data).to_xml_file(os.path.join(dir_path, name))
+        paths = dict([(name, os.path.join(dir_path, name)) for name in profiles])
+
+        m = MobileProvision.from_file(paths["a.mobileprovision"])
+        self.assertEqual(m.udids, frozenset(["U1", "U2"]))
+        self.assertTrue(m.has_udid("U1"))
+        m["ProvisionedDevices"].append("U3")
+        self.assertTrue(m.has_udid("U3"))
+        m["ProvisionedDevices"][0] = "U4"
+        self.assertTrue(m.has_udid("U4"))
+        self.assertFalse(m.has_udid("U1"))
+        # the set is kept between checks and dropped by in place edits
+        self.assertIs(m.udids, m.udids)
+        m["ProvisionedDevices"][1:2] = ["U5"]
+        del m["ProvisionedDevices"][0]
+        m["ProvisionedDevices"] += ["U6"]
+        self.assertEqual(m.udids, frozenset(["U5", "U3", "U6"]))
+        self.assertFalse(m.has_udid("U4"))
+        devices = ["U7"]
+        m["ProvisionedDevices"] = devices
+        devices[0] = "U8"
+        self.assertTrue(m.has_udid("U8"))
+
+        index = ProvisionIndex()
+        self.assertEqual(index.update([dir_path]), [])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.lookup("U1"), [paths["a.mobileprovision"], paths["c.mobileprovision"]])
+        self.assertEqual(index.lookup("U2"), sorted(paths.values()))
+        self.assertEqual(index.lookup("U9"), [paths["c.mobileprovision"]])
+
+        index_file = os.path.join(dir_path, "index.json")
+        index.save(index_file)
+        PlistInfo({"ProvisionedDevices": ["U1"]}).to_xml_file(paths["b.mobileprovision"])
+        os.remove(paths["c.mobileprovision"])
+        index = ProvisionIndex.load(index_file)
+        index.update([dir_path])
+        self.assertEqual(index.lookup("U1"), [paths["a.mobileprovision"], paths["b.mobileprovision"]])
+        self.assertEqual(index.lookup("U2"), [paths["a.mobileprovision"]])
+
+    def test_compressed(self):
+        dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, dir_path)
+        provision_file = os.path.join(dir_path, "d.mobileprovision.gz")
+        PlistInfo({"Name": "d", "ProvisionedDevices": ["U4"]}).to_xml_file(provision_file)
+        m = MobileProvision.from_file(provision_file)
+        self.assertTrue(m.has_udid("U4"))
+        new_m = pickle.loads(pickle.dumps(m))
+        self.assertEqual(type(new_m), MobileProvision)
+        self.assertTrue(new_m.has_udid("U4"))
+        self.assertEqual(MobileProvision.from_file(provision_file, keys=["Name"]), {"Name": "d"})
+
+        index = ProvisionIndex()
+        index.update([dir_path])
+        self.assertEqual(index.lookup("U4"), [provision_file])
+
+        # one bad profile doesn't stop the update
+        for name, content in [("e.mobileprovision.gz", b"\x1f\x8b\x08\x00garbage"),
+                              ("f.mobileprovision.xz", b"\xfd7zXZ\x00garbage")]:
+            with open(os.path.join(dir_path, name), "wb") as fd:
+                fd.write(content)
+        missing_file = os.path.join(dir_path, "g.mobileprovision")
+        failed = index.update([dir_path, missing_file])
+        self.assertEqual(sorted(failed), [os.path.join(dir_path, name) for name in
+                                          ("e.mobileprovision.gz", "f.mobileprovision.xz",
+                                           "g.mobileprovision")])
+        self.assertEqual(index.lookup("U4"), [provision_file])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""range reader test
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from gplist.plist import PlistInfo, get_ipa_app
+from gplist.rangeio import FileRangeReader
+
+
+cur_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class RangeReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp(prefix="gplist_")
+        self.addCleanup(shutil.rmtree, self.dir_path)
+
+    def test_read(self):
+        file_path = os.path.join(self.dir_path, "data")
+        content = os.urandom(100000)
+        with open(file_path, "wb") as fd:
+            fd.write(content)
+        reader = FileRangeReader(file_path, block_size=1024, max_blocks=8)
+        self.addCleanup(reader.close)
+        reader.seek(-100, os.SEEK_END)
+        self.assertEqual(reader.read(), content[-100:])
+        self.assertEqual(reader.read(), b"")
+        reader.seek(5000)
+        self.assertEqual(reader.read(3000), content[5000:8000])
+        self.assertEqual(reader.fetch_count, 2)
+        # cached blocks in the middle split the missing ones into two ranges
+        reader.seek(4000)
+        self.assertEqual(reader.read(6000), content[4000:10000])
+        self.assertEqual(reader.fetch_count, 4)
+        reader.seek(0)
+        self.assertEqual(reader.read(), content)
+        self.assertEqual(reader.tell(), len(content))
+
+    def test_ipa(self):
+        ipa_file = os.path.join(self.dir_path, "Big.ipa")
+        p = PlistInfo.from_app(os.path.join(cur_dir, "FooApp.app"))
+        with zipfile.ZipFile(ipa_file, "w") as fd:
+            fd.writestr("Payload/", b"")
+            fd.writestr("Payload/FooApp.app/", b"")
+            fd.writestr("Payload/FooApp.app/FooApp", os.urandom(4 << 20))
+            fd.writestr("Payload/FooApp.app/Info.plist", p.to_binary())
+            for i in range(100):
+                fd.writestr("Payload/FooApp.app/assets/%d.png" % i, os.urandom(20000))
+
+        reader = FileRangeReader(ipa_file, block_size=4096)
+        self.addCleanup(reader.close)
+        self.assertEqual(get_ipa_app(reader), "Payload/FooApp.app/")
+        self.assertEqual(PlistInfo.from_app(reader), p)
+        self.assertLess(reader.bytes_fetched, 64 << 10)
+        self.assertLessEqual(reader.fetch_count, 4)
+
+        with open(ipa_file, "rb") as fd:
+            self.assertEqual(PlistInfo.from_app(fd), p)
+
+
+if __name__ == "__main__":
+    unittest.main()
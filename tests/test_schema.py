@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""schema decoding test
+"""
+
+import os
+import unittest
+
+from gplist.plist import PlistInfo
+from gplist.schema import Field, INFO_PLIST, Schema, SchemaError
+
+
+cur_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class SchemaTest(unittest.TestCase):
+
+    def test_info_plist(self):
+        for name in ["Info.plist", "Info.xml"]:
+            plist_file = os.path.join(cur_dir, name)
+            info = INFO_PLIST.from_file(plist_file)
+            self.assertEqual(info.CFBundleIdentifier, "com.guying.app.foo")
+            self.assertEqual(info.UIDeviceFamily, [1, 2])
+            self.assertIsNone(info.CFBundleDisplayName)
+            self.assertFalse(hasattr(info, "__dict__"))
+            self.assertIsNone(info.extra)
+
+    def test_nested_and_unknown(self):
+        ats = Schema("ATS", {"NSAllowsArbitraryLoads": bool})
+        schema = Schema("App", [
+            Field("CFBundleIdentifier", str, name="bundle_id"),
+            Field("NSAppTransportSecurity", ats, name="ats"),
+            Field("UISupportedInterfaceOrientations~ipad", [str], name="ipad_orientations"),
+        ], unknown="keep")
+        plist_file = os.path.join(cur_dir, "Info.plist")
+        p = PlistInfo.from_file(plist_file)
+        with open(plist_file, "rb") as fd:
+            record = schema.loads(fd.read())
+        self.assertEqual(record, schema.from_dict(p))
+        self.assertEqual(record.bundle_id, "com.guying.app.foo")
+        self.assertIs(record.ats.NSAllowsArbitraryLoads, True)
+        self.assertEqual(record.ipad_orientations, p["UISupportedInterfaceOrientations~ipad"])
+        self.assertEqual(record.extra["CFBundleName"], "FooApp")
+        self.assertEqual(record.to_dict(), p)
+
+    def test_attribute_names(self):
+        schema = Schema("Keys", {"UISupportedInterfaceOrientations~ipad": [str],
+                                 "NSLocation-Usage": str, "1x": int, "class": str, "extra": int},
+                        unknown="keep")
+        record = schema.from_dict({"UISupportedInterfaceOrientations~ipad": ["a"],
+                                   "NSLocation-Usage": "b", "1x": 1, "class": "c", "extra": 2,
+                                   "other": 3})
+        self.assertEqual(record.UISupportedInterfaceOrientations_ipad, ["a"])
+        self.assertEqual((record.NSLocation_Usage, record._1x, record.class_, record.extra_),
+                         ("b", 1, "c", 2))
+        self.assertEqual(record.extra, {"other": 3})
+        self.assertEqual(schema.loads(PlistInfo(record.to_dict()).to_binary()), record)
+        self.assertRaises(ValueError, Schema, "Bad", [Field("a-b"), Field("a_b")])
+        self.assertRaises(ValueError, Schema, "Bad", [Field("a", name="to_dict")])
+
+    def test_type_mismatch(self):
+        schema = Schema("Bad", {"CFBundleIdentifier": int})
+        plist_file = os.path.join(cur_dir, "Info.plist")
+        self.assertRaises(SchemaError, schema.from_file, plist_file)
+        self.assertRaises(SchemaError, Schema("Bad", {"UIDeviceFamily": [str]}).from_file, plist_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
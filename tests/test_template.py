@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""plist template test
+"""
+
+import os
+import pickle
+import unittest
+
+import biplist
+
+from gplist.plist import PlistInfo
+from gplist.template import PlistTemplate, REMOVE
+
+
+cur_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class PlistTemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = PlistInfo.from_file(os.path.join(cur_dir, "Info.plist"))
+        self.base["CFBundleURLTypes"] = [{"CFBundleURLSchemes": ["foo"], "CFBundleURLName": "foo"}]
+        self.template = PlistTemplate(self.base)
+
+    def expected(self, overrides):
+        p = PlistInfo(self.base.to_binary())
+        for path, value in overrides.items():
+            if isinstance(path, str):
+                path = (path,)
+            if value is REMOVE:
+                p.remove_property(*path)
+            elif path[-1] in p._get_prop_parent(path)[0]:
+                p.update_property(value, *path)
+            else:
+                p.add_property(value, *path)
+        return p
+
+    def test_unchanged(self):
+        self.assertEqual(PlistInfo(self.template.to_binary()), self.base)
+        self.assertEqual(self.template.to_xml(), self.base.to_xml())
+        self.assertEqual(self.template.to_xml(pretty=False), self.base.to_xml(pretty=False))
+
+    def test_variants(self):
+        variants = [
+            {"CFBundleIdentifier": "com.customer.a", "CFBundleDisplayName": u"客户A"},
+            {("CFBundleURLTypes", 0, "CFBundleURLSchemes"): ["customer-b"],
+             "UIDeviceFamily": [1]},
+            {"CFBundleName": REMOVE, "Extra": {"nested": [1, 2.5, True]}},
+        ]
+        for overrides in variants:
+            expected = self.expected(overrides)
+            buf = self.template.to_binary(overrides)
+            self.assertEqual(PlistInfo(buf), expected)
+            self.assertEqual(biplist.readPlistFromString(buf), expected)
+            self.assertEqual(PlistInfo(self.template.to_xml(overrides)), expected)
+        self.assertEqual(PlistInfo(self.template.to_binary()), self.base)
+        self.assertRaises(ValueError, self.template.to_binary, {("Missing", "key"): 1})
+
+    def test_encoding(self):
+        overrides = {"CFBundleDisplayName": u"caf\xe9 \u5ba2\u6237"}
+        expected = self.expected(overrides)
+        for encoding in ["ascii", "latin-1", "UTF-8"]:
+            xml = self.template.to_xml(overrides, encoding=encoding)
+            self.assertEqual(xml, expected.to_xml(encoding=encoding))
+            self.assertEqual(PlistInfo(xml), expected)
+
+    def test_size(self):
+        overrides = {"CFBundleURLTypes": [], "CFBundleIdentifier": "com.customer.a"}
+        full = self.expected(overrides).to_binary()
+        buf = self.template.to_binary(overrides)
+        # replaced base objects stay in the output as unreferenced bytes
+        self.assertGreater(len(buf), len(full))
+        self.assertLessEqual(len(buf), len(full) + len(self.base.to_binary()))
+        compact = self.template.to_binary(overrides, compact=True)
+        self.assertEqual(len(compact), len(full))
+        self.assertEqual(PlistInfo(compact), PlistInfo(buf))
+
+    def test_render_many(self):
+        variants = [{"CFBundleIdentifier": "com.customer.%d" % i} for i in range(20)]
+        for fmt in ["binary", "xml"]:
+            results = list(self.template.render_many(iter(variants), fmt=fmt, workers=2))
+            self.assertEqual(len(results), 20)
+            for overrides, buf in zip(variants, results):
+                self.assertEqual(PlistInfo(buf), self.expected(overrides))
+
+    def test_pickle(self):
+        self.template.to_binary()
+        template = pickle.loads(pickle.dumps(self.template))
+        overrides = {"CFBundleIdentifier": "com.pickled"}
+        self.assertEqual(PlistInfo(template.to_binary(overrides)), self.expected(overrides))
+
+
+if __name__ == "__main__":
+    unittest.main()
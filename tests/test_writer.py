@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""streaming binary writer test
+"""
+
+from collections import OrderedDict
+import array
+import datetime
+import io
+import os
+import unittest
+
+import biplist
+
+from gplist.plist import PlistInfo, Data, UID
+from gplist.writer import BinaryPlistWriter, write_binary
+
+
+cur_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class AppendOnlyFile(object):
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, buf):
+        self.chunks.append(buf)
+
+    def getvalue(self):
+        return b"".join(self.chunks)
+
+
+class BinaryWriterTest(unittest.TestCase):
+
+    def test_values(self):
+        data = {"int": 1, "neg": -5, "big": (1 << 64) - 1, "real": 1.1,
+                "text": u"héllo", "long": "x" * 100, "bool": [True, False, 1, 0],
+                "date": datetime.datetime(2020, 1, 2, 3, 4, 5),
+                "data": Data.from_raw(b"\x00\x01" * 20), "uid": UID(300),
+                "nested": {"a": [{}, []]}}
+        fd = AppendOnlyFile()
+        write_binary(data, fd)
+        p = PlistInfo(fd.getvalue())
+        self.assertEqual(p, data)
+        self.assertEqual(p["data"].raw, data["data"].raw)
+        self.assertEqual(p["bool"], [True, False, 1, 0])
+        self.assertIs(p["bool"][0], True)
+
+        p2 = biplist.readPlistFromString(fd.getvalue())
+        self.assertEqual(p2["text"], data["text"])
+        self.assertEqual(p2["date"], data["date"])
+
+    def test_value_types(self):
+        class UTC2(datetime.tzinfo):
+
+            def utcoffset(self, dt):
+                return datetime.timedelta(hours=2)
+
+            def dst(self, dt):
+                return None
+
+        data = {"tuple": (1, (2, "a")), "date": datetime.datetime(2020, 1, 2, 5, 4, 5, tzinfo=UTC2())}
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        else:
+            data["numpy"] = [numpy.int64(3), numpy.float32(1.5), numpy.bool_(True)]
+        fd = io.BytesIO()
+        write_binary(data, fd)
+        p = PlistInfo(fd.getvalue())
+        self.assertEqual(p["tuple"], [1, [2, "a"]])
+        self.assertEqual(p["date"], datetime.datetime(2020, 1, 2, 3, 4, 5))
+        if numpy is not None:
+            self.assertEqual(p["numpy"], [3, 1.5, True])
+            self.assertIs(p["numpy"][2], True)
+
+        self.assertRaises(ValueError, write_binary, {"a": {1: "b"}}, io.BytesIO())
+        self.assertRaises(ValueError, write_binary, {("a",): 1}, io.BytesIO())
+        self.assertRaises(ValueError, write_binary, {"a": set([1])}, io.BytesIO())
+
+    def test_large_plist(self):
+        plist_file = os.path.join(cur_dir, "large.plist")
+        p = PlistInfo.from_file(plist_file)
+        temp_file = "streamed.plist"
+        p.to_binary_file(temp_file)
+        self.addCleanup(os.remove, temp_file)
+        self.assertEqual(PlistInfo.from_file(temp_file), p)
+        self.assertEqual(biplist.readPlist(temp_file), p)
+
+    def test_packed_arrays(self):
+        data = {"ints": array.array("q", range(-10, 300)),
+                "reals": array.array("d", [i * 0.5 for i in range(300)])}
+        fd = io.BytesIO()
+        write_binary(data, fd)
+        p = PlistInfo(fd.getvalue())
+        self.assertEqual(p["ints"], list(range(-10, 300)))
+        self.assertEqual(p["reals"], [i * 0.5 for i in range(300)])
+        p = PlistInfo(fd.getvalue(), packed_arrays="array")
+        self.assertEqual(p["ints"], data["ints"])
+
+    def test_cyclic(self):
+        data = {"a": []}
+        data["a"].append(data)
+        self.assertRaises(ValueError, write_binary, data, io.BytesIO())
+
+    def test_canonical(self):
+        shared = {"name": "x", "size": 1}
+        a = PlistInfo(OrderedDict([
+            ("values", array.array("d", [0.5, 1.5])),
+            ("data", Data.from_raw(b"\x00\x01")),
+            ("items", [shared, shared]),
+        ]))
+        b = PlistInfo(OrderedDict([
+            ("items", [{"size": 1, "name": "x"}, {"name": "x", "size": 1}]),
+            ("data", b"\x00\x01"),
+            ("values", [0.5, 1.5]),
+        ]))
+        buf = a.to_binary(canonical=True)
+        self.assertEqual(buf, b.to_binary(canonical=True))
+        p = PlistInfo(buf)
+        self.assertEqual(list(p.keys()), ["data", "items", "values"])
+        self.assertEqual((p["data"], p["items"], p["values"]), (a["data"], b["items"], b["values"]))
+        self.assertEqual(biplist.readPlistFromString(buf)["items"], b["items"])
+        # equal dicts are written once
+        self.assertEqual(p.obj_count, 14)
+        self.assertEqual(a.to_xml(canonical=True), b.to_xml(canonical=True))
+
+        self.assertEqual(a.fingerprint(), b.fingerprint())
+        self.assertEqual(PlistInfo(a.to_xml()).fingerprint(), a.fingerprint())
+        b["items"][1]["size"] = 2
+        self.assertNotEqual(a.fingerprint(), b.fingerprint())
+
+        # only digests of the distinct objects are kept, not their encoding
+        writer = BinaryPlistWriter(io.BytesIO(), canonical=True)
+        writer.write({"blobs": [Data.from_raw(os.urandom(4096)) for _ in range(4)]})
+        self.assertEqual(set(len(key) for key in writer._scalars), set([20]))
+        self.assertEqual(set(len(key) for key in writer._canonical_containers), set([20]))
+
+
+if __name__ == "__main__":
+    unittest.main()